@@ -1,5 +1,13 @@
 import streamlit as st
 
+from mixlab.catalog import CATEGORIES, get_flavor_catalog
+from mixlab.db import run_query
+from mixlab.quickmix import suggest_recipe
+from mixlab.recipes import diff_matrix, recipe_labels
+from mixlab.jobs import latest_result
+from mixlab.steep import fetch_steep_page
+from mixlab.vapesim import load_vapesim_frame
+
 st.set_page_config(page_title="MixLab Dashboard", layout="wide", page_icon="🧪")
 
 st.title("🧪 MixLab Dashboard")
@@ -7,42 +15,80 @@ st.markdown("Welcome to your personal eLiquid lab — all your tools in one plac
 
 # Tabs for Tools
 tabs = st.tabs([
-    "📖 Recipes", "🧂 Flavor Stash", "⏳ Steep Timers", 
-    "🧠 VapeSim AI", "🔥 Synergy Heatmap", 
+    "📖 Recipes", "🧂 Flavor Stash", "⏳ Steep Timers",
+    "🧠 VapeSim AI", "🔥 Synergy Heatmap",
     "🧬 Recipe Diff Tool", "⚡ Quick Mix Assistant"
 ])
 
 with tabs[0]:
     st.subheader("📖 Recipes")
     st.info("View, edit, and analyze your saved recipes.")
-    st.button("Open Recipes")
+    recipes = run_query("SELECT id, name, steep_days, status FROM recipes ORDER BY created_at DESC LIMIT 10", fetch="all")
+    st.metric("Saved Recipes", run_query("SELECT COUNT(*) FROM recipes", fetch="one")[0])
+    if recipes:
+        st.dataframe([{'Name': name, 'Steep Days': days, 'Status': status} for _, name, days, status in recipes], hide_index=True)
 
 with tabs[1]:
     st.subheader("🧂 Flavor Stash")
     st.info("Manage your concentrate inventory.")
-    st.button("Edit Flavor Stash")
+    catalog = get_flavor_catalog()
+    st.metric("Flavors", len(catalog))
+    st.bar_chart({c: len(catalog.names_in(c)) for c in CATEGORIES})
 
 with tabs[2]:
     st.subheader("⏳ Steep Timers")
     st.info("Track steep times and readiness.")
-    st.button("Launch Steep Timers")
+    cols = st.columns(3)
+    for col, steep_filter in zip(cols, ["Steeping", "Ready soon", "Ready"]):
+        col.metric(steep_filter, fetch_steep_page(steep_filter, 0, 1)[1])
 
 with tabs[3]:
     st.subheader("🧠 VapeSim AI")
     st.info("Predictive flavor interaction and steep projections.")
-    st.button("Run VapeSim AI")
+    # Library-wide scoring only runs as a background job; show its latest result
+    latest = latest_result('vapesim_library')
+    if latest is None:
+        st.warning("Score your library from the VapeSim AI page of the main app to see the leaderboard here.")
+    else:
+        finished_at, result = latest
+        st.caption(f"Sweetest of {result['recipes']:,} recipes, scored {finished_at}.")
+        st.dataframe([{k: row[k] for k in ('recipe_name', 'sweetness', 'density', 'warning_count')} for row in result['rankings']['Sweetness'][:5]], hide_index=True)
 
 with tabs[4]:
     st.subheader("🔥 Synergy Heatmap")
     st.info("Visualize high-synergy flavor pairs.")
-    st.button("Show Heatmap")
+    latest = latest_result('synergy_pairs')
+    if latest is None:
+        st.warning("Rank your stash's pairings from the Synergy Matrix page of the main app to see them here.")
+    else:
+        finished_at, result = latest
+        st.caption(f"Ranked {finished_at}.")
+        for f1, f2, score in result['pairs'][:5]:
+            st.success(f"**{f1}** + **{f2}** ({score:.1f})")
 
 with tabs[5]:
     st.subheader("🧬 Recipe Diff Tool")
     st.info("Compare two recipes side-by-side.")
-    st.button("Compare Recipes")
+    names_by_id = dict(run_query("SELECT id, name FROM recipes ORDER BY name", fetch="all"))
+    if len(names_by_id) < 2:
+        st.warning("You need at least two saved recipes to use the comparison tool.")
+    else:
+        cols = st.columns(2)
+        a = cols[0].selectbox("Recipe A", list(names_by_id), format_func=names_by_id.get)
+        b = cols[1].selectbox("Recipe B", list(names_by_id), index=1, format_func=names_by_id.get)
+        if a != b:
+            matrix, _ = diff_matrix(load_vapesim_frame([a, b]), [a, b], a)
+            st.dataframe(matrix.rename(columns=recipe_labels([a, b], names_by_id)))
 
 with tabs[6]:
     st.subheader("⚡ Quick Mix Assistant")
     st.info("Rapid recipe generator using AI.")
-    st.button("Start Quick Mix")
+    profile = st.text_input("Flavor profile", placeholder="e.g., Creamy strawberry shortcake")
+    if st.button("Start Quick Mix") and profile:
+        flavors, steep_days = suggest_recipe(profile)
+        if not flavors:
+            st.error("Couldn't find matching flavors in your stash for that profile.")
+        for flav in flavors:
+            st.write(f"- **{flav['name']}**: {flav['pct']}%")
+        if steep_days:
+            st.info(f"**Suggested Steep Time:** {steep_days} days")
@@ -0,0 +1 @@
+"""Benchmarks for the mixlab core; see benchmarks.run, and benchmarks.loadtest for many sessions at once."""
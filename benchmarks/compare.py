@@ -0,0 +1,42 @@
+"""Compare two benchmarks.run result files scenario by scenario.
+
+    python -m benchmarks.compare baseline.json current.json [--threshold 1.25]
+
+Prints the median time of each (scenario, flavors, recipes) row in both runs and
+exits with status 1 if any row got slower than the threshold ratio.
+"""
+import argparse
+import json
+import sys
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return {(r['scenario'], r['flavors'], r['recipes']): r['median_s'] for r in report['results']}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    baseline, current = load(args.baseline), load(args.current)
+    regressions = 0
+    print(f"{'scenario':<28} {'flavors':>8} {'recipes':>8} {'before ms':>11} {'after ms':>11} {'ratio':>7}")
+    for key in sorted(baseline.keys() | current.keys()):
+        before, after = baseline.get(key), current.get(key)
+        if before is None or after is None:
+            ratio, flag = None, "  (only in one run)"
+        else:
+            ratio = after / before if before else float('inf')
+            flag = "  REGRESSION" if ratio > args.threshold else ""
+            regressions += ratio > args.threshold
+        fmt = lambda v: f"{v * 1000:11.2f}" if v is not None else f"{'-':>11}"
+        print(f"{key[0]:<28} {key[1]:>8} {key[2]:>8} {fmt(before)} {fmt(after)} {ratio if ratio is not None else float('nan'):7.2f}{flag}")
+    if regressions:
+        print(f"{regressions} scenario(s) slower than {args.threshold:.2f}x", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
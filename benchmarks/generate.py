@@ -0,0 +1,81 @@
+"""Deterministic synthetic stashes and recipe libraries for benchmarks.
+
+The same (size, seed) always produces the same rows, so timings from different
+runs are measured against identical data. Steep dates are laid out relative to
+the ``now`` passed in, which keeps the Steeping / Ready soon / Ready split stable.
+"""
+import datetime
+import random
+
+from mixlab.catalog import CATEGORIES
+
+BRANDS = ['TFA', 'CAP', 'FA', 'FW', 'INW', 'FLV', 'WF', 'NicVape', 'LA', 'OOO']
+BASES = {
+    'Fruit': ['Strawberry', 'Blueberry', 'Mango', 'Peach', 'Raspberry', 'Kiwi', 'Watermelon', 'Lemon', 'Apple', 'Cherry'],
+    'Cream': ['Bavarian Cream', 'Sweet Cream', 'Whipped Cream', 'Cream Fresh', 'Vanilla Bean Ice Cream'],
+    'Custard': ['Vanilla Custard', 'Custard Premium', 'Creme Brulee', 'Vanilla Pudding'],
+    'Bakery': ['Sugar Cookie', 'Biscuit', 'Graham Cracker', 'Glazed Donut', 'Cheesecake', 'Shortbread'],
+    'Menthol': ['Menthol', 'Koolada', 'Polar Blast', 'Spearmint'],
+    'Sweetener': ['Sucralose', 'Ethyl Maltol', 'Super Sweet', 'Stevia'],
+    'Tobacco': ['RY4', 'Black Cavendish', 'Virginia', 'Turkish', 'Burley'],
+    'Beverage': ['Cola', 'Iced Tea', 'Espresso', 'Lemonade', 'Champagne'],
+    'Other': ['Marshmallow', 'Caramel', 'Hazelnut', 'Honey', 'Maple Syrup'],
+}
+QUALIFIERS = ['', 'Ripe', 'Sweet', 'Wild', 'Dark', 'Double', 'Extra', 'Juicy', 'Golden', 'Natural', 'Fresh']
+STEEP_DAY_CHOICES = [0, 3, 7, 14, 21, 30]
+
+def generate_stash(n_flavors, seed=0):
+    """``n_flavors`` unique (name, brand, category) rows spread over CATEGORIES."""
+    rng = random.Random(seed)
+    seen = set()
+    rows = []
+    while len(rows) < n_flavors:
+        category = CATEGORIES[len(rows) % len(CATEGORIES)]
+        brand = rng.choice(BRANDS)
+        name = " ".join(w for w in (brand, rng.choice(QUALIFIERS), rng.choice(BASES[category])) if w)
+        if name.casefold() in seen:
+            name = f"{name} v{len(rows)}"
+        seen.add(name.casefold())
+        rows.append((name, brand, category))
+    return rows
+
+def generate_library(n_recipes, stash, seed=0, now=None, min_flavors=2, max_flavors=8):
+    """Yield (recipe_row, flavor_rows) for ``n_recipes`` recipes drawn from ``stash``.
+
+    Recipe ids run from 1 and flavor ids are 1-based stash positions, matching
+    a stash inserted in order into an empty database.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.datetime.now()
+    for recipe_id in range(1, n_recipes + 1):
+        steep_days = rng.choice(STEEP_DAY_CHOICES)
+        created = now - datetime.timedelta(days=rng.uniform(0, 60))
+        end = created + datetime.timedelta(days=steep_days)
+        status = 'Ready' if end <= now and rng.random() < 0.5 else 'Steeping'
+        picks = rng.sample(range(len(stash)), min(len(stash), rng.randint(min_flavors, max_flavors)))
+        recipe = (recipe_id, f"Recipe {recipe_id}", f"Synthetic recipe #{recipe_id}", steep_days,
+                  created.isoformat(sep=' ', timespec='seconds'), end.isoformat(), status)
+        flavors = [(recipe_id, i + 1, stash[i][0], round(rng.uniform(0.5, 12.0), 1)) for i in picks]
+        yield recipe, flavors
+
+def seed_database(pool, n_flavors, n_recipes, seed=0, now=None, batch_size=5000):
+    """Fill an empty database with a generated stash and library; returns the stash rows."""
+    stash = generate_stash(n_flavors, seed)
+    with pool.transaction() as conn:
+        conn.executemany("INSERT INTO flavor_stash (name, brand, category) VALUES (?, ?, ?)", stash)
+        recipes, flavors = [], []
+        for recipe, recipe_flavors in generate_library(n_recipes, stash, seed, now):
+            recipes.append(recipe)
+            flavors.extend(recipe_flavors)
+            if len(recipes) >= batch_size:
+                _insert_library(conn, recipes, flavors)
+                recipes, flavors = [], []
+        _insert_library(conn, recipes, flavors)
+    return stash
+
+def _insert_library(conn, recipes, flavors):
+    conn.executemany(
+        "INSERT INTO recipes (id, name, notes, steep_days, created_at, steep_end_date, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        recipes
+    )
+    conn.executemany("INSERT INTO recipe_flavors (recipe_id, flavor_id, flavor_name, percentage) VALUES (?, ?, ?, ?)", flavors)
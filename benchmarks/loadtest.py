@@ -0,0 +1,351 @@
+"""Drive the app with many simulated sessions at once and report rerun latency as JSON.
+
+    python -m benchmarks.loadtest                                  # 8 sessions x 25 actions
+    python -m benchmarks.loadtest --sessions 16 --actions 50 --flavors 500 --recipes 5000 -o load.json
+    python -m benchmarks.loadtest --mix browse=4,save=4,stash=2
+
+Each session is a streamlit.testing AppTest of ``code (1).py`` running in its
+own thread, all against one temporary database seeded by benchmarks.generate.
+They share this process's connection pool, writer and caches just as browser
+sessions on one Streamlit server do. Every session runs a scripted, seeded mix
+of actions; each script rerun is timed, and lock errors, other exceptions and
+stale-edit rejections are counted.
+
+AppTest cannot type into st.data_editor, so the ``stash`` action opens the
+Flavor Stash page and then saves a one-cell edit through mixlab.stash the way
+its Save button does.
+"""
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import mixlab
+from mixlab.catalog import get_flavor_catalog
+from mixlab.db import StaleWriteError, get_query_cache, get_writer, run_query
+from mixlab.similarity import get_similarity_index
+from mixlab.stash import apply_stash_changes, compute_stash_changes, validate_stash_changes
+
+from benchmarks.generate import BRANDS, seed_database
+from benchmarks.run import git_revision
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code (1).py")
+DEFAULT_MIX = {'browse': 4, 'save': 2, 'duplicate': 1, 'stash': 1, 'vapesim': 2, 'synergy': 1}
+STALE_MESSAGES = ("changed by someone else", "Someone else changed", "deleted by someone else")
+
+def percentiles(times):
+    """p50/p95/p99/max/mean of a list of seconds, in milliseconds."""
+    if not times:
+        return {'count': 0}
+    cuts = statistics.quantiles(times, n=100, method='inclusive') if len(times) > 1 else [times[0]] * 99
+    return {
+        'count': len(times),
+        'p50_ms': cuts[49] * 1000, 'p95_ms': cuts[94] * 1000, 'p99_ms': cuts[98] * 1000,
+        'max_ms': max(times) * 1000, 'mean_ms': statistics.fmean(times) * 1000,
+    }
+
+def _is_lock_error(message):
+    return "database is locked" in message or "database table is locked" in message
+
+
+# --- Sessions ---
+@contextmanager
+def concurrent_apptests():
+    """Let AppTests run in several threads at once, the way a server runs sessions.
+
+    Each AppTest run installs a stand-in Runtime singleton and clears it when it
+    finishes, which would pull it out from under runs still going in other
+    threads; while this is active a cleared singleton falls back to the last
+    stand-in installed. The same goes for the config patch that puts a run in
+    test mode, so it is held for the whole block. Each run also compiles the
+    script afresh, and parsing in several threads at once is not safe on every
+    Python; here the script is compiled once and shared, as the server's script
+    cache does.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1.util import patch_config_options
+
+    original_instance, original_exists = Runtime.__dict__['instance'], Runtime.__dict__['exists']
+    original_bytecode = ScriptCache.get_bytecode
+    last = []
+    compiled = {}
+    lock = threading.Lock()
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+            return cls._instance
+        return last[0] if last else original_instance.__func__(cls)
+
+    def exists(cls):
+        return cls._instance is not None or bool(last)
+
+    def get_bytecode(self, script_path):
+        with lock:
+            if script_path not in compiled:
+                compiled[script_path] = original_bytecode(self, script_path)
+            return compiled[script_path]
+
+    Runtime.instance, Runtime.exists = classmethod(instance), classmethod(exists)
+    ScriptCache.get_bytecode = get_bytecode
+    try:
+        with patch_config_options({"global.appTest": True}):
+            yield
+    finally:
+        Runtime.instance, Runtime.exists = original_instance, original_exists
+        ScriptCache.get_bytecode = original_bytecode
+
+class Session:
+    """One simulated browser session: an AppTest plus what it measured."""
+
+    def __init__(self, number, rng, words, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.number = number
+        self.rng = rng
+        self.words = words
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.timings = collections.defaultdict(list) # action -> rerun seconds
+        self.actions = collections.Counter()
+        self.lock_errors = self.errors = self.stale = 0
+        self.samples = []
+
+    def record_error(self, action, message):
+        if _is_lock_error(message):
+            self.lock_errors += 1
+        else:
+            self.errors += 1
+        if len(self.samples) < 5:
+            self.samples.append({'session': self.number, 'action': action, 'error': message[:500]})
+
+    def rerun(self, action, widget=None):
+        """Run the script once (after ``widget``'s change, if given) and time it."""
+        start = time.perf_counter()
+        try:
+            (widget or self.at).run()
+        except Exception as e: # Timeouts and harness-side failures
+            self.record_error(action, f"{type(e).__name__}: {e}")
+            return False
+        finally:
+            self.timings[action].append(time.perf_counter() - start)
+        for exception in self.at.exception:
+            self.record_error(action, exception.message)
+        self.stale += sum(any(m in e.value for m in STALE_MESSAGES) for e in self.at.error)
+        return not self.at.exception
+
+    def goto(self, action, page):
+        radio = self.at.radio(key="module")
+        label = next(o for o in radio.options if page in o)
+        return radio.value == label or self.rerun(action, radio.set_value(label))
+
+    def widget(self, kind, label):
+        return next((w for w in getattr(self.at, kind) if label in w.label), None)
+
+    def listed_recipe(self):
+        """A recipe id from the Recipe Manager's current page, or None.
+
+        The recipe selectboxes show names for id options through format_func,
+        which AppTest's select_index cannot map back, so they are set by id.
+        """
+        listed = next((df.value for df in self.at.dataframe if 'ID' in df.value.columns), None)
+        return int(self.rng.choice(listed['ID'].tolist())) if listed is not None and len(listed) else None
+
+# Each action drives one session through a user task; widgets are found by key or label.
+def browse(s):
+    if not s.goto("browse", "Recipe Manager"):
+        return
+    if s.rerun("browse", s.at.text_input(key="recipe_search").set_value(s.rng.choice(s.words + ["", ""]))):
+        s.rerun("browse", s.at.number_input(key="recipe_page").set_value(s.rng.randint(1, 3)))
+
+def save(s):
+    if not s.goto("save", "Recipe Manager"):
+        return
+    recipe_id = s.listed_recipe()
+    if recipe_id is None:
+        return
+    s.widget("selectbox", "Edit Existing Recipe").set_value(recipe_id)
+    # Form widgets only reach the script on submit; this one loads the recipe's flavors
+    if not s.rerun("save", s.widget("button", "Find Similar").click()):
+        return
+    pct = next((w for w in s.at.number_input if w.key == "pct_0"), None)
+    if pct is not None:
+        pct.set_value(round(s.rng.uniform(0.5, 12.0), 1))
+    s.rerun("save", s.widget("button", "Save Recipe").click())
+
+def duplicate(s):
+    if not s.goto("duplicate", "Recipe Manager"):
+        return
+    recipe_id = s.listed_recipe()
+    if recipe_id is not None:
+        s.widget("selectbox", "Select Recipe for Actions").set_value(recipe_id)
+        s.rerun("duplicate", s.widget("button", "Duplicate").click())
+
+def stash(s):
+    import pandas as pd
+
+    if not s.goto("stash", "Flavor Stash"):
+        return
+    # What the page's Save button does with a one-cell edit
+    start = time.perf_counter()
+    try:
+        rows = run_query("SELECT id, name, brand, category, version FROM flavor_stash ORDER BY name", fetch="all")
+        stash_df = pd.DataFrame(rows, columns=['id', 'Name', 'Brand', 'Category', 'version'])
+        edited = stash_df.copy()
+        edited.loc[s.rng.randrange(len(edited)), 'Brand'] = s.rng.choice(BRANDS)
+        inserts, updates, deletes = compute_stash_changes(stash_df, edited)
+        if not validate_stash_changes(stash_df, inserts, updates, deletes) and not updates.empty:
+            apply_stash_changes(get_writer(), inserts, updates, deletes, versions=dict(zip(stash_df['id'], stash_df['version'])))
+            get_flavor_catalog().invalidate()
+            get_similarity_index().invalidate()
+    except StaleWriteError:
+        s.stale += 1
+    except sqlite3.Error as e:
+        s.record_error("stash_save", f"{type(e).__name__}: {e}")
+    finally:
+        s.timings["stash_save"].append(time.perf_counter() - start)
+
+def vapesim(s):
+    if not s.goto("vapesim", "VapeSim"):
+        return
+    recipe = s.widget("selectbox", "Choose a recipe to analyze")
+    if recipe is not None and recipe.options:
+        s.rerun("vapesim", recipe.select_index(s.rng.randrange(len(recipe.options))))
+
+def synergy(s):
+    if not s.goto("synergy", "Synergy"):
+        return
+    view = s.widget("radio", "View")
+    if view is not None:
+        s.rerun("synergy", view.set_value(s.rng.choice(view.options)))
+
+ACTIONS = {'browse': browse, 'save': save, 'duplicate': duplicate, 'stash': stash, 'vapesim': vapesim, 'synergy': synergy}
+
+def run_session(session, n_actions, mix, think):
+    names, weights = list(mix), list(mix.values())
+    if not session.rerun("load"):
+        return
+    for _ in range(n_actions):
+        action = session.rng.choices(names, weights)[0]
+        session.actions[action] += 1
+        try:
+            ACTIONS[action](session)
+        except Exception as e: # The page didn't render what the script expected
+            session.record_error(action, f"{type(e).__name__}: {e}")
+        if think:
+            time.sleep(session.rng.uniform(0, think))
+
+
+# --- Runner ---
+def run_load(n_sessions, n_actions, mix, n_flavors, n_recipes, seed=0, think=0.0, timeout=120.0, workdir=None):
+    """Seed a temporary database, run the sessions concurrently and return the report dict."""
+    pool = mixlab.configure(os.path.join(workdir, "loadtest.db"))
+    stash_rows = seed_database(pool, n_flavors, n_recipes, seed)
+    words = sorted({w for name, _, _ in stash_rows for w in name.split() if len(w) > 3})
+    writer = get_writer()
+    batches, writes = writer.batches, writer.writes
+
+    sessions = [Session(i, random.Random(seed * 1000 + i), words, timeout) for i in range(n_sessions)]
+    threads = [threading.Thread(target=run_session, args=(s, n_actions, mix, think), name=f"loadtest-{s.number}") for s in sessions]
+    with concurrent_apptests():
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+
+    by_action = collections.defaultdict(list)
+    for s in sessions:
+        for action, times in s.timings.items():
+            by_action[action].extend(times)
+    reruns = [t for action, times in by_action.items() if action != "stash_save" for t in times]
+    actions = sum(sum(s.actions.values()) for s in sessions)
+    commits = writer.batches - batches
+    pool.close_all()
+    return {
+        'summary': {
+            'sessions': n_sessions, 'actions': actions, 'reruns': len(reruns), 'wall_s': wall,
+            'actions_per_s': actions / wall, 'reruns_per_s': len(reruns) / wall,
+            'latency': percentiles(reruns),
+            'lock_errors': sum(s.lock_errors for s in sessions),
+            'errors': sum(s.errors for s in sessions),
+            'stale_rejections': sum(s.stale for s in sessions),
+        },
+        'actions': {
+            action: {'count': sum(s.actions[action] for s in sessions), 'latency': percentiles(by_action.get(action, []))}
+            for action in mix
+        },
+        'steps': {'load': percentiles(by_action.get("load", [])), 'stash_save': percentiles(by_action.get("stash_save", []))},
+        'writer': {'writes': writer.writes - writes, 'commits': commits, 'writes_per_commit': (writer.writes - writes) / max(commits, 1)},
+        'query_cache': get_query_cache().stats(),
+        'error_samples': [sample for s in sessions for sample in s.samples][:10],
+    }
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ACTIONS:
+            raise ValueError(f"unknown action '{name}' (choose from {', '.join(ACTIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--actions", type=int, default=25, help="actions per session")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()), help="comma-separated action=weight pairs")
+    parser.add_argument("--flavors", type=int, default=200)
+    parser.add_argument("--recipes", type=int, default=2000)
+    parser.add_argument("--think", type=float, default=0.0, help="max random pause between actions, in seconds")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-rerun timeout, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    workdir = tempfile.mkdtemp(prefix="mixlab-load-")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir) # Anything the app writes next to itself (staged uploads) stays out of the tree
+        print(f"{args.sessions} sessions x {args.actions} actions, {args.flavors} flavors x {args.recipes} recipes", file=sys.stderr)
+        report = run_load(args.sessions, args.actions, mix, args.flavors, args.recipes, args.seed, args.think, args.timeout, workdir)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = report['summary']
+    print(f"  {summary['reruns']} reruns in {summary['wall_s']:.1f} s, p50 {summary['latency'].get('p50_ms', 0):.0f} ms, "
+          f"p99 {summary['latency'].get('p99_ms', 0):.0f} ms, {summary['lock_errors']} lock errors", file=sys.stderr)
+    report['meta'] = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed, 'sessions': args.sessions, 'actions': args.actions, 'mix': mix,
+        'flavors': args.flavors, 'recipes': args.recipes, 'think': args.think,
+    }
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""Time the core engines against generated data and emit the results as JSON.
+
+    python -m benchmarks.run                          # small and medium sizes
+    python -m benchmarks.run --sizes large -o out.json
+    python -m benchmarks.run --flavors 500 --recipes 5000 --repeat 5
+
+Each size gets a fresh temporary database seeded by benchmarks.generate. Compare
+two result files with ``python -m benchmarks.compare old.json new.json``.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import mixlab
+from mixlab.db import get_query_cache, get_writer, run_query
+from mixlab.generator import generate_recipes
+from mixlab.quickmix import get_quickmix_index, suggest_recipe
+from mixlab.recipes import get_recipe_repository, search_recipes
+from mixlab.stash import apply_stash_changes, compute_stash_changes, validate_stash_changes
+from mixlab.steep import STEEP_FILTERS, fetch_steep_page, get_steep_sweeper
+from mixlab.synergy import category_synergy, synergy_matrix, top_synergy_pairs
+from mixlab.transfer import RowReader, export_table, import_recipes
+from mixlab.vapesim import load_vapesim_frame, vapesim_analyze, vapesim_batch
+
+from benchmarks.generate import seed_database
+
+SIZES = {
+    'small': (100, 1_000),
+    'medium': (2_000, 20_000),
+    'large': (20_000, 200_000),
+}
+FULL_MATRIX_LIMIT = 5_000 # synergy_matrix is N x N float32; larger stashes only time the blocked paths
+
+def measure(fn, repeat):
+    """Run ``fn`` ``repeat`` times; returns (timing stats, last return value)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return {
+        'repeat': repeat, 'min_s': min(times), 'median_s': statistics.median(times),
+        'mean_s': statistics.fmean(times), 'max_s': max(times),
+    }, result
+
+# --- Scenarios ---
+# Each takes (pool, ctx, repeat) and returns a list of (name, stats, extra) tuples.
+def bench_run_query(pool, ctx, repeat, calls=2000):
+    rng = random.Random(1)
+    ids = [rng.randint(1, ctx['recipes']) for _ in range(calls)]
+    query = "SELECT name, notes, steep_days FROM recipes WHERE id=?"
+
+    def uncached():
+        for r_id in ids:
+            run_query(query, (r_id,), fetch="one", cache=False)
+
+    def cached():
+        for r_id in ids:
+            run_query(query, (r_id,), fetch="one")
+
+    results = []
+    for name, fn in (("run_query.uncached", uncached), ("run_query.cached", cached)):
+        get_query_cache().clear()
+        if fn is cached:
+            cached() # Warm up, so the timed runs are all hits
+        stats, _ = measure(fn, repeat)
+        results.append((name, stats, {'calls': calls, 'calls_per_s': calls / stats['median_s']}))
+    return results
+
+def bench_vapesim(pool, ctx, repeat, sample=200):
+    rng = random.Random(2)
+    ids = rng.sample(range(1, ctx['recipes'] + 1), min(sample, ctx['recipes']))
+    recipes = [
+        [{'flavor_name': name, 'percentage': pct} for name, pct in
+         run_query("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=?", (r_id,), fetch="all", cache=False)]
+        for r_id in ids
+    ]
+
+    def per_recipe():
+        for flavors in recipes:
+            vapesim_analyze(flavors)
+
+    def bulk_load():
+        get_query_cache().clear() # Time the query, not a cache hit
+        return load_vapesim_frame()
+
+    per_stats, _ = measure(per_recipe, repeat)
+    load_stats, frame = measure(bulk_load, repeat)
+    batch_stats, _ = measure(lambda: vapesim_batch(frame), repeat)
+    return [
+        ("vapesim.per_recipe", per_stats, {'sampled': len(recipes), 'ms_per_recipe': per_stats['median_s'] / len(recipes) * 1000}),
+        ("vapesim.bulk_load", load_stats, {'rows': len(frame)}),
+        ("vapesim.bulk_batch", batch_stats, {'us_per_recipe': batch_stats['median_s'] / ctx['recipes'] * 1e6}),
+    ]
+
+def bench_synergy(pool, ctx, repeat):
+    categories = [category for _, _, category in ctx['stash']]
+    results = []
+    stats, pairs = measure(lambda: top_synergy_pairs(categories), repeat)
+    results.append(("synergy.top_pairs", stats, {'pairs': len(pairs)}))
+    stats, _ = measure(lambda: category_synergy(categories), repeat)
+    results.append(("synergy.category_aggregate", stats, {}))
+    if len(categories) <= FULL_MATRIX_LIMIT:
+        stats, matrix = measure(lambda: synergy_matrix(categories), repeat)
+        results.append(("synergy.full_matrix", stats, {'bytes': int(matrix.nbytes)}))
+    return results
+
+def bench_stash_save(pool, ctx, repeat, fraction=0.01):
+    import pandas as pd
+
+    def save():
+        rows = run_query("SELECT id, name, brand, category FROM flavor_stash ORDER BY name", fetch="all", cache=False)
+        stash_df = pd.DataFrame(rows, columns=['id', 'Name', 'Brand', 'Category'])
+        edited = stash_df.copy()
+        n = max(1, int(len(edited) * fraction))
+        edited.loc[edited.index[:n], 'Brand'] = edited['Brand'].iloc[:n] + "*"
+        edited = edited.drop(edited.index[-n:])
+        new = pd.DataFrame({'id': None, 'Name': [f"Bench Flavor {time.perf_counter_ns()}-{i}" for i in range(n)], 'Brand': 'BENCH', 'Category': 'Other'})
+        edited = pd.concat([edited, new], ignore_index=True)
+        inserts, updates, deletes = compute_stash_changes(stash_df, edited)
+        assert not validate_stash_changes(stash_df, inserts, updates, deletes)
+        apply_stash_changes(get_writer(), inserts, updates, deletes)
+        return n
+
+    stats, n = measure(save, repeat)
+    return [("stash.save", stats, {'rows_added': n, 'rows_changed': n, 'rows_removed': n})]
+
+def bench_recipes(pool, ctx, repeat, ops=50):
+    rng = random.Random(3)
+    repository = get_recipe_repository()
+    names = [name for name, _, _ in ctx['stash']]
+    steep_end = datetime.datetime.now().isoformat()
+    flavors = [[{'name': name, 'percentage': round(rng.uniform(0.5, 10), 1)} for name in rng.sample(names, min(5, len(names)))]
+               for _ in range(ops)]
+    created = []
+
+    def create():
+        created.clear()
+        for f in flavors:
+            created.append(repository.create("Bench Recipe", "", 7, steep_end, f))
+
+    def update():
+        for r_id, f in zip(created, flavors):
+            edited = [dict(f[0], percentage=f[0]['percentage'] + 0.5)] + f[1:]
+            repository.update(r_id, "Bench Recipe", "", 7, steep_end, edited)
+
+    def duplicate():
+        for _ in range(ops):
+            repository.duplicate(rng.randint(1, ctx['recipes']))
+
+    results = []
+    for name, fn in (("recipes.create", create), ("recipes.update", update), ("recipes.duplicate", duplicate)):
+        stats, _ = measure(fn, repeat)
+        results.append((name, stats, {'ops': ops, 'ms_per_op': stats['median_s'] / ops * 1000}))
+    return results
+
+def bench_concurrent_writes(pool, ctx, repeat, sessions=8, ops=25):
+    """Sessions saving recipes at the same time, all through the serialized writer."""
+    import concurrent.futures
+
+    repository = get_recipe_repository()
+    writer = get_writer()
+    rng = random.Random(4)
+    targets = [[rng.randint(1, ctx['recipes']) for _ in range(ops)] for _ in range(sessions)]
+    steep_end = datetime.datetime.now().isoformat()
+
+    def session(recipe_ids):
+        for r_id in recipe_ids:
+            repository.update(r_id, "Bench Recipe", "", 7, steep_end, [{'name': ctx['stash'][0][0], 'percentage': 1.0}])
+
+    def burst():
+        with concurrent.futures.ThreadPoolExecutor(sessions) as executor:
+            list(executor.map(session, targets))
+
+    batches, writes = writer.batches, writer.writes
+    stats, _ = measure(burst, repeat)
+    n_writes = writer.writes - writes
+    return [("writer.concurrent_saves", stats, {
+        'sessions': sessions, 'ops': sessions * ops,
+        'saves_per_s': sessions * ops / stats['median_s'],
+        'saves_per_commit': n_writes / max(writer.batches - batches, 1),
+    })]
+
+def bench_steep_tracker(pool, ctx, repeat, page_size=25):
+    sweeper = get_steep_sweeper()
+
+    def render():
+        sweeper.sweep(force=True)
+        return {f: fetch_steep_page(f, 0, page_size)[1] for f in STEEP_FILTERS}
+
+    stats, totals = measure(render, repeat)
+    return [("steep_tracker.render", stats, {'page_size': page_size, 'totals': totals})]
+
+def bench_recipe_search(pool, ctx, repeat, page_size=25):
+    stash_word = ctx['stash'][0][0].split()[-1]
+    last_page = max(0, (ctx['recipes'] - 1) // page_size)
+    cases = [
+        ("recipe_search.first_page", "", 0),
+        ("recipe_search.last_page", "", last_page),
+        ("recipe_search.flavor_word", stash_word, 0),
+        ("recipe_search.prefix", stash_word[:3], 0),
+    ]
+    results = []
+    for name, text, page in cases:
+        def search():
+            get_query_cache().clear() # Time the queries, not a cache hit
+            return search_recipes(text, page, page_size)
+        stats, (_, total) = measure(search, repeat)
+        results.append((name, stats, {'query': text, 'page': page, 'matches': total}))
+    return results
+
+def bench_quickmix(pool, ctx, repeat):
+    from mixlab.catalog import get_flavor_catalog
+
+    def build():
+        get_flavor_catalog().invalidate() # Forces the next lookup to rebuild the index
+        return get_quickmix_index().current()
+    build_stats, _ = measure(build, repeat)
+    stash_name = ctx['stash'][0][0]
+    results = [("quickmix.build", build_stats, {})]
+    for name, profile in [("quickmix.keywords", "creamy strawberry shortcake with a cool finish"),
+                          ("quickmix.flavor_name", stash_name)]:
+        seeds = iter(range(10**9))
+        stats, (flavors, _) = measure(lambda: suggest_recipe(profile, seed=next(seeds)), repeat)
+        results.append((name, stats, {'profile': profile, 'picked': len(flavors)}))
+    return results
+
+def bench_generator(pool, ctx, repeat, profile="creamy strawberry shortcake with a cool finish"):
+    results = []
+    for n_candidates in (5_000, 100_000):
+        seeds = iter(range(10**9))
+        stats, (recipes, search) = measure(lambda: generate_recipes(profile, n_candidates, k=5, budget=10.0, seed=next(seeds)), repeat)
+        results.append((f"generator.{n_candidates}", stats, {'profile': profile, 'workers': search['workers'],
+                                                             'valid': search['valid'], 'best_score': recipes[0]['score'] if recipes else None}))
+    return results
+
+def bench_transfer(pool, ctx, repeat):
+    # Runs last by default: every import repeat adds another copy of the library
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for table, fmt in [("recipes", "csv"), ("library", "jsonl")]:
+            path = os.path.join(workdir, f"{table}.{fmt}")
+            def export():
+                with open(path, "w", newline='', encoding='utf-8') as f:
+                    return export_table(table, f, fmt)
+            stats, records = measure(export, repeat)
+            results.append((f"transfer.export_{table}_{fmt}", stats, {'records': records, 'bytes': os.path.getsize(path)}))
+
+        def load():
+            with open(path, "rb") as f:
+                return import_recipes(RowReader(f, "jsonl"))
+        stats, report = measure(load, repeat)
+        results.append(("transfer.import_library_jsonl", stats, {'records': report.rows_read, 'errors': report.error_count}))
+    return results
+
+SCENARIOS = {
+    'run_query': bench_run_query,
+    'vapesim': bench_vapesim,
+    'synergy': bench_synergy,
+    'stash_save': bench_stash_save,
+    'recipes': bench_recipes,
+    'concurrent_writes': bench_concurrent_writes,
+    'steep_tracker': bench_steep_tracker,
+    'recipe_search': bench_recipe_search,
+    'quickmix': bench_quickmix,
+    'generator': bench_generator,
+    'transfer': bench_transfer,
+}
+
+def run_size(n_flavors, n_recipes, scenarios, repeat, seed, workdir):
+    path = os.path.join(workdir, f"bench_{n_flavors}_{n_recipes}.db")
+    pool = mixlab.configure(path)
+    start = time.perf_counter()
+    stash = seed_database(pool, n_flavors, n_recipes, seed)
+    seed_s = time.perf_counter() - start
+    print(f"  {'seed':<28} {seed_s * 1000:10.2f} ms", file=sys.stderr)
+    ctx = {'flavors': n_flavors, 'recipes': n_recipes, 'stash': stash}
+    results = [{'scenario': 'seed', 'flavors': n_flavors, 'recipes': n_recipes, 'repeat': 1, 'median_s': seed_s}]
+    for scenario in scenarios:
+        for name, stats, extra in SCENARIOS[scenario](pool, ctx, repeat):
+            results.append({'scenario': name, 'flavors': n_flavors, 'recipes': n_recipes, **stats, **extra})
+            print(f"  {name:<28} {stats['median_s'] * 1000:10.2f} ms", file=sys.stderr)
+    pool.close_all()
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="small,medium", help=f"comma-separated presets: {', '.join(SIZES)}")
+    parser.add_argument("--flavors", type=int, help="custom stash size (use with --recipes instead of --sizes)")
+    parser.add_argument("--recipes", type=int, help="custom library size")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of scenarios")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.flavors or args.recipes:
+        sizes = [(args.flavors or SIZES['small'][0], args.recipes or SIZES['small'][1])]
+    else:
+        sizes = [SIZES[s] for s in args.sizes.split(",")]
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="mixlab-bench-")
+    try:
+        results = []
+        for n_flavors, n_recipes in sizes:
+            print(f"{n_flavors} flavors x {n_recipes} recipes", file=sys.stderr)
+            results += run_size(n_flavors, n_recipes, scenarios, args.repeat, args.seed, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+if __name__ == "__main__":
+    main()
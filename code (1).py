@@ -1,11 +1,34 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
 import sqlite3
 import datetime
-import time
-import random
+import functools
+import io
 import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+from mixlab import profiling
+from mixlab.catalog import CATEGORIES, get_flavor_catalog
+from mixlab.db import StaleWriteError, get_pool, get_query_cache, get_writer, run_query
+from mixlab.figures import HEATMAP_MAX_AXIS, HEATMAP_VIEWS, balance_figure, steep_curve_figure, synergy_figure
+from mixlab.generator import CANDIDATE_CHOICES, generate_recipes
+from mixlab.jobs import ACTIVE_STATES, JOB_KINDS, JobLimitError, get_job_runner, job_result, latest_result, recent_jobs
+from mixlab.quickmix import suggest_recipe
+from mixlab.recipes import (
+    RECIPE_PAGE_SIZES, diff_matrix, get_recipe_repository, recipe_history, recipe_labels, recipe_names, recipe_text, recipe_versions,
+    search_recipes, versions_frame,
+)
+from mixlab.similarity import SIMILARITY_METRICS, get_similarity_index, similar_recipes_frame, sync_similarity_index
+from mixlab.stash import apply_stash_changes, compute_stash_changes, validate_stash_changes
+from mixlab.steep import STEEP_FILTERS, STEEP_PAGE_SIZES, fetch_steep_page, get_steep_sweeper
+from mixlab.synergy import cluster_by_category, top_synergy_pairs
+from mixlab.transfer import FORMATS, export_table
+from mixlab.vapesim import LEADERBOARD_RANKINGS, NOTES, load_vapesim_frame, vapesim_analyze_cached, vapesim_batch
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -34,265 +57,322 @@ st.markdown("""
         border: 1px solid #00A36C;
         color: #00A36C;
     }
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 24px;
-    }
-    .stTabs [data-baseweb="tab"] {
-        height: 50px;
-        white-space: pre-wrap;
-        background-color: #1E1E1E;
-        border-radius: 4px 4px 0px 0px;
-        gap: 1px;
-        padding-top: 10px;
-        padding-bottom: 10px;
-    }
-    .stTabs [aria-selected="true"] {
-        background-color: #00A36C;
-        color: white;
-        font-weight: bold;
-    }
 </style>
 """, unsafe_allow_html=True)
 
 
-# --- Database Setup ---
-def init_db():
-    conn = sqlite3.connect('mixlab.db')
-    c = conn.cursor()
-    # Stash Table: id, name, brand, category (for AI analysis)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS flavor_stash (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            brand TEXT,
-            category TEXT
-        )
-    ''')
-    # Recipes Table: id, name, steep_days, created_at, steep_end_date, status
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS recipes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            notes TEXT,
-            steep_days INTEGER DEFAULT 7,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            steep_end_date TIMESTAMP,
-            status TEXT DEFAULT 'Steeping'
-        )
-    ''')
-    # Recipe Flavors Table: Links flavors and percentages to a recipe
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS recipe_flavors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            recipe_id INTEGER,
-            flavor_name TEXT,
-            percentage REAL,
-            FOREIGN KEY (recipe_id) REFERENCES recipes (id) ON DELETE CASCADE
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-# Initialize the database on first run
-init_db()
-
-# --- Database Helper Functions ---
-def run_query(query, params=(), fetch=None):
-    conn = sqlite3.connect('mixlab.db')
-    c = conn.cursor()
-    c.execute(query, params)
-    if fetch == "one":
-        result = c.fetchone()
-    elif fetch == "all":
-        result = c.fetchall()
-    else:
-        result = None
-    conn.commit()
-    conn.close()
-    return result
-
-# --- VapeSim AI Mock Logic ---
-FLAVOR_PROPERTIES = {
-    'Fruit': {'note': 'Top', 'type': 'Primary'},
-    'Sweetener': {'note': 'Accent', 'type': 'Enhancer'},
-    'Cream': {'note': 'Base', 'type': 'Mouthfeel'},
-    'Custard': {'note': 'Base', 'type': 'Mouthfeel'},
-    'Bakery': {'note': 'Mid', 'type': 'Primary'},
-    'Menthol': {'note': 'Accent', 'type': 'Effect'},
-    'Tobacco': {'note': 'Base', 'type': 'Primary'},
-    'Beverage': {'note': 'Mid', 'type': 'Primary'},
-    'Other': {'note': 'Mid', 'type': 'Misc'}
-}
-
-def get_flavor_category(flavor_name):
-    stash = run_query("SELECT name, category FROM flavor_stash", fetch="all")
-    stash_map = {name.lower(): category for name, category in stash}
-    return stash_map.get(flavor_name.lower(), 'Other')
-
-def vapesim_analyze(recipe_flavors):
-    """Mocks an AI analysis of a recipe."""
-    analysis = {
-        "summary": "", "balance": {"Top": 0, "Mid": 0, "Base": 0, "Accent": 0},
-        "sweetness": 0, "density": 0, "steep_curve": [], "warnings": []
-    }
-    total_percentage = sum(f['percentage'] for f in recipe_flavors)
-    
-    # Generate Summary & Warnings
-    summary_parts = []
-    cream_pct = 0
-    fruit_pct = 0
-    
-    for flavor in recipe_flavors:
-        category = get_flavor_category(flavor['flavor_name'])
-        props = FLAVOR_PROPERTIES.get(category, FLAVOR_PROPERTIES['Other'])
-        analysis['balance'][props['note']] += flavor['percentage']
-        
-        if category == 'Cream' or category == 'Custard':
-            cream_pct += flavor['percentage']
-        if category == 'Fruit':
-            fruit_pct += flavor['percentage']
-        if category == 'Sweetener':
-            analysis['sweetness'] += flavor['percentage'] * 5 # Sweeteners are potent
-        
-        if flavor['percentage'] > 8:
-            analysis['warnings'].append(f"High concentration of {flavor['flavor_name']} ({flavor['percentage']}%) may lead to oversaturation or muting.")
-    
-    if cream_pct > 10:
-        summary_parts.append("This is a very cream-heavy profile, suggesting a thick, dense vape.")
-        analysis['warnings'].append("High total cream percentage may require a longer steep.")
-    if fruit_pct > cream_pct:
-        summary_parts.append("The profile is fruit-dominant, likely bright and sharp.")
-    if "Menthol" in [get_flavor_category(f['flavor_name']) for f in recipe_flavors] and "Cream" in [get_flavor_category(f['flavor_name']) for f in recipe_flavors]:
-         analysis['warnings'].append("Potential clash: Menthol and Cream can sometimes curdle or separate perceptions.")
-
-    if not summary_parts:
-        summary_parts.append("A balanced mix with potential for complexity.")
-
-    analysis['summary'] = " ".join(summary_parts)
-    
-    # Calculate other metrics
-    analysis['density'] = min(100, (cream_pct * 5) + (total_percentage * 2))
-    analysis['sweetness'] = min(100, analysis['sweetness'] + fruit_pct)
-    
-    # Steep Curve Projection
-    analysis['steep_curve'] = [
-        {'Day': 1, 'Flavor': 30 + fruit_pct},
-        {'Day': 7, 'Flavor': 50 + (total_percentage*1.5)},
-        {'Day': 14, 'Flavor': 75 + cream_pct},
-        {'Day': 30, 'Flavor': 95}
-    ]
-
-    return analysis
+# --- Database ---
+# The mixlab core opens $MIXLAB_DB (default mixlab.db) on first use and shares the
+# pool, and every cache built on it, with all sessions in this process. The job
+# runner is created up front too: it fails jobs an earlier server left running.
+get_pool()
+get_job_runner()
+
+# --- Cached Views ---
+@st.cache_data(max_entries=8, show_spinner=False)
+def clustered_stash(stash_version):
+    """Stash names and categories reordered so each category forms one contiguous block."""
+    return cluster_by_category(get_flavor_catalog().items())
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_top_synergy_pairs(stash_version, k=10):
+    stash = get_flavor_catalog().items()
+    pairs = top_synergy_pairs([f[1] for f in stash], k=k)
+    return [(stash[i][0], stash[j][0], score) for i, j, score in pairs]
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_synergy_figure(stash_version, view, row_start=0, col_start=0, size=50):
+    """Heatmap for one view of the stash; cached until the stash changes."""
+    names, categories = clustered_stash(stash_version)
+    return synergy_figure(names, categories, view, row_start, col_start, size)
+
+
+# --- Profiling ---
+# Opt in with MIXLAB_PROFILE=1 or ?profile=1 in the URL. Each rerun then records
+# wall time, SQL queries, rows and figure payloads per module into a sidebar
+# panel, and appends them to $MIXLAB_PROFILE_LOG (JSONL) when that is set.
+PROFILING = os.environ.get("MIXLAB_PROFILE", "") not in ("", "0") or st.query_params.get("profile") == "1"
+PROFILE_LOG = os.environ.get("MIXLAB_PROFILE_LOG")
+PROFILE_HISTORY = 50
+
+def publish_profile(profile):
+    record = profile.to_dict()
+    history = st.session_state.setdefault("profiles", [])
+    history.append(record)
+    del history[:-PROFILE_HISTORY]
+    if PROFILE_LOG:
+        profiling.append_jsonl(PROFILE_LOG, record)
+
+def profiled(name):
+    """Time a page section into this rerun's profile; a fragment rerun gets a profile of its own."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not PROFILING:
+                return fn(*args, **kwargs)
+            profile = profiling.current()
+            if profile is not None:
+                with profile.section(name):
+                    return fn(*args, **kwargs)
+            profile = profiling.begin(name, kind="fragment")
+            try:
+                with profile.section(name):
+                    return fn(*args, **kwargs)
+            finally:
+                publish_profile(profiling.end())
+        return wrapper
+    return decorate
+
+def plotly_chart(fig, **kwargs):
+    profile = profiling.current()
+    if profile is not None:
+        profile.record_figure(fig)
+    st.plotly_chart(fig, **kwargs)
+
+def render_profile_panel():
+    history = st.session_state.get("profiles", [])
+    with st.expander("⏱️ Profiler", expanded=True):
+        if not history:
+            st.caption("No reruns recorded yet.")
+            return
+        last = history[-1]
+        st.write(f"**{last['label']}** ({last['kind']}): {last['wall_ms']:.0f} ms")
+        st.caption(f"SQL {last['sql_ms']:.0f} ms · figures {last['figure_ms']:.0f} ms · other {last['other_ms']:.0f} ms")
+        st.write(f"{last['queries']} queries ({last['cache_hits']} cached) · {last['rows']} rows · "
+                 f"{last['figures']} figures ({last['figure_bytes'] / 1024:.0f} KB)")
+        if last['sections']:
+            st.dataframe(
+                pd.DataFrame(last['sections'])[['name', 'wall_ms', 'sql_ms', 'queries', 'rows', 'figure_bytes']],
+                column_config={'wall_ms': st.column_config.NumberColumn("ms", format="%.0f"),
+                               'sql_ms': st.column_config.NumberColumn("SQL ms", format="%.0f")},
+                hide_index=True
+            )
+        st.download_button("Download JSONL", "".join(json.dumps(r) + "\n" for r in history), file_name="mixlab-profile.jsonl")
+        if PROFILE_LOG:
+            st.caption(f"Appending to {PROFILE_LOG}")
+
+# A rerun interrupted by st.rerun() never reaches end(), so start from a clean slate
+if PROFILING:
+    profiling.begin("rerun")
+else:
+    profiling.end()
+
+
+# --- Import / Export ---
+UPLOAD_TYPES = ["csv", "json", "jsonl", "ndjson"]
+
+def export_file(table, fmt):
+    """Stream an export into a spooled temp file; the download button calls this only when clicked."""
+    f = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    export_table(table, text, fmt)
+    text.flush()
+    text.detach()
+    f.seek(0)
+    return f
+
+def render_export_buttons(tables, key):
+    fmt = st.radio("Export format", FORMATS, horizontal=True, key=f"{key}_export_format")
+    for col, table in zip(st.columns(len(tables)), tables):
+        if table == "library" and fmt == "csv":
+            col.button(f"📤 {table}", disabled=True, help="The library nests flavors; pick JSON or JSONL.", key=f"{key}_{table}_csv")
+            continue
+        col.download_button(f"📤 {table}", functools.partial(export_file, table, fmt), file_name=f"{table}.{fmt}", on_click="ignore", key=f"{key}_{table}")
+
+def stage_upload(upload):
+    """Copy an upload to a temp file a background job can read; the job deletes it when done."""
+    upload.seek(0)
+    fd, path = tempfile.mkstemp(prefix="mixlab-import-", suffix=os.path.splitext(upload.name)[1])
+    with os.fdopen(fd, "wb") as f:
+        shutil.copyfileobj(upload, f)
+    return path
+
+def show_import_report(report):
+    """Summarize an ImportReport.to_dict() from a finished import job."""
+    written = ", ".join(f"{n:,} {table}" for table, n in report['written'].items()) or "nothing"
+    st.success(f"Imported {written}; {report['updated']:,} updated, {report['skipped']:,} skipped as duplicates.")
+    if report['error_count']:
+        shown = f" (first {len(report['errors'])} shown)" if report['error_count'] > len(report['errors']) else ""
+        st.warning(f"{report['error_count']:,} rows were rejected{shown}:")
+        st.dataframe(pd.DataFrame(report['errors']), use_container_width=True, hide_index=True)
+
+# --- Background Jobs ---
+JOB_POLL_SECONDS = 2
+LEADERBOARD_INLINE_LIMIT = 5_000 # Bigger libraries get their VapeSim leaderboard from a background job
+JOB_STATE_ICONS = {'queued': "⏸️", 'running': "⏳", 'done': "✅", 'failed': "❌", 'cancelled': "🚫"}
+
+def job_owner():
+    """An id for this browser session, used for the per-owner job cap."""
+    if "job_owner" not in st.session_state:
+        st.session_state.job_owner = uuid.uuid4().hex
+    return st.session_state.job_owner
+
+def submit_job(kind, params=None):
+    """Queue a background job for this session; returns its id, or None after showing why not."""
+    try:
+        job_id = get_job_runner().submit(kind, params, owner=job_owner())
+    except JobLimitError as e:
+        st.warning(str(e))
+        return None
+    st.success(f"Started **{JOB_KINDS[kind][0]}** as job #{job_id}; follow it under Background Jobs in the sidebar.")
+    return job_id
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_active_jobs():
+    active = [j for j in recent_jobs() if j['state'] in ACTIVE_STATES]
+    if not active:
+        st.rerun() # Everything finished: rerun the app so the pages pick up the results
+    for j in active:
+        st.progress(j['progress'], text=f"{JOB_STATE_ICONS[j['state']]} #{j['id']} {JOB_KINDS[j['kind']][0]}: {j['message'] or j['state']}")
+        if st.button("Cancel", key=f"cancel_job_{j['id']}"):
+            get_job_runner().cancel(j['id'])
+
+def render_jobs_panel():
+    jobs = recent_jobs()
+    active = any(j['state'] in ACTIVE_STATES for j in jobs)
+    with st.expander("🧵 Background Jobs", expanded=active):
+        if not jobs:
+            st.caption("No background jobs yet.")
+            return
+        if active:
+            # Only poll while something is running
+            render_active_jobs()
+        for j in jobs:
+            if j['state'] in ACTIVE_STATES:
+                continue
+            st.caption(f"{JOB_STATE_ICONS[j['state']]} #{j['id']} {JOB_KINDS[j['kind']][0]} · {j['finished_at']}")
+            if j['error']:
+                st.caption(f"↳ {j['error']}")
+            elif j['kind'] == 'import' and j['state'] == 'done':
+                with st.popover("Import report"):
+                    show_import_report(job_result(j['id']))
 
 
 # --- UI Rendering ---
 
-# --- Sidebar ---
-with st.sidebar:
-    st.title("🧪 MixLab")
-    st.markdown("---")
-
-    # Module 6: Quick Mix Assistant
+# --- Module 6: Quick Mix Assistant (sidebar) ---
+@st.fragment
+@profiled("💡 Quick Mix")
+def render_quick_mix():
     st.header("💡 Quick Mix Assistant")
     profile_input = st.text_input("Describe your desired flavor profile", placeholder="e.g., Creamy strawberry shortcake")
+    mode = st.radio("Mode", ["Quick pick", "Best of many"], horizontal=True, key="quick_mix_mode",
+                    help="Best of many samples thousands of candidate recipes and keeps the ones VapeSim and the synergy rules score highest.")
+    if mode == "Best of many":
+        n_candidates = st.select_slider("Candidates", CANDIDATE_CHOICES, value=5_000)
+        budget = st.slider("Time budget (s)", 0.5, 10.0, 2.0, step=0.5)
+    seed = st.number_input("Seed (optional)", min_value=0, step=1, value=None, help="Reuse a seed to get the same suggestion again.")
     if st.button("Generate Recipe Suggestion"):
-        with st.spinner("Asking the AI chef..."):
-            time.sleep(1) # Simulate AI thinking
-            stash_df = pd.DataFrame(run_query("SELECT name, category FROM flavor_stash", fetch="all"), columns=['name', 'category'])
-            if stash_df.empty:
-                st.warning("Your flavor stash is empty! Add flavors to get suggestions.")
+        catalog = get_flavor_catalog()
+        if not len(catalog):
+            st.warning("Your flavor stash is empty! Add flavors to get suggestions.")
+        else:
+            st.subheader("AI Suggested Recipe:")
+            if seed is None:
+                seed = random.randrange(1_000_000)
+            if mode == "Quick pick":
+                suggested_flavors, steep_days = suggest_recipe(profile_input, seed=int(seed))
+                suggestions = [{'flavors': suggested_flavors, 'steep_days': steep_days}] if suggested_flavors else []
             else:
-                st.subheader("AI Suggested Recipe:")
-                keywords = profile_input.lower().split()
-                
-                # Simple keyword matching logic
-                suggested_flavors = []
-                if any(k in keywords for k in ['strawberry', 'berry', 'fruit']):
-                    fruit_flavors = stash_df[stash_df['category'] == 'Fruit']
-                    if not fruit_flavors.empty:
-                        suggested_flavors.append({'name': fruit_flavors.sample(1).iloc[0]['name'], 'pct': round(random.uniform(2.5, 5.0), 1)})
-
-                if any(k in keywords for k in ['creamy', 'custard', 'milk']):
-                    cream_flavors = stash_df[stash_df['category'].isin(['Cream', 'Custard'])]
-                    if not cream_flavors.empty:
-                        suggested_flavors.append({'name': cream_flavors.sample(1).iloc[0]['name'], 'pct': round(random.uniform(3.0, 6.0), 1)})
-
-                if any(k in keywords for k in ['cake', 'bakery', 'biscuit', 'shortcake']):
-                    bakery_flavors = stash_df[stash_df['category'] == 'Bakery']
-                    if not bakery_flavors.empty:
-                        suggested_flavors.append({'name': bakery_flavors.sample(1).iloc[0]['name'], 'pct': round(random.uniform(1.0, 3.0), 1)})
-
-                if not suggested_flavors:
-                    st.error("Couldn't find matching flavors in your stash for that profile.")
-                else:
-                    for flav in suggested_flavors:
-                        st.write(f"- **{flav['name']}**: {flav['pct']}%")
-                    st.info(f"**Suggested Steep Time:** {random.choice([7, 14, 21])} days")
-
-
-# --- Main Content Tabs ---
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-    "📋 Recipe Manager", "🫙 Flavor Stash", "⏳ Steep Tracker",
-    "🤖 VapeSim AI", "🔥 Synergy Matrix", "↔️ Recipe Diff Tool"
-])
+                suggestions, search_stats = generate_recipes(profile_input, n_candidates, k=3, budget=budget, seed=int(seed))
+            if not suggestions and mode == "Best of many" and search_stats['timed_out']:
+                st.error("The search ran out of time before any candidates came back. Try again or raise the time budget.")
+            elif not suggestions:
+                st.error("Couldn't find matching flavors in your stash for that profile.")
+            for rank, suggestion in enumerate(suggestions, start=1):
+                if 'score' in suggestion:
+                    st.markdown(f"**#{rank}** · score {suggestion['score']:.2f} · synergy {suggestion['synergy']:.2f} · "
+                                f"sweetness {suggestion['sweetness']:.0f} · density {suggestion['density']:.0f}")
+                for flav in suggestion['flavors']:
+                    st.write(f"- **{flav['name']}**: {flav['pct']}%")
+                st.info(f"**Suggested Steep Time:** {suggestion['steep_days']} days")
+            if suggestions and mode == "Best of many":
+                st.caption(f"Seed {seed} · best of {search_stats['valid']:,} valid candidates "
+                           f"({search_stats['drawn']:,} drawn in {search_stats['elapsed']:.2f} s)")
+            elif suggestions:
+                st.caption(f"Seed {seed}")
 
 
 # --- Module 1: Recipe Input & Manager ---
-with tab1:
+def reset_recipe_page():
+    st.session_state.recipe_page = 1
+
+@st.fragment
+@profiled("📋 Recipe Manager")
+def render_recipe_manager():
     st.header("📋 Recipe Manager")
     
-    # Fetch all recipes for display
-    recipes_list = run_query("SELECT id, name, steep_days, status FROM recipes ORDER BY created_at DESC", fetch="all")
-    recipes_df = pd.DataFrame(recipes_list, columns=["ID", "Name", "Steep Days", "Status"])
-
     col1, col2 = st.columns([3, 2])
 
     with col1:
+        # Imports run as background jobs; the app reruns when they finish so the list shows the new recipes
+        with st.expander("📥 Import / 📤 Export"):
+            upload = st.file_uploader("Recipes file, or a library file with nested flavors", type=UPLOAD_TYPES, key="recipes_upload")
+            flavor_upload = st.file_uploader("Recipe flavors file (recipe_id, flavor_name, percentage)", type=UPLOAD_TYPES, key="recipe_flavors_upload")
+            if upload is not None and st.button("📥 Import Recipes"):
+                submit_job('import', {'target': 'recipes', 'path': stage_upload(upload), 'cleanup': True,
+                                      'flavors_path': stage_upload(flavor_upload) if flavor_upload is not None else None})
+            render_export_buttons(["recipes", "recipe_flavors", "library"], key="recipes")
+
         st.subheader("All Recipes")
+        # Fetch only the visible page of recipes, optionally narrowed by full-text search
+        scols = st.columns([3, 1, 1])
+        search = scols[0].text_input("Search", placeholder="Name, notes or flavor", key="recipe_search", on_change=reset_recipe_page)
+        page_size = scols[1].selectbox("Per page", RECIPE_PAGE_SIZES, key="recipe_page_size", on_change=reset_recipe_page)
+        page = scols[2].number_input("Page", min_value=1, step=1, key="recipe_page") - 1
+        recipes_list, total = search_recipes(search, page, page_size)
+        recipes_df = pd.DataFrame(recipes_list, columns=["ID", "Name", "Steep Days", "Status"])
+        names_by_id = {r_id: name for r_id, name, _, _ in recipes_list}
+
         if not recipes_df.empty:
+            st.caption(f"Showing {page * page_size + 1}–{page * page_size + len(recipes_df)} of {total}")
             st.dataframe(recipes_df, use_container_width=True, hide_index=True)
+        elif search and not total:
+            st.info(f"No recipes match '{search}'.")
+        elif total:
+            st.info(f"Page {page + 1} is past the end of the list ({-(-total // page_size)} pages).")
         else:
             st.info("No recipes yet. Add one to get started!")
 
         st.subheader("Recipe Actions")
         if not recipes_df.empty:
-            selected_recipe_id = st.selectbox("Select Recipe for Actions", options=recipes_df['ID'], format_func=lambda x: recipes_df[recipes_df['ID'] == x]['Name'].iloc[0])
+            selected_recipe_id = st.selectbox("Select Recipe for Actions", options=list(names_by_id), format_func=names_by_id.get)
             
             action_cols = st.columns(4)
             
             # Delete
             if action_cols[0].button("🗑️ Delete"):
-                run_query("DELETE FROM recipes WHERE id=?", (selected_recipe_id,))
+                get_recipe_repository().delete(selected_recipe_id)
+                sync_similarity_index(selected_recipe_id)
                 st.success(f"Recipe ID {selected_recipe_id} deleted.")
                 st.rerun()
 
             # Duplicate
             if action_cols[1].button("👯 Duplicate"):
-                orig_recipe = run_query("SELECT name, notes, steep_days FROM recipes WHERE id=?", (selected_recipe_id,), fetch="one")
-                orig_flavors = run_query("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=?", (selected_recipe_id,), fetch="all")
-                
-                new_name = f"{orig_recipe[0]} (Copy)"
-                run_query("INSERT INTO recipes (name, notes, steep_days, status) VALUES (?, ?, ?, ?)", (new_name, orig_recipe[1], orig_recipe[2], 'Steeping'))
-                new_recipe_id = run_query("SELECT last_insert_rowid()", fetch="one")[0]
-                
-                for flav_name, pct in orig_flavors:
-                    run_query("INSERT INTO recipe_flavors (recipe_id, flavor_name, percentage) VALUES (?, ?, ?)", (new_recipe_id, flav_name, pct))
-                
-                st.success(f"Duplicated '{orig_recipe[0]}' as '{new_name}'.")
-                st.rerun()
+                duplicated = get_recipe_repository().duplicate(selected_recipe_id)
+                if duplicated is None:
+                    st.error("That recipe no longer exists.")
+                else:
+                    sync_similarity_index(duplicated[0])
+                    st.success(f"Duplicated as '{duplicated[1]}'.")
+                    st.rerun()
 
             # Export to Text
             if action_cols[2].button("📋 Export to Text"):
-                recipe_info = run_query("SELECT name, notes FROM recipes WHERE id=?", (selected_recipe_id,), fetch="one")
-                flavor_info = run_query("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=?", (selected_recipe_id,), fetch="all")
-                
-                export_str = f"--- {recipe_info[0]} ---\n"
-                if recipe_info[1]:
-                    export_str += f"Notes: {recipe_info[1]}\n\n"
-                for name, pct in flavor_info:
-                    export_str += f"- {name}: {pct}%\n"
-                
-                st.code(export_str)
+                export_str = recipe_text(selected_recipe_id)
+                if export_str is None:
+                    st.error("That recipe no longer exists.")
+                else:
+                    st.code(export_str)
+
+            # Find Similar
+            similarity_metric = st.radio("Similarity metric", SIMILARITY_METRICS, horizontal=True, key="similarity_metric")
+            if action_cols[3].button("🔎 Similar"):
+                results = get_similarity_index().nearest_to_recipe(int(selected_recipe_id), k=5, metric=similarity_metric)
+                if not results:
+                    st.info("No other recipes share flavors with this one.")
+                else:
+                    st.dataframe(similar_recipes_frame(results, recipe_names(r_id for r_id, _ in results)), use_container_width=True, hide_index=True)
 
     with col2:
         st.subheader("Create or Edit Recipe")
@@ -302,11 +382,11 @@ with tab1:
         flavor_options = [s[0] for s in stash] if stash else []
 
         with st.form("recipe_form"):
-            recipe_id_to_edit = st.selectbox("Edit Existing Recipe (Optional)", ["New Recipe"] + list(recipes_df['ID']), format_func=lambda x: "New Recipe" if x == "New Recipe" else recipes_df[recipes_df['ID'] == x]['Name'].iloc[0])
+            recipe_id_to_edit = st.selectbox("Edit Existing Recipe (Optional)", ["New Recipe"] + list(names_by_id), format_func=lambda x: "New Recipe" if x == "New Recipe" else names_by_id[x])
 
             if recipe_id_to_edit != "New Recipe":
                 # Load existing recipe data
-                recipe_data = run_query("SELECT name, notes, steep_days FROM recipes WHERE id=?", (recipe_id_to_edit,), fetch="one")
+                recipe_data = run_query("SELECT name, notes, steep_days, version FROM recipes WHERE id=?", (recipe_id_to_edit,), fetch="one")
                 flavor_data = run_query("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=?", (recipe_id_to_edit,), fetch="all")
                 
                 recipe_name = st.text_input("Recipe Name", value=recipe_data[0])
@@ -316,6 +396,7 @@ with tab1:
                 if 'flavors' not in st.session_state or st.session_state.get('editing_id') != recipe_id_to_edit:
                     st.session_state.flavors = [{'name': f[0], 'percentage': f[1]} for f in flavor_data]
                     st.session_state.editing_id = recipe_id_to_edit
+                    st.session_state.editing_version = recipe_data[3] # Saving is refused if someone else saves first
             else:
                 # New recipe form
                 recipe_name = st.text_input("Recipe Name", placeholder="My Awesome Creation")
@@ -333,17 +414,18 @@ with tab1:
                 cols = st.columns([4, 2, 1])
                 st.session_state.flavors[i]['name'] = cols[0].selectbox(f"Flavor {i+1}", flavor_options, index=flavor_options.index(flavor['name']) if flavor['name'] in flavor_options else 0, key=f"name_{i}")
                 st.session_state.flavors[i]['percentage'] = cols[1].number_input("%", min_value=0.0, max_value=25.0, value=flavor['percentage'], step=0.1, key=f"pct_{i}", label_visibility="collapsed")
-                if cols[2].button("❌", key=f"del_{i}"):
+                if cols[2].form_submit_button("❌", key=f"del_{i}"):
                     st.session_state.flavors.pop(i)
                     st.rerun()
 
-            if st.button("Add Flavor"):
+            if st.form_submit_button("Add Flavor"):
                 if flavor_options:
                     st.session_state.flavors.append({'name': flavor_options[0], 'percentage': 1.0})
                 else:
                     st.warning("Please add flavors to your stash first!")
                 st.rerun()
 
+            find_similar = st.form_submit_button("🔎 Find Similar Recipes")
             submitted = st.form_submit_button("💾 Save Recipe")
 
             if submitted:
@@ -351,35 +433,58 @@ with tab1:
                     st.error("Recipe name and at least one flavor are required.")
                 else:
                     steep_end_date = (datetime.datetime.now() + datetime.timedelta(days=steep_days)).isoformat()
+                    repository = get_recipe_repository()
                     if recipe_id_to_edit == "New Recipe":
-                        run_query("INSERT INTO recipes (name, notes, steep_days, steep_end_date) VALUES (?, ?, ?, ?)", (recipe_name, recipe_notes, steep_days, steep_end_date))
-                        new_recipe_id = run_query("SELECT last_insert_rowid()", fetch="one")[0]
-                        for f in st.session_state.flavors:
-                           run_query("INSERT INTO recipe_flavors (recipe_id, flavor_name, percentage) VALUES (?, ?, ?)", (new_recipe_id, f['name'], f['percentage']))
+                        saved_id = repository.create(recipe_name, recipe_notes, steep_days, steep_end_date, st.session_state.flavors)
                         st.success(f"Recipe '{recipe_name}' saved!")
                     else: # Updating
-                        run_query("UPDATE recipes SET name=?, notes=?, steep_days=?, steep_end_date=? WHERE id=?", (recipe_name, recipe_notes, steep_days, steep_end_date, recipe_id_to_edit))
-                        # Clear old flavors and add new ones
-                        run_query("DELETE FROM recipe_flavors WHERE recipe_id=?", (recipe_id_to_edit,))
-                        for f in st.session_state.flavors:
-                           run_query("INSERT INTO recipe_flavors (recipe_id, flavor_name, percentage) VALUES (?, ?, ?)", (recipe_id_to_edit, f['name'], f['percentage']))
-                        st.success(f"Recipe '{recipe_name}' updated!")
-                    
+                        try:
+                            repository.update(recipe_id_to_edit, recipe_name, recipe_notes, steep_days, steep_end_date, st.session_state.flavors,
+                                              version=st.session_state.get('editing_version'))
+                        except StaleWriteError as e:
+                            saved_id = None
+                            st.error(str(e))
+                        else:
+                            saved_id = recipe_id_to_edit
+                            st.success(f"Recipe '{recipe_name}' updated!")
+
                     st.session_state.flavors = []
-                    st.session_state.editing_id = None
-                    st.rerun()
+                    st.session_state.editing_id = None # After a refused save, the next run reloads the recipe as it is now
+                    if saved_id is not None:
+                        sync_similarity_index(saved_id)
+                        st.rerun()
+
+        if find_similar:
+            draft = [(f['name'], f['percentage']) for f in st.session_state.flavors]
+            exclude_id = None if recipe_id_to_edit == "New Recipe" else int(recipe_id_to_edit)
+            results = get_similarity_index().nearest(draft, k=5, metric=st.session_state.get("similarity_metric", "Cosine"), exclude_id=exclude_id)
+            st.write("**Closest saved recipes**")
+            if not draft:
+                st.info("Add flavors to the draft to find similar recipes.")
+            elif not results:
+                st.info("No saved recipes share flavors with this draft.")
+            else:
+                st.dataframe(similar_recipes_frame(results, recipe_names(r_id for r_id, _ in results)), use_container_width=True, hide_index=True)
 
 # --- Module 2: Flavor Stash Editor ---
-with tab2:
+@st.fragment
+@profiled("🫙 Flavor Stash")
+def render_flavor_stash():
     st.header("🫙 Flavor Stash")
     st.info("Manage your personal inventory of flavor concentrates here. This list powers the autocomplete in the recipe manager and AI analysis.")
-    
-    # Pre-defined categories for consistency
-    CATEGORIES = ['Fruit', 'Cream', 'Custard', 'Bakery', 'Menthol', 'Sweetener', 'Tobacco', 'Beverage', 'Other']
 
+    # Imports run as background jobs; the app reruns when they finish so the editor shows the new rows
+    with st.expander("📥 Import / 📤 Export"):
+        upload = st.file_uploader("Stash file (name, brand, category)", type=UPLOAD_TYPES, key="stash_upload")
+        update_existing = st.checkbox("Update brand and category of flavors already in the stash", key="stash_upload_update")
+        if upload is not None and st.button("📥 Import Stash"):
+            submit_job('import', {'target': 'stash', 'path': stage_upload(upload), 'cleanup': True,
+                                  'on_duplicate': "update" if update_existing else "skip"})
+        render_export_buttons(["flavor_stash"], key="stash")
+    
     # Load stash into a DataFrame
-    stash_data = run_query("SELECT id, name, brand, category FROM flavor_stash ORDER BY name", fetch="all")
-    stash_df = pd.DataFrame(stash_data, columns=['id', 'Name', 'Brand', 'Category'])
+    stash_data = run_query("SELECT id, name, brand, category, version FROM flavor_stash ORDER BY name", fetch="all")
+    stash_df = pd.DataFrame(stash_data, columns=['id', 'Name', 'Brand', 'Category', 'version'])
 
     # Use st.data_editor for a spreadsheet-like experience
     edited_df = st.data_editor(
@@ -388,6 +493,7 @@ with tab2:
         use_container_width=True,
         column_config={
             "id": None, # Hide the ID column
+            "version": None,
             "Name": st.column_config.TextColumn("Flavor Name", required=True),
             "Brand": st.column_config.TextColumn("Brand (e.g., TFA, CAP)"),
             "Category": st.column_config.SelectboxColumn("Category", options=CATEGORIES, required=True)
@@ -396,47 +502,61 @@ with tab2:
     )
 
     if st.button("💾 Save Stash Changes"):
-        # Simple diffing logic to update the database
-        try:
-            # Drop rows that were deleted in the UI
-            deleted_ids = set(stash_df['id']) - set(edited_df[edited_df['id'].notna()]['id'])
-            for del_id in deleted_ids:
-                run_query("DELETE FROM flavor_stash WHERE id=?", (int(del_id),))
-
-            # Iterate through the edited dataframe to add/update
-            for _, row in edited_df.iterrows():
-                if pd.notna(row['id']): # Update existing row
-                    run_query("UPDATE flavor_stash SET name=?, brand=?, category=? WHERE id=?", (row['Name'], row['Brand'], row['Category'], int(row['id'])))
-                else: # Add new row
-                    run_query("INSERT INTO flavor_stash (name, brand, category) VALUES (?, ?, ?)", (row['Name'], row['Brand'], row['Category']))
-            
-            st.success("Flavor stash updated successfully!")
-            time.sleep(1) # Give user time to see success message
-            st.rerun()
-
-        except Exception as e:
-            st.error(f"An error occurred: {e}. A common issue is trying to add a flavor name that already exists.")
+        inserts, updates, deletes = compute_stash_changes(stash_df, edited_df)
+        errors = validate_stash_changes(stash_df, inserts, updates, deletes)
+        if errors:
+            st.error("No changes were saved. Fix these rows and try again:")
+            st.dataframe(pd.DataFrame(errors), use_container_width=True, hide_index=True)
+        elif inserts.empty and updates.empty and not deletes:
+            st.info("No changes to save.")
+        else:
+            try:
+                apply_stash_changes(get_writer(), inserts, updates, deletes, versions=dict(zip(stash_df['id'], stash_df['version'])))
+            except StaleWriteError as e:
+                st.error(str(e))
+            except sqlite3.IntegrityError as e:
+                st.error(f"The stash changed while you were editing, so nothing was saved: {e}")
+            else:
+                get_flavor_catalog().invalidate()
+                get_similarity_index().invalidate() # Renames propagate into recipe_flavors
+                st.success(f"Flavor stash updated: {len(inserts)} added, {len(updates)} changed, {len(deletes)} removed.")
+                time.sleep(1) # Give user time to see success message
+                st.rerun()
 
 # --- Module 3: Steep Timer Tracker ---
-with tab3:
+@st.fragment
+@profiled("⏳ Steep Tracker")
+def render_steep_tracker():
     st.header("⏳ Steep Timer Tracker")
     st.info("Track the steeping progress of your recipes.")
     
-    # Fetch recipes with steep times
-    steeping_recipes = run_query("SELECT id, name, steep_days, steep_end_date, status FROM recipes WHERE steep_days > 0 ORDER BY steep_end_date", fetch="all")
+    get_steep_sweeper().sweep()
+
+    fcols = st.columns([3, 1, 1])
+    steep_filter = fcols[0].radio("Show", STEEP_FILTERS, horizontal=True, key="steep_filter")
+    page_size = fcols[1].selectbox("Per page", STEEP_PAGE_SIZES, key="steep_page_size")
+    page = fcols[2].number_input("Page", min_value=1, value=1, step=1, key="steep_page") - 1
+
+    # Fetch only the visible page of recipes with steep times
+    steeping_recipes, total = fetch_steep_page(steep_filter, page, page_size)
     
-    if not steeping_recipes:
+    if not total and steep_filter == "All":
         st.warning("No recipes are currently steeping. Create a recipe with a steep time greater than 0.")
+    elif not total:
+        st.info(f"No recipes match '{steep_filter}'.")
+    elif not steeping_recipes:
+        st.info(f"Page {page + 1} is past the end of the list ({-(-total // page_size)} pages).")
     else:
+        st.caption(f"Showing {page * page_size + 1}–{page * page_size + len(steeping_recipes)} of {total}")
+        now = datetime.datetime.now()
         for r_id, name, steep_days, end_date_str, status in steeping_recipes:
             with st.expander(f"**{name}** - Status: **{status}**"):
-                end_date = datetime.datetime.fromisoformat(end_date_str)
-                now = datetime.datetime.now()
+                end_date = datetime.datetime.fromisoformat(end_date_str) if end_date_str else None
                 
-                if now >= end_date:
+                if end_date is None:
+                    st.write("**Steep End Date:** not set")
+                elif now >= end_date:
                     st.success("🎉 This recipe is ready!")
-                    if status != "Ready":
-                        run_query("UPDATE recipes SET status='Ready' WHERE id=?", (r_id,))
                 else:
                     time_left = end_date - now
                     days_left = time_left.days
@@ -449,17 +569,19 @@ with tab3:
                     # Visual Countdown
                     total_duration_seconds = steep_days * 24 * 3600
                     elapsed_seconds = total_duration_seconds - time_left.total_seconds()
-                    progress = min(1.0, elapsed_seconds / total_duration_seconds)
+                    progress = max(0.0, min(1.0, elapsed_seconds / total_duration_seconds))
                     st.progress(progress)
 
                 # Status update
                 new_status = st.radio("Update Status", ["Steeping", "Ready"], index=0 if status == "Steeping" else 1, key=f"status_{r_id}", horizontal=True)
                 if new_status != status:
-                    run_query("UPDATE recipes SET status=? WHERE id=?", (new_status, r_id))
+                    get_writer().write(lambda conn: conn.execute("UPDATE recipes SET status=? WHERE id=?", (new_status, r_id)))
                     st.rerun()
 
 # --- Module 4: VapeSim AI Integration ---
-with tab4:
+@st.fragment
+@profiled("🤖 VapeSim AI")
+def render_vapesim():
     st.header("🤖 VapeSim AI Analysis")
     st.info("Select a saved recipe to simulate its flavor profile, balance, and other characteristics.")
 
@@ -476,8 +598,7 @@ with tab4:
             flavors_for_ai = [{'flavor_name': f[0], 'percentage': f[1]} for f in flavors_list]
             
             with st.spinner("Simulating flavor molecules..."):
-                time.sleep(1) # Simulate processing
-                analysis_results = vapesim_analyze(flavors_for_ai)
+                analysis_results = vapesim_analyze_cached(flavors_for_ai)
             
             st.subheader("VapeSim™ Report")
             
@@ -498,167 +619,247 @@ with tab4:
             with col2:
                 # Balance Chart
                 st.subheader("Flavor Balance (Top/Mid/Base/Accent)")
-                balance_df = pd.DataFrame(list(analysis_results['balance'].items()), columns=['Note', 'Percentage'])
-                fig = go.Figure(go.Bar(
-                    x=balance_df['Percentage'],
-                    y=balance_df['Note'],
-                    orientation='h',
-                    marker_color=['#76D7C4', '#F7DC6F', '#E59866', '#D7BDE2']
-                ))
-                fig.update_layout(title="Profile Balance by Note", xaxis_title="Total Percentage (%)", yaxis_title="Note", template="plotly_dark")
-                st.plotly_chart(fig, use_container_width=True)
+                fig = balance_figure(analysis_results['balance'])
+                plotly_chart(fig, use_container_width=True)
 
             # Steep Curve Projection
             st.subheader("Steep Curve Projection")
-            steep_df = pd.DataFrame(analysis_results['steep_curve'])
-            steep_fig = go.Figure(go.Scatter(
-                x=steep_df['Day'], y=steep_df['Flavor'], mode='lines+markers',
-                line=dict(color='#00A36C', width=3)
-            ))
-            steep_fig.update_layout(title="Flavor Meld Over Time", xaxis_title="Days Steeping", yaxis_title="Flavor Profile Maturity (%)", yaxis_range=[0,100], template="plotly_dark")
-            st.plotly_chart(steep_fig, use_container_width=True)
+            steep_fig = steep_curve_figure(analysis_results['steep_curve'])
+            plotly_chart(steep_fig, use_container_width=True)
+
+        # Library Leaderboard
+        st.subheader("🏆 Library Leaderboard")
+        rank_by = st.selectbox("Rank by", list(LEADERBOARD_RANKINGS))
+        sort_column, ascending = LEADERBOARD_RANKINGS[rank_by]
+        n_recipes = run_query("SELECT COUNT(*) FROM recipes", fetch="one")[0]
+        if n_recipes <= LEADERBOARD_INLINE_LIMIT:
+            st.caption("Every saved recipe scored in one pass. Click a column header to re-sort.")
+            leaderboard = vapesim_batch(load_vapesim_frame()).sort_values(sort_column, ascending=ascending, kind='stable')
+        else:
+            # Too big to score on every rerun; a background job keeps the top of each ranking
+            latest = latest_result('vapesim_library')
+            if st.button("🔄 Rescore the library in the background"):
+                submit_job('vapesim_library')
+            if latest is None:
+                st.info(f"Your library has {n_recipes:,} recipes. Score it in the background to see the leaderboard.")
+                return
+            finished_at, result = latest
+            st.caption(f"Top {len(result['rankings'][rank_by])} of {result['recipes']:,} recipes, scored {finished_at}.")
+            leaderboard = pd.DataFrame(result['rankings'][rank_by])
+        st.dataframe(
+            leaderboard[['recipe_name', 'sweetness', 'density', 'total_pct', *NOTES, 'warning_count', 'summary']],
+            column_config={
+                'recipe_name': "Recipe", 'sweetness': st.column_config.NumberColumn("Sweetness", format="%.0f"),
+                'density': st.column_config.NumberColumn("Density", format="%.0f"),
+                'total_pct': st.column_config.NumberColumn("Total %", format="%.1f"),
+                'warning_count': "Warnings", 'summary': "Summary",
+            },
+            use_container_width=True,
+            hide_index=True
+        )
 
 
 # --- Module 5: Flavor Synergy Heatmap ---
-with tab5:
+@st.fragment
+@profiled("🔥 Synergy Matrix")
+def render_synergy():
     st.header("🔥 Flavor Synergy Heatmap")
     st.info("Visualize which flavors in your stash might work well together. The 'synergy score' is a mock calculation based on classic pairing categories.")
 
-    stash = run_query("SELECT name, category FROM flavor_stash", fetch="all")
-    if len(stash) < 2:
+    catalog = get_flavor_catalog()
+    n_flavors = len(catalog)
+    if n_flavors < 2:
         st.warning("You need at least two flavors in your stash to generate a synergy matrix.")
     else:
-        flavor_names = [f[0] for f in stash]
-        flavor_categories = {f[0]: f[1] for f in stash}
-
-        # Mock synergy logic
-        def get_synergy(cat1, cat2):
-            if cat1 == cat2: return 0.3 # e.g., two fruits
-            if (cat1 in ['Fruit'] and cat2 in ['Cream', 'Custard']) or \
-               (cat2 in ['Fruit'] and cat1 in ['Cream', 'Custard']): return 0.9
-            if (cat1 in ['Bakery'] and cat2 in ['Fruit', 'Cream', 'Custard']) or \
-               (cat2 in ['Bakery'] and cat1 in ['Fruit', 'Cream', 'Custard']): return 0.8
-            if (cat1 in ['Tobacco'] and cat2 in ['Cream', 'Custard', 'Bakery']) or \
-               (cat2 in ['Tobacco'] and cat1 in ['Cream', 'Custard', 'Bakery']): return 0.7
-            if (cat1 in ['Menthol'] and cat2 in ['Fruit']) or \
-               (cat2 in ['Menthol'] and cat1 in ['Fruit']): return 0.6
-            if (cat1 in ['Sweetener']) or (cat2 in ['Sweetener']): return 0.5
-            return 0.1 # Low but not zero synergy
-
-        # Create synergy matrix
-        synergy_data = []
-        high_synergy_pairs = []
-        for f1 in flavor_names:
-            row = []
-            for f2 in flavor_names:
-                if f1 == f2:
-                    score = 1.0
-                else:
-                    score = get_synergy(flavor_categories[f1], flavor_categories[f2])
-                    if score > 0.75 and {f1, f2} not in [set(p) for p in high_synergy_pairs]:
-                         high_synergy_pairs.append((f1, f2, score))
-                row.append(score)
-            synergy_data.append(row)
-
         col1, col2 = st.columns([3, 1])
 
         with col1:
             st.subheader("Synergy Matrix")
-            fig = go.Figure(data=go.Heatmap(
-                z=synergy_data,
-                x=flavor_names,
-                y=flavor_names,
-                colorscale='Greens',
-                hoverongaps=False))
-            fig.update_layout(title='Flavor Pairing Potential', template='plotly_dark')
-            st.plotly_chart(fig, use_container_width=True)
+            view = st.radio("View", HEATMAP_VIEWS, index=1 if n_flavors <= HEATMAP_MAX_AXIS else 0, horizontal=True)
+            row_start = col_start = 0
+            size = 50
+            if view == "Window":
+                wcols = st.columns(3)
+                size = wcols[0].number_input("Window size", min_value=5, max_value=200, value=min(50, n_flavors), step=5)
+                row_start = wcols[1].number_input("First row #", min_value=0, max_value=n_flavors - 1, value=0)
+                col_start = wcols[2].number_input("First column #", min_value=0, max_value=n_flavors - 1, value=0)
+            elif view == "Clustered by category" and n_flavors > HEATMAP_MAX_AXIS:
+                st.caption(f"Showing an evenly spaced sample of {HEATMAP_MAX_AXIS} of {n_flavors} flavors. Use the Window view for full detail.")
+
+            fig = build_synergy_figure(catalog.version, view, int(row_start), int(col_start), int(size))
+            plotly_chart(fig, use_container_width=True)
+
+            if view != "Category aggregate":
+                with st.expander("Flavor # lookup"):
+                    names, categories = clustered_stash(catalog.version)
+                    st.dataframe(pd.DataFrame({'Flavor': names, 'Category': categories}), use_container_width=True)
         
         with col2:
             st.subheader("Top Pairings")
-            high_synergy_pairs.sort(key=lambda x: x[2], reverse=True)
+            high_synergy_pairs = cached_top_synergy_pairs(catalog.version)
             if not high_synergy_pairs:
                 st.info("No high-synergy pairs found based on current logic.")
             else:
-                for f1, f2, score in high_synergy_pairs[:10]: # Show top 10
+                for f1, f2, score in high_synergy_pairs: # Show top 10
                     st.success(f"**{f1}** + **{f2}**")
 
+            # The full ranking is a whole-stash scan, so it runs as a background job
+            if st.button("🔄 Rank the top 100 in the background"):
+                submit_job('synergy_pairs', {'k': 100})
+            latest = latest_result('synergy_pairs')
+            if latest is not None:
+                finished_at, result = latest
+                with st.expander(f"Top {len(result['pairs'])} pairings ({finished_at})"):
+                    st.dataframe(pd.DataFrame(result['pairs'], columns=['Flavor', 'Pairs with', 'Score']), hide_index=True)
+
 
 # --- Module 7: Recipe Diff Tool ---
-with tab6:
+DIFF_MODES = ["Recipes", "Versions of one recipe"]
+
+def render_diff_comparison(frame, ids, baseline_id, labels):
+    """Ingredient and VapeSim comparison of the recipes (or versions) in ``frame`` against the baseline."""
+    matrix, deltas = diff_matrix(frame, ids, baseline_id)
+
+    st.subheader("Ingredient Comparison")
+    only_changed = st.checkbox("Only show flavors that differ from the baseline", value=len(ids) > 2)
+
+    delta_labels = {r_id: f"Δ {labels[r_id]}" for r_id in deltas.columns}
+    diff_df = pd.concat([matrix.rename(columns=labels), deltas.rename(columns=delta_labels)], axis=1)
+    if only_changed:
+        diff_df = diff_df[(deltas != 0).any(axis=1)]
+    diff_df = diff_df.rename_axis('Flavor').reset_index()
+
+    def style_diff(val):
+        if val > 0:
+            return f"color: #2ECC71; font-weight: bold;" # Green for increase
+        elif val < 0:
+            return f"color: #E74C3C; font-weight: bold;" # Red for decrease
+        return ""
+
+    st.dataframe(
+        diff_df.style.format({
+            **{label: "{:.2f}%" for label in labels.values()},
+            **{label: "{:+.2f}%" for label in delta_labels.values()},
+        }).map(
+            style_diff, subset=list(delta_labels.values())
+        ),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    # AI Profile Comparison
+    st.subheader("VapeSim Profile Comparison")
+    sims = vapesim_batch(frame).set_index('recipe_id').reindex(ids)
+    profile_df = pd.DataFrame({
+        'Recipe': [labels[r_id] for r_id in ids],
+        'Sweetness': sims['sweetness'].to_numpy(),
+        'Δ Sweetness': (sims['sweetness'] - sims.at[baseline_id, 'sweetness']).to_numpy(),
+        'Density': sims['density'].to_numpy(),
+        'Δ Density': (sims['density'] - sims.at[baseline_id, 'density']).to_numpy(),
+        'Warnings': sims['warning_count'].to_numpy(),
+        'Summary': sims['summary'].to_numpy(),
+    })
+    st.dataframe(
+        profile_df.style.format({
+            'Sweetness': "{:.0f}", 'Density': "{:.0f}", 'Δ Sweetness': "{:+.0f}", 'Δ Density': "{:+.0f}",
+        }).map(
+            style_diff, subset=['Δ Sweetness', 'Δ Density']
+        ),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    flagged = [(r_id, w) for r_id, w in sims['warnings'].items() if w]
+    if flagged:
+        with st.expander("⚠️ Warnings"):
+            for r_id, warnings in flagged:
+                st.markdown(f"**{labels[r_id]}**")
+                for w in warnings: st.write(f"⚠️ {w}")
+
+@st.fragment
+@profiled("↔️ Recipe Diff Tool")
+def render_recipe_diff():
     st.header("↔️ Recipe Diff Tool")
-    st.info("Compare two recipes side-by-side to see differences in ingredients and percentages.")
+    st.info("Compare any number of recipes side-by-side against a baseline, or a recipe against its own earlier versions, to see differences in ingredients and percentages.")
 
     recipes_list = run_query("SELECT id, name FROM recipes ORDER BY name", fetch="all")
-    if len(recipes_list) < 2:
-        st.warning("You need at least two saved recipes to use the comparison tool.")
-    else:
-        recipe_options_df = pd.DataFrame(recipes_list, columns=['id', 'name'])
-        
-        col1, col2 = st.columns(2)
+    names_by_id = dict(recipes_list)
+    mode = st.radio("Compare", DIFF_MODES, horizontal=True, key="diff_mode")
+
+    if mode == "Recipes":
+        if len(recipes_list) < 2:
+            st.warning("You need at least two saved recipes to use the comparison tool.")
+            return
+        col1, col2 = st.columns([3, 1])
         with col1:
-            recipe_a_name = st.selectbox("Select Recipe A", recipe_options_df['name'], key="recipe_a")
+            selected_ids = st.multiselect("Recipes to compare", options=list(names_by_id), default=list(names_by_id)[:2], format_func=names_by_id.get, key="diff_recipes")
         with col2:
-            recipe_b_name = st.selectbox("Select Recipe B", recipe_options_df['name'], key="recipe_b", index=1 if len(recipe_options_df) > 1 else 0)
+            baseline_id = st.selectbox("Baseline", selected_ids, format_func=names_by_id.get, key="diff_baseline") if selected_ids else None
 
-        if recipe_a_name and recipe_b_name:
-            # Fetch data for Recipe A
-            id_a = recipe_options_df[recipe_options_df['name'] == recipe_a_name]['id'].iloc[0]
-            flavors_a = run_query("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=?", (int(id_a),), fetch="all")
-            flavors_a_dict = {f[0]: f[1] for f in flavors_a}
-            
-            # Fetch data for Recipe B
-            id_b = recipe_options_df[recipe_options_df['name'] == recipe_b_name]['id'].iloc[0]
-            flavors_b = run_query("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=?", (int(id_b),), fetch="all")
-            flavors_b_dict = {f[0]: f[1] for f in flavors_b}
-            
-            # Get all unique flavors from both recipes
-            all_flavors = sorted(list(set(flavors_a_dict.keys()) | set(flavors_b_dict.keys())))
-
-            # Create comparison DataFrame
-            diff_data = []
-            for flavor in all_flavors:
-                pct_a = flavors_a_dict.get(flavor, 0)
-                pct_b = flavors_b_dict.get(flavor, 0)
-                diff = pct_b - pct_a
-                diff_data.append([flavor, pct_a, pct_b, diff])
-            
-            diff_df = pd.DataFrame(diff_data, columns=['Flavor', recipe_a_name, recipe_b_name, 'Difference'])
+        if len(selected_ids) < 2:
+            st.info("Select at least two recipes to compare.")
+        else:
+            render_diff_comparison(load_vapesim_frame(selected_ids), selected_ids, baseline_id, recipe_labels(selected_ids, names_by_id))
+        return
 
-            st.subheader("Ingredient Comparison")
+    # Versions of one recipe, rebuilt from its saved history
+    if not recipes_list:
+        st.warning("You need a saved recipe to compare its versions.")
+        return
+    recipe_id = st.selectbox("Recipe", options=list(names_by_id), format_func=names_by_id.get, key="diff_history_recipe")
+    history = recipe_history(recipe_id)
+    if len(history) < 2:
+        st.info("This recipe has no earlier versions yet. A version is kept every time it is saved.")
+        return
+    version_labels = {h['version']: f"v{h['version']} · {h['saved_at']}" for h in history}
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        selected_versions = st.multiselect("Versions to compare", options=list(version_labels), default=[history[1]['version'], history[0]['version']],
+                                           format_func=version_labels.get, key=f"diff_versions_{recipe_id}")
+    with col2:
+        baseline_version = st.selectbox("Baseline", selected_versions, format_func=version_labels.get, key=f"diff_version_baseline_{recipe_id}") if selected_versions else None
+    with st.expander(f"History ({len(history)} versions)"):
+        st.dataframe(pd.DataFrame(history).rename(columns={'version': 'Version', 'saved_at': 'Saved', 'summary': 'Changes'}), hide_index=True)
 
-            def style_diff(val):
-                if val > 0:
-                    return f"color: #2ECC71; font-weight: bold;" # Green for increase
-                elif val < 0:
-                    return f"color: #E74C3C; font-weight: bold;" # Red for decrease
-                return ""
+    if len(selected_versions) < 2:
+        st.info("Select at least two versions to compare.")
+    else:
+        selected_versions = sorted(selected_versions)
+        frame = versions_frame(recipe_versions(recipe_id, selected_versions))
+        render_diff_comparison(frame, selected_versions, baseline_version, {v: version_labels[v] for v in selected_versions})
+
+
+# --- Navigation ---
+# Only the selected module runs on a rerun, and widgets inside a module rerun just
+# that module's fragment, so one page costs one module rather than all of them.
+MODULES = {
+    "📋 Recipe Manager": render_recipe_manager,
+    "🫙 Flavor Stash": render_flavor_stash,
+    "⏳ Steep Tracker": render_steep_tracker,
+    "🤖 VapeSim AI": render_vapesim,
+    "🔥 Synergy Matrix": render_synergy,
+    "↔️ Recipe Diff Tool": render_recipe_diff,
+}
 
-            st.dataframe(
-                diff_df.style.format({
-                    recipe_a_name: "{:.2f}%",
-                    recipe_b_name: "{:.2f}%",
-                    "Difference": "{:+.2f}%"
-                }).applymap(
-                    style_diff, subset=['Difference']
-                ),
-                use_container_width=True,
-                hide_index=True
-            )
+with st.sidebar:
+    st.title("🧪 MixLab")
+    module = st.radio("Go to:", list(MODULES), key="module")
+    if PROFILING:
+        profiling.current().label = module
+    st.markdown("---")
+    render_quick_mix()
 
-            # AI Profile Comparison
-            st.subheader("VapeSim Profile Comparison")
-            sim_a = vapesim_analyze([{'flavor_name': k, 'percentage': v} for k, v in flavors_a_dict.items()])
-            sim_b = vapesim_analyze([{'flavor_name': k, 'percentage': v} for k, v in flavors_b_dict.items()])
-
-            c1, c2 = st.columns(2)
-            with c1:
-                st.markdown(f"**{recipe_a_name} Profile**")
-                st.write(sim_a['summary'])
-                if sim_a['warnings']:
-                    for w in sim_a['warnings']: st.write(f"⚠️ {w}")
-            
-            with c2:
-                st.markdown(f"**{recipe_b_name} Profile**")
-                st.write(sim_b['summary'])
-                if sim_b['warnings']:
-                    for w in sim_b['warnings']: st.write(f"⚠️ {w}")
\ No newline at end of file
+    st.markdown("---")
+    render_jobs_panel()
+    with st.expander("🗄️ Query Cache"):
+        cache_stats = get_query_cache().stats()
+        st.write(f"**Hit rate:** {cache_stats['hit_rate']:.0%} ({cache_stats['hits']} hits / {cache_stats['misses']} misses)")
+        st.write(f"**Entries:** {cache_stats['entries']} · {cache_stats['bytes'] / 1024 / 1024:.1f} MB · {cache_stats['evictions']} evicted")
+        st.caption(f"Database generation {get_pool().generation}")
+
+MODULES[module]()
+
+if PROFILING:
+    publish_profile(profiling.end())
+    with st.sidebar:
+        render_profile_panel()
@@ -0,0 +1,12 @@
+"""MixLab core: the database layer and recipe engines behind the Streamlit pages.
+
+Nothing in this package imports Streamlit, and pandas and plotly are only
+imported by the functions that need them, so scripts, benchmarks and background
+jobs can use the engines without paying for a UI. The Streamlit entry points
+(``code (1).py``, ``app.py``, ``mixlab_dashboard.py``) are thin pages over it.
+
+Every function works against one process-wide database, opened lazily from
+``$MIXLAB_DB`` (default ``mixlab.db``) or explicitly with ``configure()``.
+"""
+from mixlab.db import configure, get_pool, run_query
+from mixlab.catalog import CATEGORIES, FLAVOR_PROPERTIES, get_flavor_catalog
@@ -0,0 +1,83 @@
+"""The flavor stash as an in-memory index: name -> category and category -> names."""
+import threading
+
+from mixlab.db import run_query, shared
+
+# Pre-defined categories for consistency
+CATEGORIES = ['Fruit', 'Cream', 'Custard', 'Bakery', 'Menthol', 'Sweetener', 'Tobacco', 'Beverage', 'Other']
+
+FLAVOR_PROPERTIES = {
+    'Fruit': {'note': 'Top', 'type': 'Primary'},
+    'Sweetener': {'note': 'Accent', 'type': 'Enhancer'},
+    'Cream': {'note': 'Base', 'type': 'Mouthfeel'},
+    'Custard': {'note': 'Base', 'type': 'Mouthfeel'},
+    'Bakery': {'note': 'Mid', 'type': 'Primary'},
+    'Menthol': {'note': 'Accent', 'type': 'Effect'},
+    'Tobacco': {'note': 'Base', 'type': 'Primary'},
+    'Beverage': {'note': 'Mid', 'type': 'Primary'},
+    'Other': {'note': 'Mid', 'type': 'Misc'}
+}
+
+class FlavorCatalog:
+    """In-memory index of the flavor stash, loaded once and reused until the stash changes.
+
+    Holds the stash rows in table order, a case-folded name -> category map and
+    category -> names buckets. Call ``invalidate()`` after writing ``flavor_stash``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = None
+        self._by_name = {}
+        self._by_category = {}
+        self.version = 0
+
+    def _index(self):
+        rows = self._rows
+        if rows is None:
+            with self._lock:
+                if self._rows is None:
+                    stash = run_query("SELECT name, category FROM flavor_stash", fetch="all")
+                    by_category = {}
+                    for name, category in stash:
+                        by_category.setdefault(category, []).append(name)
+                    self._by_name = {name.casefold(): category for name, category in stash}
+                    self._by_category = by_category
+                    self._rows = stash
+                rows = self._rows
+        return rows
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+            self.version += 1
+
+    def items(self):
+        """All (name, category) pairs in stash order."""
+        return list(self._index())
+
+    def category(self, flavor_name, default='Other'):
+        self._index()
+        return self._by_name.get(flavor_name.casefold(), default)
+
+    def categories(self, flavor_names, default='Other'):
+        self._index()
+        by_name = self._by_name
+        return [by_name.get(name.casefold(), default) for name in flavor_names]
+
+    def names_in(self, *categories):
+        self._index()
+        names = []
+        for category in categories:
+            names.extend(self._by_category.get(category, ()))
+        return names
+
+    def __len__(self):
+        return len(self._index())
+
+@shared
+def get_flavor_catalog():
+    return FlavorCatalog()
+
+def get_flavor_category(flavor_name):
+    return get_flavor_catalog().category(flavor_name)
@@ -0,0 +1,617 @@
+"""SQLite access: the connection pool, the serialized writer, schema migrations and the shared query cache."""
+import concurrent.futures
+import functools
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from mixlab import profiling
+
+DEFAULT_DB_PATH = os.environ.get("MIXLAB_DB", "mixlab.db")
+
+
+# --- Database Connection Layer ---
+class ConnectionPool:
+    """A small pool of long-lived SQLite connections shared by every session.
+
+    Each thread checks out one connection for the duration of a ``connection()``
+    block; nested blocks on the same thread reuse it, so ``run_query`` calls made
+    inside a ``transaction()`` join that transaction.
+
+    ``generation`` counts committed writes made through the pool. It is bumped
+    when a connection that changed rows is handed back, so anything keyed on it
+    (see QueryCache) goes stale as soon as the write is visible.
+    """
+
+    def __init__(self, db_path, max_size=8, timeout=30.0, cached_statements=256):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.generation = 0
+
+    def _connect(self):
+        # isolation_level=None puts the driver in autocommit mode; transactions
+        # are opened explicitly through transaction()/snapshot().
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                return self._connect()
+        return self._idle.get(timeout=self.timeout)
+
+    def bump_generation(self):
+        with self._lock:
+            self.generation += 1
+
+    def in_transaction(self):
+        conn = getattr(self._local, 'conn', None)
+        return conn is not None and conn.in_transaction
+
+    @contextmanager
+    def connection(self, track_writes=True):
+        """Check out this thread's connection.
+
+        Pass ``track_writes=False`` for writes to bookkeeping tables that no
+        cached read depends on, so they don't invalidate the query cache.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._checkout()
+        self._local.conn = conn
+        changes = conn.total_changes
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            if track_writes and conn.total_changes != changes:
+                self.bump_generation()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self, mode="IMMEDIATE"):
+        """Run the block as one atomic write; joins an enclosing transaction."""
+        with self.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute(f"BEGIN {mode}")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    @contextmanager
+    def snapshot(self):
+        """Read several statements against one consistent view of the database."""
+        with self.transaction(mode="DEFERRED") as conn:
+            yield conn
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+# --- Serialized Writer ---
+class StaleWriteError(Exception):
+    """The rows being saved changed (or went away) since the editor loaded them."""
+
+class WriteQueue:
+    """Funnels this process's writes through one writer thread.
+
+    Sessions hand ``fn(conn)`` callables to submit() instead of opening their
+    own write transactions, so they never queue up on SQLite's write lock or
+    hit "database is locked". The writer drains whatever is waiting (up to
+    ``max_batch`` writes) into one BEGIN IMMEDIATE transaction and a single
+    commit. Each write runs under its own SAVEPOINT: one that raises is rolled
+    back on its own and its exception is re-raised in the caller, while the rest
+    of the batch still commits.
+
+    The thread starts on the first write and exits after ``idle_timeout``
+    seconds without any. Writes from other processes (job workers) still
+    serialize through SQLite's lock and the pool's busy timeout.
+    """
+
+    def __init__(self, pool, max_batch=64, idle_timeout=30.0):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.idle_timeout = idle_timeout
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = self.writes = 0
+
+    def submit(self, fn, track_writes=True):
+        """Queue ``fn(conn)``; returns a Future for its return value.
+
+        ``track_writes=False`` marks bookkeeping writes, as for
+        ConnectionPool.connection(). Must not be called while this thread holds
+        a write transaction of its own, or the writer waits on it.
+        """
+        future = concurrent.futures.Future()
+        if threading.current_thread() is self._thread:
+            # A write queued from inside a write: it is already in the writer's transaction
+            with self.pool.connection() as conn:
+                try:
+                    future.set_result(fn(conn))
+                except Exception as e:
+                    future.set_exception(e)
+            return future
+        with self._lock:
+            self._queue.put((fn, track_writes, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mixlab-writer", daemon=True)
+                self._thread.start()
+        return future
+
+    def write(self, fn, track_writes=True):
+        """Run ``fn(conn)`` on the writer and wait for it; returns its result or raises its exception."""
+        return self.submit(fn, track_writes).result()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.idle_timeout)]
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch([(fn, track, f) for fn, track, f in batch if f.set_running_or_notify_cancel()])
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        outcomes = []
+        tracked = False
+        # The generation is bumped by hand below: only for tracked writes that
+        # committed, and before any caller sees its result.
+        with self.pool.connection(track_writes=False) as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for fn, track_writes, future in batch:
+                    changes = conn.total_changes
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        result = fn(conn)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write")
+                        conn.execute("RELEASE write")
+                        outcomes.append((future, None, e))
+                    else:
+                        conn.execute("RELEASE write")
+                        tracked = tracked or (track_writes and conn.total_changes != changes)
+                        outcomes.append((future, result, None))
+                conn.commit()
+            except Exception as e:
+                # BEGIN or COMMIT failed (or a write broke the transaction): nothing was saved
+                if conn.in_transaction:
+                    conn.rollback()
+                failed = {id(f): error for f, _, error in outcomes if error is not None}
+                for _, _, future in batch:
+                    future.set_exception(failed.get(id(future), e))
+                return
+        self.batches += 1
+        self.writes += len(batch)
+        if tracked:
+            self.pool.bump_generation()
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+# --- Database Setup ---
+# Each migration brings the schema up by one PRAGMA user_version step. Append new
+# steps to MIGRATIONS; never edit one that has shipped.
+def _migrate_base_schema(c):
+    # Stash Table: id, name, brand, category (for AI analysis)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS flavor_stash (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            brand TEXT,
+            category TEXT
+        )
+    ''')
+    # Recipes Table: id, name, steep_days, created_at, steep_end_date, status
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            notes TEXT,
+            steep_days INTEGER DEFAULT 7,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            steep_end_date TIMESTAMP,
+            status TEXT DEFAULT 'Steeping'
+        )
+    ''')
+    # Recipe Flavors Table: Links flavors and percentages to a recipe
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS recipe_flavors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipe_id INTEGER,
+            flavor_name TEXT,
+            percentage REAL,
+            FOREIGN KEY (recipe_id) REFERENCES recipes (id) ON DELETE CASCADE
+        )
+    ''')
+
+def _migrate_vapesim_cache(c):
+    # VapeSim Cache Table: analysis results keyed by a hash of the recipe contents
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS vapesim_cache (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _migrate_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recipe_flavors_recipe_id ON recipe_flavors (recipe_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recipes_created_at ON recipes (created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recipes_steep_end_date ON recipes (steep_end_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_flavor_stash_name_nocase ON flavor_stash (name COLLATE NOCASE)")
+
+def _migrate_flavor_ids(c):
+    # recipe_flavors gains an integer reference to flavor_stash. flavor_name stays as a
+    # denormalized copy, kept in sync by triggers, so older readers still work.
+    c.execute("DELETE FROM recipe_flavors WHERE recipe_id IS NULL OR recipe_id NOT IN (SELECT id FROM recipes)")
+    c.execute("ALTER TABLE recipe_flavors ADD COLUMN flavor_id INTEGER REFERENCES flavor_stash (id) ON DELETE SET NULL")
+    c.execute('''
+        UPDATE recipe_flavors SET flavor_id = (
+            SELECT id FROM flavor_stash WHERE name = recipe_flavors.flavor_name COLLATE NOCASE ORDER BY id DESC LIMIT 1
+        )
+    ''')
+    c.execute("CREATE INDEX idx_recipe_flavors_flavor_id ON recipe_flavors (flavor_id)")
+    c.execute("CREATE INDEX idx_recipe_flavors_unlinked ON recipe_flavors (flavor_name COLLATE NOCASE) WHERE flavor_id IS NULL")
+    # Link rows written by name only
+    c.execute('''
+        CREATE TRIGGER trg_recipe_flavors_link AFTER INSERT ON recipe_flavors
+        WHEN NEW.flavor_id IS NULL
+        BEGIN
+            UPDATE recipe_flavors SET flavor_id = (
+                SELECT id FROM flavor_stash WHERE name = NEW.flavor_name COLLATE NOCASE ORDER BY id DESC LIMIT 1
+            ) WHERE id = NEW.id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER trg_recipe_flavors_relink AFTER UPDATE OF flavor_name ON recipe_flavors
+        WHEN NEW.flavor_id IS OLD.flavor_id
+        BEGIN
+            UPDATE recipe_flavors SET flavor_id = (
+                SELECT id FROM flavor_stash WHERE name = NEW.flavor_name COLLATE NOCASE ORDER BY id DESC LIMIT 1
+            ) WHERE id = NEW.id;
+        END
+    ''')
+    # Pick up recipe rows that were waiting for this flavor to be added to the stash
+    c.execute('''
+        CREATE TRIGGER trg_flavor_stash_link AFTER INSERT ON flavor_stash
+        BEGIN
+            UPDATE recipe_flavors SET flavor_id = NEW.id
+            WHERE flavor_id IS NULL AND flavor_name = NEW.name COLLATE NOCASE;
+        END
+    ''')
+    # Renaming a stash flavor renames it in every recipe that uses it
+    c.execute('''
+        CREATE TRIGGER trg_flavor_stash_rename AFTER UPDATE OF name ON flavor_stash
+        BEGIN
+            UPDATE recipe_flavors SET flavor_name = NEW.name WHERE flavor_id = NEW.id;
+        END
+    ''')
+
+def _migrate_recipe_search(c):
+    # Full-text index over recipe names, notes and flavor names, one row per recipe
+    # (rowid = recipes.id). Writes only mark recipes stale, which is a cheap B-tree
+    # insert even for bulk loads; refresh_recipe_search() folds them into the index
+    # in one set-based pass before a search runs.
+    c.execute("CREATE VIRTUAL TABLE recipe_search USING fts5(name, notes, flavors, tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    c.execute("CREATE TABLE recipe_search_stale (recipe_id INTEGER PRIMARY KEY)")
+    c.execute("INSERT INTO recipe_search_stale (recipe_id) SELECT id FROM recipes")
+    for name, event, recipe_id in [
+        ("trg_recipes_search_insert", "AFTER INSERT ON recipes", "NEW.id"),
+        ("trg_recipes_search_update", "AFTER UPDATE OF name, notes ON recipes", "NEW.id"),
+        ("trg_recipes_search_delete", "AFTER DELETE ON recipes", "OLD.id"),
+        ("trg_recipe_flavors_search_insert", "AFTER INSERT ON recipe_flavors", "NEW.recipe_id"),
+        ("trg_recipe_flavors_search_delete", "AFTER DELETE ON recipe_flavors", "OLD.recipe_id"),
+    ]:
+        c.execute(f"CREATE TRIGGER {name} {event} BEGIN INSERT OR IGNORE INTO recipe_search_stale (recipe_id) VALUES ({recipe_id}); END")
+    c.execute('''
+        CREATE TRIGGER trg_recipe_flavors_search_update AFTER UPDATE OF flavor_name, recipe_id ON recipe_flavors
+        BEGIN
+            INSERT OR IGNORE INTO recipe_search_stale (recipe_id) VALUES (NEW.recipe_id);
+            INSERT OR IGNORE INTO recipe_search_stale (recipe_id) VALUES (OLD.recipe_id);
+        END
+    ''')
+
+def _migrate_jobs(c):
+    # Background jobs (mixlab.jobs). Worker processes write state and progress
+    # here, so any session, in any process, can poll them.
+    c.execute('''
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            owner TEXT,
+            params TEXT NOT NULL DEFAULT '{}',
+            state TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX idx_jobs_state ON jobs(state)")
+    c.execute("CREATE INDEX idx_jobs_kind ON jobs(kind, id)")
+
+def _migrate_row_versions(c):
+    # Optimistic concurrency: edits of a recipe or stash flavor bump its version and
+    # only apply if the row is still at the version the editor loaded.
+    c.execute("ALTER TABLE recipes ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    c.execute("ALTER TABLE flavor_stash ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    # A stash rename rewrites recipe_flavors (trg_flavor_stash_rename), so it is an edit of those recipes too
+    c.execute('''
+        CREATE TRIGGER trg_flavor_stash_rename_version AFTER UPDATE OF name ON flavor_stash
+        BEGIN
+            UPDATE recipes SET version = version + 1 WHERE id IN (SELECT recipe_id FROM recipe_flavors WHERE flavor_id = NEW.id);
+        END
+    ''')
+
+def _migrate_recipe_versions(c):
+    # Saved versions of each recipe (see mixlab.recipes, Recipe History): a full
+    # snapshot every few saves and a compact JSON delta for the ones in between.
+    c.execute('''
+        CREATE TABLE recipe_versions (
+            recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+            version INTEGER NOT NULL,
+            kind TEXT NOT NULL,         -- 'snapshot' or 'delta'
+            depth INTEGER NOT NULL,     -- deltas since the last snapshot
+            data TEXT NOT NULL,
+            saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (recipe_id, version)
+        ) WITHOUT ROWID
+    ''')
+
+def _migrate_flavor_rename_guard(c):
+    # trg_flavor_stash_rename fired on any write to name, even one that kept it, so
+    # brand/category saves rewrote every recipe row using the flavor
+    c.execute("DROP TRIGGER trg_flavor_stash_rename")
+    c.execute('''
+        CREATE TRIGGER trg_flavor_stash_rename AFTER UPDATE OF name ON flavor_stash
+        WHEN NEW.name IS NOT OLD.name
+        BEGIN
+            UPDATE recipe_flavors SET flavor_name = NEW.name WHERE flavor_id = NEW.id;
+        END
+    ''')
+
+def _migrate_rename_version_guard(c):
+    # Bump the recipes once per actual rename: not for writes that keep the name,
+    # and not for the placeholder step of apply_stash_changes, which leaves the
+    # flavor's own version alone
+    c.execute("DROP TRIGGER trg_flavor_stash_rename_version")
+    c.execute('''
+        CREATE TRIGGER trg_flavor_stash_rename_version AFTER UPDATE OF name ON flavor_stash
+        WHEN NEW.name IS NOT OLD.name AND NEW.version IS NOT OLD.version
+        BEGIN
+            UPDATE recipes SET version = version + 1 WHERE id IN (SELECT recipe_id FROM recipe_flavors WHERE flavor_id = NEW.id);
+        END
+    ''')
+
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_vapesim_cache,
+    _migrate_indexes,
+    _migrate_flavor_ids,
+    _migrate_recipe_search,
+    _migrate_jobs,
+    _migrate_row_versions,
+    _migrate_recipe_versions,
+    _migrate_flavor_rename_guard,
+    _migrate_rename_version_guard,
+]
+
+def init_db(pool):
+    """Apply any migrations the database has not seen yet, in one transaction."""
+    with pool.transaction() as c:
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        for target, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+            migrate(c)
+            c.execute(f"PRAGMA user_version = {target}")
+
+
+# --- Shared Instances ---
+# One pool per process, plus the caches and indexes built on top of it. They are
+# created on first use; configure() swaps the database and drops them all.
+_pool = None
+_shared = {}
+_shared_lock = threading.RLock()
+
+def configure(db_path=None, **pool_options):
+    """Open (and migrate) the database that every core function uses."""
+    global _pool
+    pool = ConnectionPool(db_path or DEFAULT_DB_PATH, **pool_options)
+    init_db(pool)
+    with _shared_lock:
+        previous, _pool = _pool, pool
+        _shared.clear()
+    if previous is not None:
+        previous.close_all()
+    return pool
+
+def get_pool():
+    pool = _pool
+    if pool is None:
+        with _shared_lock:
+            if _pool is None:
+                configure()
+            pool = _pool
+    return pool
+
+def shared(factory):
+    """Decorator turning a factory into a lazily created, process-wide instance.
+
+    The instance belongs to the configured database and is rebuilt after
+    configure() points the process at another one.
+    """
+    @functools.wraps(factory)
+    def get():
+        instance = _shared.get(factory)
+        if instance is None:
+            with _shared_lock:
+                instance = _shared.get(factory)
+                if instance is None:
+                    instance = _shared[factory] = factory()
+        return instance
+    return get
+
+@shared
+def get_writer():
+    return WriteQueue(get_pool())
+
+# --- Shared Query Cache ---
+class QueryCache:
+    """SELECT results shared by every session, keyed by (query, params, pool generation).
+
+    Any write through the pool bumps the generation, so entries from before it are
+    simply never looked up again and age out of the LRU. Memory use is capped by
+    an estimate of each result's size.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def estimate_size(result):
+        if not isinstance(result, list):
+            return sys.getsizeof(result) + sum(sys.getsizeof(v) for v in result or ())
+        sample = result[:16]
+        per_row = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r) for r in sample) / max(len(sample), 1)
+        return sys.getsizeof(result) + int(per_row * len(result))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, result):
+        size = self.estimate_size(result)
+        if size > self.max_bytes // 4:
+            return # Too big to be worth holding
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries), 'bytes': self._bytes,
+            }
+
+@shared
+def get_query_cache():
+    return QueryCache()
+
+_SELECT = re.compile(r"\s*SELECT\b", re.IGNORECASE)
+
+# --- Database Helper Functions ---
+def run_query(query, params=(), fetch=None, cache=True):
+    """Run one statement. Reads outside a transaction are served from the shared QueryCache;
+    pass ``cache=False`` for reads whose parameters change on every call."""
+    pool = get_pool()
+    profile = profiling.current()
+    start = time.perf_counter() if profile is not None else None
+    cacheable = cache and fetch in ("one", "all") and _SELECT.match(query) and not pool.in_transaction()
+    if cacheable:
+        key = (query, tuple(params), fetch, pool.generation)
+        entry = get_query_cache().get(key)
+        if entry is not None:
+            result = entry[0]
+            if profile is not None:
+                profile.record_query(time.perf_counter() - start, result, fetch, cached=True)
+            return list(result) if fetch == "all" else result
+    with pool.connection() as conn:
+        c = conn.execute(query, params)
+        if fetch == "one":
+            result = c.fetchone()
+        elif fetch == "all":
+            result = c.fetchall()
+        else:
+            result = None
+    if profile is not None:
+        profile.record_query(time.perf_counter() - start, result, fetch, cached=False)
+    if cacheable:
+        get_query_cache().put(key, result)
+        if fetch == "all":
+            result = list(result)
+    return result
@@ -0,0 +1,74 @@
+"""Plotly figures for the analysis pages; plotly is imported on first use."""
+import numpy as np
+
+from mixlab.synergy import category_synergy, encode_categories, synergy_block, synergy_table
+
+HEATMAP_VIEWS = ["Category aggregate", "Clustered by category", "Window"]
+HEATMAP_MAX_AXIS = 400 # Flavors per axis shipped in the clustered view; larger stashes are sampled
+HEATMAP_COLORBAR = dict(title="Synergy", tickvals=list(range(0, 11, 2)), ticktext=[f"{v / 10:.1f}" for v in range(0, 11, 2)])
+
+def synergy_figure(names, categories, view, row_start=0, col_start=0, size=50):
+    """Heatmap for one view of a stash already grouped by cluster_by_category."""
+    import plotly.graph_objects as go
+
+    if view == "Category aggregate":
+        cats, counts, agg = category_synergy(categories)
+        labels = [str(c) for c in cats]
+        fig = go.Figure(data=go.Heatmap(
+            z=np.round(agg, 2), x=labels, y=labels,
+            customdata=np.broadcast_to(counts, agg.shape).T,
+            hovertemplate="%{y} × %{x}<br>Mean synergy %{z:.2f}<br>%{customdata} flavors in %{y}<extra></extra>",
+            colorscale='Greens', zmin=0, zmax=1))
+        fig.update_layout(title='Category Pairing Potential', template='plotly_dark')
+        return fig
+
+    codes, cats = encode_categories(categories)
+    table = synergy_table(cats)
+    n = len(names)
+    if view == "Window":
+        rows = np.arange(row_start, min(n, row_start + size))
+        cols = np.arange(col_start, min(n, col_start + size))
+        fig = go.Figure(data=go.Heatmap(
+            z=synergy_block(codes, table, rows, cols),
+            x=[names[i] for i in cols], y=[names[i] for i in rows],
+            hovertemplate="%{y} × %{x}<br>Synergy %{z}/10<extra></extra>",
+            colorscale='Greens', zmin=0, zmax=10, colorbar=HEATMAP_COLORBAR))
+        fig.update_layout(title=f'Flavors #{row_start}–{rows[-1]} × #{col_start}–{cols[-1]}', template='plotly_dark')
+        return fig
+
+    # Clustered: integer-coded axes with one tick per category block
+    idx = np.arange(0, n, max(1, -(-n // HEATMAP_MAX_AXIS)))
+    starts = np.flatnonzero(np.r_[True, codes[idx][1:] != codes[idx][:-1]])
+    axis = dict(tickvals=idx[starts].tolist(), ticktext=[str(cats[codes[i]]) for i in idx[starts]])
+    fig = go.Figure(data=go.Heatmap(
+        z=synergy_block(codes, table, idx, idx), x=idx, y=idx,
+        hovertemplate="Flavor #%{y} × #%{x}<br>Synergy %{z}/10<extra></extra>",
+        colorscale='Greens', zmin=0, zmax=10, colorbar=HEATMAP_COLORBAR))
+    fig.update_layout(title='Flavor Pairing Potential', template='plotly_dark', xaxis=axis, yaxis=axis)
+    return fig
+
+BALANCE_COLORS = ['#76D7C4', '#F7DC6F', '#E59866', '#D7BDE2']
+
+def balance_figure(balance):
+    """Horizontal bars of a VapeSim report's percentage per note."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure(go.Bar(
+        x=list(balance.values()),
+        y=list(balance),
+        orientation='h',
+        marker_color=BALANCE_COLORS
+    ))
+    fig.update_layout(title="Profile Balance by Note", xaxis_title="Total Percentage (%)", yaxis_title="Note", template="plotly_dark")
+    return fig
+
+def steep_curve_figure(steep_curve):
+    """Line chart of a VapeSim report's projected flavor maturity by day."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure(go.Scatter(
+        x=[p['Day'] for p in steep_curve], y=[p['Flavor'] for p in steep_curve], mode='lines+markers',
+        line=dict(color='#00A36C', width=3)
+    ))
+    fig.update_layout(title="Flavor Meld Over Time", xaxis_title="Days Steeping", yaxis_title="Flavor Profile Maturity (%)", yaxis_range=[0,100], template="plotly_dark")
+    return fig
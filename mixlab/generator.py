@@ -0,0 +1,162 @@
+"""Recipe generator: sample many candidate recipes for a profile and keep the best scoring.
+
+The profile is matched with the Quick Mix index, giving one slot of candidate
+flavors per flavor the profile asks for. Each candidate draws one flavor per
+slot and a percentage inside that flavor's category range, and is scored in
+bulk with vapesim_scores and the category synergy table:
+
+    score = pairwise synergy, weighted by the product of the two percentages
+            + BALANCE_WEIGHT * evenness of the Top/Mid/Base/Accent split (0-1)
+            - WARNING_PENALTY * VapeSim warnings
+
+Candidates are drawn in batches until the requested number is reached or the
+time budget runs out, whichever is first. Every search is split into
+SEARCH_SHARDS shards with their own seeds, run in turn in-process or, for large
+searches, across a process pool. The split never depends on the machine, so
+results are reproducible for a given seed as long as the search finishes
+inside its budget.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from mixlab.catalog import CATEGORIES
+from mixlab.db import shared
+from mixlab.quickmix import CATEGORY_PCT, get_quickmix_index
+from mixlab.synergy import synergy_table
+from mixlab.vapesim import NOTES, vapesim_scores
+
+MAX_TOTAL_PCT = 20.0 # Candidates whose flavors add up to more are discarded
+WARNING_PENALTY = 0.25
+BALANCE_WEIGHT = 0.2
+BATCH_SIZE = 2_000
+PARALLEL_MIN_CANDIDATES = 20_000 # Smaller searches finish faster than a pool round trip
+SEARCH_SHARDS = 8 # Fixed, so a seed draws the same candidates however many workers run them
+SEARCH_WORKERS = int(os.environ.get("MIXLAB_SEARCH_WORKERS", os.cpu_count() or 1))
+CANDIDATE_CHOICES = [1_000, 5_000, 20_000, 100_000]
+
+_CATEGORY_CODE = {c: i for i, c in enumerate(CATEGORIES)}
+_PCT_LOW = np.array([CATEGORY_PCT.get(c, CATEGORY_PCT['Other'])[0] for c in CATEGORIES])
+_PCT_HIGH = np.array([CATEGORY_PCT.get(c, CATEGORY_PCT['Other'])[1] for c in CATEGORIES])
+_SYNERGY = synergy_table(CATEGORIES)
+
+def score_candidates(pct, codes):
+    """(score, synergy, vapesim_scores) for (candidates, slots) arrays of percentages and category codes."""
+    metrics = vapesim_scores(pct, codes)
+    slots = codes.shape[1]
+    if slots > 1:
+        i, j = np.triu_indices(slots, k=1)
+        weights = pct[:, i] * pct[:, j]
+        synergy = (_SYNERGY[codes[:, i], codes[:, j]] * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+    else:
+        synergy = np.zeros(len(codes))
+    shares = np.column_stack([metrics[n] for n in NOTES]) / np.maximum(metrics['total_pct'], 1e-9)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        evenness = -np.nansum(np.where(shares > 0, shares * np.log(shares), 0.0), axis=1) / np.log(len(NOTES))
+    score = synergy + BALANCE_WEIGHT * evenness - WARNING_PENALTY * metrics['warning_count']
+    return score, synergy, metrics
+
+def _best_unique(ids, pct, score, k):
+    """Top-k rows by score, keeping only the best percentages for each flavor combination."""
+    order = np.argsort(-score, kind='stable')
+    combos = np.sort(ids[order], axis=1)
+    _, first = np.unique(combos, axis=0, return_index=True)
+    keep = order[np.sort(first)][:k]
+    return ids[keep], pct[keep], score[keep]
+
+def search(slots, n_candidates, k, seed, deadline, max_total=MAX_TOTAL_PCT, batch_size=BATCH_SIZE):
+    """Sample and score up to ``n_candidates`` recipes before ``deadline`` (a time.time() value).
+
+    ``slots`` is a list of (flavor ids, category codes) array pairs. Returns
+    (ids, pct, score) for the best k unique combinations, plus the number of
+    candidates drawn and how many met the constraints. Runs in worker processes too.
+    """
+    rng = np.random.default_rng(seed)
+    n_slots = len(slots)
+    best = (np.empty((0, n_slots), dtype=np.int64), np.empty((0, n_slots)), np.empty(0))
+    drawn = valid = 0
+    while drawn < n_candidates and time.time() < deadline:
+        size = min(batch_size, n_candidates - drawn)
+        picks = [rng.integers(len(ids), size=size) for ids, _ in slots]
+        ids = np.column_stack([slot_ids[p] for (slot_ids, _), p in zip(slots, picks)])
+        codes = np.column_stack([slot_codes[p] for (_, slot_codes), p in zip(slots, picks)])
+        low, high = _PCT_LOW[codes], _PCT_HIGH[codes]
+        pct = np.round(low + rng.random(codes.shape) * (high - low), 1)
+        drawn += size
+
+        sorted_ids = np.sort(ids, axis=1)
+        ok = (pct.sum(axis=1) <= max_total) & (np.diff(sorted_ids, axis=1) != 0).all(axis=1)
+        if not ok.any():
+            continue
+        valid += int(ok.sum())
+        score, _, _ = score_candidates(pct[ok], codes[ok])
+        best = _best_unique(np.concatenate([best[0], ids[ok]]), np.concatenate([best[1], pct[ok]]),
+                            np.concatenate([best[2], score]), k)
+    return best, drawn, valid
+
+@shared
+def get_search_executor():
+    # spawn, like the job runner: workers only get numpy arrays and never touch the database
+    return concurrent.futures.ProcessPoolExecutor(max_workers=SEARCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def _steep_days(cream_pct):
+    # Cream-heavy mixes need the longer steep VapeSim warns about
+    return 21 if cream_pct > 10 else 14 if cream_pct > 0 else 7
+
+def generate_recipes(profile, n_candidates=5_000, k=5, budget=2.0, seed=None, max_total=MAX_TOTAL_PCT):
+    """The best ``k`` generated recipes for a free-text profile, plus search stats.
+
+    Each recipe is a dict with 'flavors' ({'name', 'pct', 'category'} dicts),
+    'score', 'synergy', 'steep_days' and the VapeSim metrics. Stats hold
+    'drawn', 'valid', 'workers', 'elapsed' seconds and 'timed_out', set when
+    the budget ran out before every shard finished its share.
+    """
+    start = time.time()
+    index = get_quickmix_index()
+    snapshot = index.current()
+    slots = []
+    for ids in index.match(profile, snapshot):
+        codes = np.array([_CATEGORY_CODE.get(snapshot.categories[f_id], _CATEGORY_CODE['Other']) for f_id in ids.tolist()])
+        slots.append((ids, codes))
+    stats = {'drawn': 0, 'valid': 0, 'workers': 0, 'elapsed': 0.0, 'timed_out': False}
+    if not slots:
+        return [], stats
+
+    deadline = start + budget
+    workers = min(SEARCH_WORKERS, SEARCH_SHARDS) if n_candidates >= PARALLEL_MIN_CANDIDATES and SEARCH_WORKERS > 1 else 1
+    seeds = np.random.SeedSequence(seed).spawn(SEARCH_SHARDS)
+    share = -(-n_candidates // SEARCH_SHARDS)
+    if workers == 1:
+        parts = [search(slots, share, k, s, deadline, max_total) for s in seeds]
+    else:
+        futures = [get_search_executor().submit(search, slots, share, k, s, deadline, max_total) for s in seeds]
+        # Workers stop drawing at the deadline; allow a little for the results to travel back
+        done, late = concurrent.futures.wait(futures, timeout=max(0.0, deadline - time.time()) + 0.5)
+        for future in late:
+            future.cancel()
+        # Merge in shard order, not completion order, so tied scores break the same way every run
+        parts = [f.result() for f in futures if f in done]
+    timed_out = len(parts) < SEARCH_SHARDS or any(p[1] < share for p in parts)
+    if not parts:
+        return [], {**stats, 'workers': workers, 'elapsed': time.time() - start, 'timed_out': timed_out}
+
+    ids, pct, score = _best_unique(*(np.concatenate([p[0][i] for p in parts]) for i in range(3)), k)
+    codes = np.array([[_CATEGORY_CODE.get(snapshot.categories[f_id], _CATEGORY_CODE['Other']) for f_id in row] for row in ids.tolist()],
+                     dtype=np.intp).reshape(ids.shape)
+    _, synergy, metrics = score_candidates(pct, codes)
+    recipes = []
+    for r in range(len(ids)):
+        order = np.argsort(-pct[r], kind='stable')
+        recipes.append({
+            'flavors': [{'name': snapshot.names[int(ids[r, s])], 'pct': float(pct[r, s]), 'category': CATEGORIES[codes[r, s]]} for s in order],
+            'score': float(score[r]),
+            'synergy': float(synergy[r]),
+            'steep_days': _steep_days(metrics['cream_pct'][r]),
+            **{name: float(values[r]) for name, values in metrics.items()},
+        })
+    stats = {'drawn': sum(p[1] for p in parts), 'valid': sum(p[2] for p in parts), 'workers': workers,
+             'elapsed': time.time() - start, 'timed_out': timed_out}
+    return recipes, stats
@@ -0,0 +1,277 @@
+"""Background jobs: library-wide analyses and bulk imports run in a process pool.
+
+Every job is a row in the ``jobs`` table. The worker process that runs it
+records state, progress and the JSON result there, so any session (or a fresh
+one after the user navigated away) can poll it. Cancellation is cooperative:
+cancel() sets a flag that the job sees the next time it reports progress.
+
+Workers are started with ``spawn`` so they never inherit open SQLite handles or
+Streamlit threads, and there are at most JOB_WORKERS of them. On top of that
+one owner (a browser session) may only have MAX_ACTIVE_PER_OWNER jobs queued or
+running at a time.
+"""
+import concurrent.futures
+import datetime
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from mixlab.db import configure, get_pool, get_writer, run_query, shared
+
+JOB_WORKERS = int(os.environ.get("MIXLAB_JOB_WORKERS", 2))
+MAX_ACTIVE_PER_OWNER = 2
+ACTIVE_STATES = ('queued', 'running')
+PROGRESS_INTERVAL = 0.5 # Seconds between progress writes from a running job
+
+log = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancel() was requested for it."""
+
+class JobLimitError(Exception):
+    """The owner already has MAX_ACTIVE_PER_OWNER jobs queued or running."""
+
+def _now():
+    return datetime.datetime.now().isoformat(sep=' ', timespec='seconds')
+
+
+# --- Job Kinds ---
+# kind -> (label, function, main-process callback once the job finished)
+JOB_KINDS = {}
+
+def job_kind(kind, label, on_finish=None):
+    """Register ``fn(params, report)`` as a job; its return value must be JSON-serializable."""
+    def register(fn):
+        JOB_KINDS[kind] = (label, fn, on_finish)
+        return fn
+    return register
+
+def _invalidate_library():
+    from mixlab.catalog import get_flavor_catalog
+    from mixlab.similarity import get_similarity_index
+
+    get_flavor_catalog().invalidate()
+    get_similarity_index().invalidate()
+
+@job_kind('vapesim_library', "VapeSim across the library")
+def vapesim_library(params, report, chunk_size=2000, top=100):
+    """Score every recipe in chunks; keeps the best ``top`` rows for each leaderboard ranking."""
+    import pandas as pd
+    from mixlab.vapesim import LEADERBOARD_COLUMNS, LEADERBOARD_RANKINGS, load_vapesim_frame, vapesim_batch
+
+    recipe_ids = [row[0] for row in run_query("SELECT id FROM recipes ORDER BY id", fetch="all", cache=False)]
+    best = {label: pd.DataFrame(columns=LEADERBOARD_COLUMNS) for label in LEADERBOARD_RANKINGS}
+    for start in range(0, len(recipe_ids), chunk_size):
+        scored = vapesim_batch(load_vapesim_frame(recipe_ids[start:start + chunk_size]))[LEADERBOARD_COLUMNS]
+        for label, (column, ascending) in LEADERBOARD_RANKINGS.items():
+            merged = pd.concat([best[label], scored]) if len(best[label]) else scored
+            best[label] = merged.sort_values(column, ascending=ascending, kind='stable').head(top)
+        report(min(1.0, (start + chunk_size) / len(recipe_ids)), f"{min(start + chunk_size, len(recipe_ids)):,} of {len(recipe_ids):,} recipes")
+    return {
+        'recipes': len(recipe_ids),
+        'rankings': {label: frame.to_dict(orient='records') for label, frame in best.items()},
+    }
+
+@job_kind('synergy_pairs', "Synergy pair rebuild")
+def synergy_pairs(params, report):
+    """The best ``k`` flavor pairings across the whole stash, as [name, name, score] rows."""
+    from mixlab.catalog import get_flavor_catalog
+    from mixlab.synergy import top_synergy_pairs
+
+    stash = get_flavor_catalog().items()
+    pairs = top_synergy_pairs([category for _, category in stash], k=params.get('k', 100), progress=report)
+    return {'flavors': len(stash), 'pairs': [[stash[i][0], stash[j][0], score] for i, j, score in pairs]}
+
+@job_kind('import', "Bulk import", on_finish=_invalidate_library)
+def bulk_import(params, report):
+    """mixlab.transfer import of uploaded files; ``cleanup`` deletes them afterwards."""
+    from mixlab.transfer import RowReader, format_for, import_recipes, import_stash
+
+    paths = [p for p in (params['path'], params.get('flavors_path')) if p]
+    try:
+        files = [open(path, "rb") for path in paths]
+        try:
+            readers = [RowReader(f, format_for(path)) for f, path in zip(files, paths)]
+            total = sum(os.path.getsize(path) for path in paths) or 1
+            def progress(import_report):
+                report(sum(r.bytes_read for r in readers) / total, f"{import_report.rows_read:,} rows read")
+            if params['target'] == 'stash':
+                result = import_stash(readers[0], params.get('on_duplicate', 'skip'), progress=progress)
+            else:
+                result = import_recipes(readers[0], readers[1] if len(readers) > 1 else None, progress=progress)
+        finally:
+            for f in files:
+                f.close()
+    finally:
+        _remove_uploads(params)
+    return result.to_dict()
+
+def _remove_uploads(params):
+    """Delete an import job's staged files if it was submitted with ``cleanup``."""
+    if params.get('cleanup'):
+        for path in (params.get('path'), params.get('flavors_path')):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+# --- Worker Side ---
+class _Reporter:
+    """The ``report(fraction, message)`` callback handed to a running job."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, fraction, message=None):
+        now = time.monotonic()
+        if now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        with get_pool().connection() as conn:
+            cancel = conn.execute(
+                "UPDATE jobs SET progress=?, message=COALESCE(?, message) WHERE id=? RETURNING cancel_requested",
+                (float(fraction), message, self.job_id)
+            ).fetchone()[0]
+        if cancel:
+            raise JobCancelled()
+
+def _finish(job_id, state, **fields):
+    columns = ", ".join(f"{name}=?" for name in fields)
+    with get_pool().connection() as conn:
+        conn.execute(f"UPDATE jobs SET state=?, finished_at=?, {columns} WHERE id=?", (state, _now(), *fields.values(), job_id))
+
+def run_job(job_id):
+    """Claim and run one queued job in this (worker) process."""
+    with get_pool().connection() as conn:
+        row = conn.execute(
+            "UPDATE jobs SET state='running', started_at=? WHERE id=? AND state='queued' RETURNING kind, params",
+            (_now(), job_id)
+        ).fetchone()
+        skipped = conn.execute("SELECT params FROM jobs WHERE id=?", (job_id,)).fetchone() if row is None else None
+    if row is None:
+        # Cancelled, or failed by a restart, while it waited for a worker; it will never run
+        if skipped is not None:
+            _remove_uploads(json.loads(skipped[0]))
+        return
+    kind, params = row
+    try:
+        result = JOB_KINDS[kind][1](json.loads(params), _Reporter(job_id))
+    except JobCancelled:
+        _finish(job_id, 'cancelled', message="Cancelled.")
+    except Exception as e:
+        log.exception("Job %s (%s) failed", job_id, kind)
+        _finish(job_id, 'failed', error=f"{type(e).__name__}: {e}")
+    else:
+        _finish(job_id, 'done', progress=1.0, result=json.dumps(result))
+
+
+# --- Main Process Side ---
+def fail_interrupted_jobs(writer):
+    """Mark jobs left queued or running by an earlier server process as failed; returns how many.
+
+    Nothing is still running them. Call it once, as the server starts
+    (JobRunner does), and never from a worker process.
+    """
+    failed = writer.write(lambda conn: conn.execute(
+        "UPDATE jobs SET state='failed', error='Interrupted by a server restart.', finished_at=? "
+        f"WHERE state IN {ACTIVE_STATES} RETURNING params", (_now(),)
+    ).fetchall())
+    for (params,) in failed:
+        _remove_uploads(json.loads(params))
+    return len(failed)
+
+class JobRunner:
+    """Queues jobs in the ``jobs`` table and runs them on a lazily started process pool.
+
+    Its own writes go through the serialized writer; the workers write through
+    their own connections.
+    """
+
+    def __init__(self, writer, workers=JOB_WORKERS):
+        self.writer = writer
+        self.pool = writer.pool
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        fail_interrupted_jobs(writer)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=configure,
+                    initargs=(self.pool.db_path,),
+                )
+            return self._executor
+
+    def submit(self, kind, params=None, owner=None):
+        """Queue a job; returns its id. Raises JobLimitError when the owner is at the cap."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        def queue(conn):
+            if owner is not None:
+                active = conn.execute(f"SELECT COUNT(*) FROM jobs WHERE owner=? AND state IN {ACTIVE_STATES}", (owner,)).fetchone()[0]
+                if active >= MAX_ACTIVE_PER_OWNER:
+                    raise JobLimitError(f"You already have {active} jobs running or queued; wait for one to finish or cancel it.")
+            return conn.execute(
+                "INSERT INTO jobs (kind, owner, params) VALUES (?, ?, ?)", (kind, owner, json.dumps(params or {}))
+            ).lastrowid
+        job_id = self.writer.write(queue)
+        future = self._get_executor().submit(run_job, job_id)
+        future.add_done_callback(functools.partial(self._finished, job_id, kind))
+        return job_id
+
+    def _finished(self, job_id, kind, future):
+        error = future.exception() if not future.cancelled() else None
+        if error is not None:
+            # The worker died (e.g. BrokenProcessPool); start a fresh pool next time
+            with self._lock:
+                self._executor = None
+            self.writer.write(lambda conn: conn.execute(
+                f"UPDATE jobs SET state='failed', error=?, finished_at=? WHERE id=? AND state IN {ACTIVE_STATES}",
+                (f"{type(error).__name__}: {error}", _now(), job_id)
+            ))
+        # The worker wrote through its own connection, which this process's query cache cannot see
+        self.pool.bump_generation()
+        on_finish = JOB_KINDS[kind][2]
+        if on_finish is not None:
+            on_finish()
+
+    def cancel(self, job_id):
+        """Cancel a queued job outright, or ask a running one to stop at its next progress report."""
+        def cancel(conn):
+            conn.execute(f"UPDATE jobs SET cancel_requested=1 WHERE id=? AND state IN {ACTIVE_STATES}", (job_id,))
+            conn.execute("UPDATE jobs SET state='cancelled', finished_at=? WHERE id=? AND state='queued'", (_now(), job_id))
+        self.writer.write(cancel)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+@shared
+def get_job_runner():
+    return JobRunner(get_writer())
+
+JOB_COLUMNS = ['id', 'kind', 'owner', 'state', 'progress', 'message', 'error', 'created_at', 'started_at', 'finished_at']
+
+def recent_jobs(limit=10):
+    """The latest jobs as dicts, newest first."""
+    rows = run_query(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY id DESC LIMIT ?", (limit,), fetch="all", cache=False)
+    return [dict(zip(JOB_COLUMNS, row)) for row in rows]
+
+def latest_result(kind):
+    """(finished_at, result) of the newest successful job of this kind, or None."""
+    row = run_query("SELECT finished_at, result FROM jobs WHERE kind=? AND state='done' ORDER BY id DESC LIMIT 1", (kind,), fetch="one", cache=False)
+    return (row[0], json.loads(row[1])) if row else None
+
+def job_result(job_id):
+    row = run_query("SELECT result FROM jobs WHERE id=? AND state='done'", (job_id,), fetch="one", cache=False)
+    return json.loads(row[0]) if row else None
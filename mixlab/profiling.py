@@ -0,0 +1,102 @@
+"""Opt-in per-rerun instrumentation: wall time, SQL queries, rows fetched and figure sizes.
+
+A Profile is bound to the current thread with begin() and collected with end().
+While one is active, run_query reports every statement into it and callers can
+open named sections to split the time up. With no profile active, the only cost
+is one thread-local lookup per query.
+"""
+import datetime
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+def _counters():
+    return {'wall_ms': 0.0, 'sql_ms': 0.0, 'queries': 0, 'cache_hits': 0, 'rows': 0,
+            'figures': 0, 'figure_bytes': 0, 'figure_ms': 0.0}
+
+class Profile:
+    """Measurements for one rerun, overall and per section."""
+
+    def __init__(self, label, kind="rerun"):
+        self.label = label
+        self.kind = kind
+        self.started = datetime.datetime.now()
+        self._start = time.perf_counter()
+        self.totals = _counters()
+        self.sections = {}
+        self._open = []
+
+    def _add(self, key, value):
+        self.totals[key] += value
+        for name in self._open:
+            self.sections[name][key] += value
+
+    @contextmanager
+    def section(self, name):
+        """Attribute everything inside the block to ``name`` as well as to the total."""
+        counters = self.sections.setdefault(name, _counters())
+        self._open.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            counters['wall_ms'] += (time.perf_counter() - start) * 1000
+            self._open.remove(name)
+
+    def record_query(self, seconds, result, fetch, cached):
+        if fetch == "all":
+            rows = len(result)
+        elif fetch == "one":
+            rows = int(result is not None)
+        else:
+            rows = 0
+        self._add('queries', 1)
+        self._add('cache_hits', int(cached))
+        self._add('rows', rows)
+        self._add('sql_ms', seconds * 1000)
+
+    def record_figure(self, fig):
+        """Count a plotly figure and the size of its JSON payload."""
+        start = time.perf_counter()
+        size = len(fig.to_json())
+        self._add('figures', 1)
+        self._add('figure_bytes', size)
+        self._add('figure_ms', (time.perf_counter() - start) * 1000)
+
+    def finish(self):
+        self.totals['wall_ms'] = (time.perf_counter() - self._start) * 1000
+        return self
+
+    def to_dict(self):
+        def with_other(counters):
+            # Whatever is neither SQL nor figure serialization: pandas, numpy and Python
+            other = counters['wall_ms'] - counters['sql_ms'] - counters['figure_ms']
+            return {**counters, 'other_ms': max(0.0, other)}
+        return {
+            'label': self.label,
+            'kind': self.kind,
+            'started': self.started.isoformat(timespec='milliseconds'),
+            **with_other(self.totals),
+            'sections': [{'name': name, **with_other(c)} for name, c in self.sections.items()],
+        }
+
+def current():
+    return getattr(_local, 'profile', None)
+
+def begin(label, kind="rerun"):
+    """Start profiling this thread, replacing anything left by an interrupted run."""
+    _local.profile = Profile(label, kind)
+    return _local.profile
+
+def end():
+    """Stop profiling this thread; returns the finished Profile, or None if none was active."""
+    profile = current()
+    _local.profile = None
+    return profile.finish() if profile is not None else None
+
+def append_jsonl(path, record):
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
@@ -0,0 +1,183 @@
+"""Quick Mix: turn a free-text flavor profile into a suggested recipe from the stash.
+
+Profile words are looked up in an inverted index built from the stash: flavor
+name tokens point at the flavors that contain them, brand tokens narrow the
+picks to that brand, and profile keywords (with synonyms) point at groups of
+stash categories. The index holds sorted arrays of flavor ids and is rebuilt
+only when the flavor catalog's version moves on.
+"""
+import re
+import threading
+
+import numpy as np
+
+from mixlab.catalog import get_flavor_catalog
+from mixlab.db import run_query, shared
+
+# group -> (stash categories to draw from, percentage range, profile keywords)
+KEYWORD_GROUPS = {
+    'fruit': (('Fruit',), (2.5, 5.0), [
+        'fruit', 'fruity', 'berry', 'strawberry', 'blueberry', 'raspberry', 'blackberry', 'bilberry', 'cherry',
+        'apple', 'pear', 'peach', 'apricot', 'mango', 'pineapple', 'banana', 'melon', 'watermelon', 'grape',
+        'kiwi', 'citrus', 'lemon', 'lime', 'orange', 'grapefruit', 'tropical', 'jam', 'juicy',
+    ]),
+    'cream': (('Cream', 'Custard'), (3.0, 6.0), [
+        'creamy', 'cream', 'custard', 'milk', 'milky', 'whipped', 'vanilla', 'pudding', 'dairy', 'yogurt', 'rich',
+    ]),
+    'bakery': (('Bakery',), (1.0, 3.0), [
+        'cake', 'bakery', 'baked', 'biscuit', 'shortcake', 'cookie', 'pastry', 'pie', 'crust', 'graham',
+        'cheesecake', 'donut', 'doughnut', 'cereal', 'waffle', 'pancake', 'bread', 'crumble', 'muffin',
+    ]),
+    'menthol': (('Menthol',), (0.5, 1.5), ['menthol', 'mint', 'minty', 'cool', 'cooling', 'ice', 'icy', 'chilled', 'koolada']),
+    'sweet': (('Sweetener',), (0.25, 1.0), ['sweet', 'sweeter', 'sugar', 'sugary', 'sweetener', 'sucralose', 'candy']),
+    'tobacco': (('Tobacco',), (2.0, 4.0), ['tobacco', 'tabac', 'cigar', 'pipe', 'burley', 'virginia', 'cavendish', 'ry4']),
+    'beverage': (('Beverage',), (2.0, 4.0), ['coffee', 'espresso', 'latte', 'tea', 'cola', 'soda', 'drink', 'beverage', 'lemonade']),
+}
+KEYWORD_INDEX = {word: group for group, (_, _, words) in KEYWORD_GROUPS.items() for word in words}
+CATEGORY_PCT = {categories[0]: pct for categories, pct, _ in KEYWORD_GROUPS.values()}
+CATEGORY_PCT.update({'Custard': (3.0, 6.0), 'Other': (1.0, 3.0)})
+STEEP_DAY_CHOICES = [7, 14, 21]
+MIN_NAME_TOKEN = 3 # Shorter name tokens ("v1", "sc") are noise; brands are often two letters (FA, FW)
+
+_WORD = re.compile(r"\w+")
+
+def tokenize(text, min_len=2):
+    return [t for t in _WORD.findall((text or "").casefold()) if len(t) >= min_len]
+
+def _variants(word):
+    """The word plus naive singulars, so 'berries' and 'cookies' hit 'berry' and 'cookie'."""
+    yield word
+    if word.endswith('ies'):
+        yield word[:-3] + 'y'
+    if word.endswith('es'):
+        yield word[:-2]
+    if word.endswith('s'):
+        yield word[:-1]
+
+def _ids(values):
+    return np.array(sorted(values), dtype=np.int64)
+
+class _Snapshot:
+    """One immutable build of the index, so a rebuild never changes it under a reader."""
+
+    def __init__(self, rows):
+        by_category, by_token, by_brand = {}, {}, {}
+        for f_id, name, brand, category in rows:
+            by_category.setdefault(category or 'Other', []).append(f_id)
+            brand_tokens = set(tokenize(brand))
+            for token in brand_tokens:
+                by_brand.setdefault(token, []).append(f_id)
+            for token in set(tokenize(name, MIN_NAME_TOKEN)) - brand_tokens:
+                by_token.setdefault(token, []).append(f_id)
+        self.names = {f_id: name for f_id, name, _, _ in rows}
+        self.categories = {f_id: category or 'Other' for f_id, _, _, category in rows}
+        self.by_category = {c: _ids(ids) for c, ids in by_category.items()}
+        self.by_token = {t: _ids(ids) for t, ids in by_token.items()}
+        self.by_brand = {t: _ids(ids) for t, ids in by_brand.items()}
+        self.by_group = {group: _ids(f_id for c in categories for f_id in by_category.get(c, ()))
+                         for group, (categories, _, _) in KEYWORD_GROUPS.items()}
+
+def _group(word):
+    return next((KEYWORD_INDEX[v] for v in _variants(word) if v in KEYWORD_INDEX), None)
+
+def _lookup(index, word):
+    for variant in _variants(word):
+        if variant in index:
+            return index[variant]
+    return None
+
+class QuickMixIndex:
+    """Profile word -> flavor id arrays over the stash, rebuilt when the catalog version changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._snapshot = None
+
+    def current(self):
+        """The index for the current stash, rebuilt first if the catalog changed."""
+        version = get_flavor_catalog().version
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._snapshot = _Snapshot(run_query("SELECT id, name, brand, category FROM flavor_stash", fetch="all"))
+                    self._version = version
+        return self._snapshot
+
+    def match(self, profile, snapshot=None):
+        """Candidate id arrays, one per flavor the profile asks for, in profile order.
+
+        Consecutive words naming the same stash flavors ("sugar cookie") count
+        as one mention of those flavors. A keyword picks from its category group,
+        preferring flavors it names within that group; a keyword that names nothing
+        in the group stands for the whole group, once per group. Brand words narrow
+        every candidate set that still has a flavor of that brand.
+        """
+        snap = snapshot or self.current()
+        words = tokenize(profile)
+        brands = [ids for ids in (_lookup(snap.by_brand, w) for w in words) if ids is not None]
+        brand_ids = np.unique(np.concatenate(brands)) if brands else None
+
+        named, generic = [], {}
+        i = 0
+        while i < len(words):
+            group = _group(words[i])
+            ids = _lookup(snap.by_token, words[i])
+            i += 1
+            if ids is None:
+                if group is not None:
+                    generic.setdefault(group, snap.by_group[group])
+                continue
+            phrase = False
+            while i < len(words):
+                following = _lookup(snap.by_token, words[i])
+                both = np.intersect1d(ids, following, assume_unique=True) if following is not None else ()
+                if not len(both):
+                    break
+                ids, group, phrase, i = both, group or _group(words[i]), True, i + 1
+            if group is not None and not phrase:
+                group_ids = snap.by_group[group]
+                in_group = np.intersect1d(ids, group_ids, assume_unique=True)
+                if not len(in_group) and len(group_ids):
+                    # Used as a descriptor ("sweet"), not as part of a flavor name
+                    generic.setdefault(group, group_ids)
+                    continue
+                ids = in_group if len(in_group) else ids
+            named.append((group, ids))
+        # A group already covered by a named flavor doesn't get a generic pick too
+        covered = {group for group, _ in named}
+        candidates = [ids for _, ids in named] + [ids for group, ids in generic.items() if group not in covered]
+        if brand_ids is not None:
+            narrowed = [np.intersect1d(ids, brand_ids, assume_unique=True) for ids in candidates]
+            candidates = [n if len(n) else ids for n, ids in zip(narrowed, candidates)]
+        return [ids for ids in candidates if len(ids)]
+
+    def suggest(self, profile, rng):
+        snap = self.current()
+        chosen = []
+        for ids in self.match(profile, snap):
+            remaining = ids[~np.isin(ids, chosen)] if chosen else ids
+            if len(remaining):
+                chosen.append(int(rng.choice(remaining)))
+        flavors = []
+        for f_id in chosen:
+            low, high = CATEGORY_PCT.get(snap.categories[f_id], CATEGORY_PCT['Other'])
+            flavors.append({'name': snap.names[f_id], 'pct': round(float(rng.uniform(low, high)), 1)})
+        return flavors
+
+@shared
+def get_quickmix_index():
+    return QuickMixIndex()
+
+def suggest_recipe(profile, seed=None):
+    """Pick one stash flavor for each flavor the profile asks for.
+
+    Returns (flavors, steep_days) with flavors as {'name', 'pct'} dicts; both are
+    empty/None when nothing in the stash matches. The same seed, profile and
+    stash always give the same suggestion.
+    """
+    rng = np.random.default_rng(seed)
+    flavors = get_quickmix_index().suggest(profile, rng)
+    if not flavors:
+        return [], None
+    return flavors, int(rng.choice(STEEP_DAY_CHOICES))
@@ -0,0 +1,310 @@
+"""Recipe writes, saved versions and recipe-to-recipe comparisons."""
+import datetime
+import json
+import re
+
+from mixlab.catalog import get_flavor_catalog
+from mixlab.db import StaleWriteError, get_writer, run_query
+
+# --- Recipe Repository ---
+def diff_recipe_flavors(existing, flavors):
+    """Work out the minimal writes that turn stored flavor rows into the edited list.
+
+    ``existing`` holds (row_id, flavor_name, percentage) tuples and ``flavors`` the
+    edited {'name', 'percentage'} dicts. Rows are matched by flavor name; leftover
+    rows are reused for new flavors before anything is inserted or deleted.
+    Returns (inserts, updates, deletes) as parameter tuples ready for executemany.
+    """
+    unmatched = {}
+    for row_id, name, pct in existing:
+        unmatched.setdefault(name, []).append((row_id, pct))
+    new_rows, updates = [], []
+    for f in flavors:
+        rows = unmatched.get(f['name'])
+        if rows:
+            row_id, pct = rows.pop(0)
+            if pct != f['percentage']:
+                updates.append((f['name'], f['percentage'], row_id))
+        else:
+            new_rows.append((f['name'], f['percentage']))
+    spare = [row_id for rows in unmatched.values() for row_id, _ in rows]
+    updates += [(name, pct, row_id) for (name, pct), row_id in zip(new_rows, spare)]
+    inserts = new_rows[len(spare):]
+    deletes = [(row_id,) for row_id in spare[len(new_rows):]]
+    return inserts, updates, deletes
+
+class RecipeRepository:
+    """Recipe writes, each performed as a single transaction on the serialized writer."""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def create(self, name, notes, steep_days, steep_end_date, flavors):
+        def create(conn):
+            recipe_id = conn.execute(
+                "INSERT INTO recipes (name, notes, steep_days, steep_end_date) VALUES (?, ?, ?, ?)",
+                (name, notes, steep_days, steep_end_date)
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO recipe_flavors (recipe_id, flavor_name, percentage) VALUES (?, ?, ?)",
+                [(recipe_id, f['name'], f['percentage']) for f in flavors]
+            )
+            record_snapshot(conn, recipe_id, 1, recipe_state(name, notes, steep_days, [(f['name'], f['percentage']) for f in flavors]))
+            return recipe_id
+        return self.writer.write(create)
+
+    def update(self, recipe_id, name, notes, steep_days, steep_end_date, flavors, version=None):
+        """Save an edited recipe. With ``version`` (as loaded into the editor), raise
+        StaleWriteError instead of overwriting if the recipe changed since then."""
+        def update(conn):
+            current = conn.execute("SELECT name, notes, steep_days, version FROM recipes WHERE id=?", (recipe_id,)).fetchone()
+            if current is None:
+                raise StaleWriteError("This recipe was deleted by someone else, so your changes were not saved.")
+            if version is not None and current[3] != version:
+                raise StaleWriteError(f"'{current[0]}' was changed by someone else since you opened it, so your changes were not saved. "
+                                      "Reopen it to see the latest version.")
+            conn.execute(
+                "UPDATE recipes SET name=?, notes=?, steep_days=?, steep_end_date=?, version=version + 1 WHERE id=?",
+                (name, notes, steep_days, steep_end_date, recipe_id)
+            )
+            existing = conn.execute("SELECT id, flavor_name, percentage FROM recipe_flavors WHERE recipe_id=? ORDER BY id", (recipe_id,)).fetchall()
+            inserts, updates, deletes = diff_recipe_flavors(existing, flavors)
+            conn.executemany("DELETE FROM recipe_flavors WHERE id=?", deletes)
+            conn.executemany("UPDATE recipe_flavors SET flavor_name=?, percentage=? WHERE id=?", updates)
+            conn.executemany(
+                "INSERT INTO recipe_flavors (recipe_id, flavor_name, percentage) VALUES (?, ?, ?)",
+                [(recipe_id, flavor_name, pct) for flavor_name, pct in inserts]
+            )
+            before = recipe_state(*current[:3], [(flavor_name, pct) for _, flavor_name, pct in existing])
+            after = recipe_state(name, notes, steep_days, [(f['name'], f['percentage']) for f in flavors])
+            record_save(conn, recipe_id, current[3], before, after)
+            return len(inserts) + len(updates) + len(deletes)
+        return self.writer.write(update)
+
+    def duplicate(self, recipe_id):
+        """Copy a recipe and its flavors; returns (new_id, new_name) or None if it no longer exists."""
+        def duplicate(conn):
+            orig = conn.execute("SELECT name, notes, steep_days FROM recipes WHERE id=?", (recipe_id,)).fetchone()
+            if orig is None:
+                return None
+            new_name = f"{orig[0]} (Copy)"
+            steep_end_date = (datetime.datetime.now() + datetime.timedelta(days=orig[2] or 0)).isoformat()
+            new_id = conn.execute(
+                "INSERT INTO recipes (name, notes, steep_days, steep_end_date, status) VALUES (?, ?, ?, ?, ?)",
+                (new_name, orig[1], orig[2], steep_end_date, 'Steeping')
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO recipe_flavors (recipe_id, flavor_name, percentage) "
+                "SELECT ?, flavor_name, percentage FROM recipe_flavors WHERE recipe_id=? ORDER BY id",
+                (new_id, recipe_id)
+            )
+            copied = conn.execute("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=? ORDER BY id", (new_id,)).fetchall()
+            record_snapshot(conn, new_id, 1, recipe_state(new_name, orig[1], orig[2], copied))
+            return new_id, new_name
+        return self.writer.write(duplicate)
+
+    def delete(self, recipe_id):
+        def delete(conn):
+            conn.execute("DELETE FROM recipe_flavors WHERE recipe_id=?", (recipe_id,))
+            conn.execute("DELETE FROM recipes WHERE id=?", (recipe_id,))
+        self.writer.write(delete)
+
+def get_recipe_repository():
+    return RecipeRepository(get_writer())
+
+def recipe_text(recipe_id):
+    """A recipe as plain text for sharing, or None if it does not exist."""
+    recipe_info = run_query("SELECT name, notes FROM recipes WHERE id=?", (recipe_id,), fetch="one")
+    if recipe_info is None:
+        return None
+    flavor_info = run_query("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=?", (recipe_id,), fetch="all")
+
+    export_str = f"--- {recipe_info[0]} ---\n"
+    if recipe_info[1]:
+        export_str += f"Notes: {recipe_info[1]}\n\n"
+    for name, pct in flavor_info:
+        export_str += f"- {name}: {pct}%\n"
+    return export_str
+
+
+# --- Recipe Search ---
+RECIPE_PAGE_SIZES = [25, 50, 100, 250]
+_TOKEN = re.compile(r"\w+")
+
+def fts_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix, or None if it has no words."""
+    tokens = _TOKEN.findall(text)
+    return " ".join(f'"{token}"*' for token in tokens) or None
+
+def refresh_recipe_search():
+    """Fold recipes marked stale by the write triggers into the full-text index."""
+    if run_query("SELECT 1 FROM recipe_search_stale LIMIT 1", fetch="one", cache=False) is None:
+        return
+    def refresh(conn):
+        conn.execute("DELETE FROM recipe_search WHERE rowid IN (SELECT recipe_id FROM recipe_search_stale)")
+        conn.execute(
+            "INSERT INTO recipe_search (rowid, name, notes, flavors) "
+            "SELECT r.id, r.name, r.notes, (SELECT group_concat(flavor_name, ' ') FROM recipe_flavors WHERE recipe_id = r.id) "
+            "FROM recipes r WHERE r.id IN (SELECT recipe_id FROM recipe_search_stale)"
+        )
+        conn.execute("DELETE FROM recipe_search_stale")
+    # The writes that marked these rows already moved the generation on, so this
+    # catch-up leaves the query cache alone.
+    get_writer().write(refresh, track_writes=False)
+
+def search_recipes(text, page, page_size):
+    """One page of (id, name, steep_days, status) rows plus the total number of matches.
+
+    Without search words this is every recipe, newest first; with them, the
+    recipes whose name, notes or flavors match, best match first.
+    """
+    match = fts_query(text or "")
+    if match is None:
+        total = run_query("SELECT COUNT(*) FROM recipes", fetch="one")[0]
+        rows = run_query(
+            "SELECT id, name, steep_days, status FROM recipes ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            (page_size, page * page_size), fetch="all"
+        )
+        return rows, total
+    refresh_recipe_search()
+    total = run_query("SELECT COUNT(*) FROM recipe_search WHERE recipe_search MATCH ?", (match,), fetch="one")[0]
+    rows = run_query(
+        "SELECT r.id, r.name, r.steep_days, r.status FROM recipe_search s JOIN recipes r ON r.id = s.rowid "
+        "WHERE recipe_search MATCH ? ORDER BY s.rank LIMIT ? OFFSET ?",
+        (match, page_size, page * page_size), fetch="all"
+    )
+    return rows, total
+
+def recipe_names(recipe_ids):
+    """{id: name} for the given recipes; ids that no longer exist are left out."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return {}
+    rows = run_query(f"SELECT id, name FROM recipes WHERE id IN ({', '.join('?' * len(recipe_ids))})", tuple(recipe_ids), fetch="all")
+    return dict(rows)
+
+
+# --- Recipe History ---
+# Every save is kept in recipe_versions. Most rows are deltas against the version
+# before (flavors added, removed or re-weighted, plus any name/notes/steep_days
+# change); every RECIPE_SNAPSHOT_EVERY-th is the full recipe, so rebuilding any
+# version reads one snapshot and at most that many deltas.
+RECIPE_SNAPSHOT_EVERY = 10
+RECIPE_META = ('name', 'notes', 'steep_days')
+
+def recipe_state(name, notes, steep_days, flavors):
+    """A recipe as recorded in its history; ``flavors`` holds (name, percentage) pairs.
+
+    A flavor listed twice is recorded once with its percentages summed.
+    """
+    totals = {}
+    for flavor_name, pct in flavors:
+        totals[flavor_name] = totals.get(flavor_name, 0.0) + (pct or 0.0)
+    return {'name': name, 'notes': notes, 'steep_days': steep_days, 'flavors': totals}
+
+def recipe_delta(before, after):
+    """The changes from one recipe state to the next, leaving out anything unchanged."""
+    old, new = before['flavors'], after['flavors']
+    delta = {
+        'meta': {key: after[key] for key in RECIPE_META if after[key] != before[key]},
+        'added': {name: pct for name, pct in new.items() if name not in old},
+        'removed': [name for name in old if name not in new],
+        'changed': {name: pct for name, pct in new.items() if name in old and old[name] != pct},
+    }
+    return {key: value for key, value in delta.items() if value}
+
+def apply_recipe_delta(state, delta):
+    removed = set(delta.get('removed', ()))
+    flavors = {name: pct for name, pct in state['flavors'].items() if name not in removed}
+    flavors.update(delta.get('changed', {}))
+    flavors.update(delta.get('added', {}))
+    return {**state, **delta.get('meta', {}), 'flavors': flavors}
+
+def _insert_version(conn, recipe_id, version, kind, depth, data):
+    conn.execute(
+        "INSERT INTO recipe_versions (recipe_id, version, kind, depth, data) VALUES (?, ?, ?, ?, ?)",
+        (recipe_id, version, kind, depth, json.dumps(data, separators=(',', ':')))
+    )
+
+def record_snapshot(conn, recipe_id, version, state):
+    _insert_version(conn, recipe_id, version, 'snapshot', 0, state)
+
+def record_save(conn, recipe_id, version, before, after):
+    """Record the save that took a recipe from ``version`` (state ``before``) to the next one."""
+    last = conn.execute(
+        "SELECT version, depth FROM recipe_versions WHERE recipe_id=? ORDER BY version DESC LIMIT 1", (recipe_id,)
+    ).fetchone()
+    depth = last[1] if last else 0
+    if last is None or last[0] != version:
+        # Saved before history was kept, imported, or moved on by a stash rename:
+        # start a new chain from the state this save began with.
+        record_snapshot(conn, recipe_id, version, before)
+        depth = 0
+    if depth + 1 >= RECIPE_SNAPSHOT_EVERY:
+        record_snapshot(conn, recipe_id, version + 1, after)
+    else:
+        _insert_version(conn, recipe_id, version + 1, 'delta', depth + 1, recipe_delta(before, after))
+
+def _change_summary(kind, data):
+    if kind == 'snapshot':
+        return f"Full copy, {len(data['flavors'])} flavors"
+    parts = [f"{len(data[key])} {key}" for key in ('added', 'removed', 'changed') if key in data]
+    parts += [f"{key.replace('_', ' ')} edited" for key in data.get('meta', {})]
+    return ", ".join(parts) or "No changes"
+
+def recipe_history(recipe_id):
+    """Saved versions of a recipe, newest first, as {'version', 'saved_at', 'summary'} dicts."""
+    rows = run_query(
+        "SELECT version, saved_at, kind, data FROM recipe_versions WHERE recipe_id=? ORDER BY version DESC",
+        (recipe_id,), fetch="all"
+    )
+    return [{'version': version, 'saved_at': saved_at, 'summary': _change_summary(kind, json.loads(data))}
+            for version, saved_at, kind, data in rows]
+
+def recipe_versions(recipe_id, versions):
+    """{version: state} for the requested saved versions, rebuilt from the nearest earlier snapshot."""
+    versions = sorted(set(versions))
+    if not versions:
+        return {}
+    start = run_query(
+        "SELECT MAX(version) FROM recipe_versions WHERE recipe_id=? AND kind='snapshot' AND version <= ?",
+        (recipe_id, versions[0]), fetch="one"
+    )[0]
+    if start is None:
+        return {}
+    rows = run_query(
+        "SELECT version, kind, data FROM recipe_versions WHERE recipe_id=? AND version BETWEEN ? AND ? ORDER BY version",
+        (recipe_id, start, versions[-1]), fetch="all"
+    )
+    wanted, states, state = set(versions), {}, None
+    for version, kind, data in rows:
+        data = json.loads(data)
+        state = data if kind == 'snapshot' else apply_recipe_delta(state, data)
+        if version in wanted:
+            states[version] = state
+    return states
+
+
+# --- Recipe Diff ---
+def recipe_labels(recipe_ids, names_by_id):
+    """Column label per recipe: its name, with the id appended when names repeat."""
+    names = [names_by_id[r_id] for r_id in recipe_ids]
+    return {r_id: name if names.count(name) == 1 else f"{name} (#{r_id})" for r_id, name in zip(recipe_ids, names)}
+
+def diff_matrix(frame, recipe_ids, baseline_id):
+    """Pivot recipe flavor rows into a flavor x recipe percentage matrix plus deltas vs the baseline."""
+    flavors = frame.dropna(subset=['flavor_name'])
+    matrix = flavors.pivot_table(index='flavor_name', columns='recipe_id', values='percentage', aggfunc='sum', fill_value=0.0)
+    matrix = matrix.reindex(columns=recipe_ids, fill_value=0.0).sort_index()
+    deltas = matrix.sub(matrix[baseline_id], axis=0).drop(columns=baseline_id)
+    return matrix, deltas
+
+def versions_frame(states):
+    """Rows like load_vapesim_frame's for saved versions of one recipe, with the version number as recipe_id."""
+    import pandas as pd
+
+    rows = [(version, state['name'], flavor_name, pct)
+            for version, state in states.items() for flavor_name, pct in (state['flavors'].items() or [(None, None)])]
+    frame = pd.DataFrame(rows, columns=['recipe_id', 'recipe_name', 'flavor_name', 'percentage'])
+    frame['category'] = get_flavor_catalog().categories(frame['flavor_name'].fillna(''), default=None)
+    return frame
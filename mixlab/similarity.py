@@ -0,0 +1,194 @@
+"""Nearest-recipe search over the recipe library."""
+import threading
+
+import numpy as np
+
+from mixlab.db import run_query, shared
+
+SIMILARITY_METRICS = ["Cosine", "L1"]
+
+class RecipeSimilarityIndex:
+    """Nearest-recipe search over a sparse recipe x flavor percentage matrix.
+
+    The bulk of the library lives in CSR arrays (indptr / indices / data) built
+    from recipe_flavors. Saves and deletes are recorded as overrides on top of
+    them and folded back in once enough pile up, so a single edit never
+    triggers a rebuild. Flavors are matched by case-folded name.
+    """
+
+    def __init__(self, compact_ratio=0.05, min_compact=1000):
+        self.compact_ratio = compact_ratio
+        self.min_compact = min_compact
+        self._lock = threading.Lock()
+        self._built = False
+
+    # -- building --
+    def _load(self):
+        import pandas as pd
+
+        rows = run_query("SELECT recipe_id, flavor_name, percentage FROM recipe_flavors WHERE flavor_name IS NOT NULL", fetch="all")
+        frame = pd.DataFrame(rows, columns=['recipe_id', 'flavor_name', 'percentage'])
+        frame['key'] = frame['flavor_name'].astype(object).map(str.casefold)
+        cols, vocab = pd.factorize(frame['key'])
+        self._vocab = {name: i for i, name in enumerate(vocab)}
+        frame['col'] = cols
+        frame = frame.groupby(['recipe_id', 'col'], as_index=False)['percentage'].sum()
+        recipe_ids = frame['recipe_id'].to_numpy(dtype=np.int64)
+        self._set_base(recipe_ids, frame['col'].to_numpy(dtype=np.int64), frame['percentage'].to_numpy(dtype=np.float64))
+        self._overrides = {}
+        self._built = True
+
+    def _set_base(self, row_recipe_ids, cols, vals):
+        # Inputs are sorted by recipe id; collapse them into CSR form.
+        ids, starts = np.unique(row_recipe_ids, return_index=True)
+        self._ids = ids
+        self._row_of = {int(r): i for i, r in enumerate(ids)}
+        self._indptr = np.append(starts, len(cols)).astype(np.int64)
+        self._indices = cols
+        self._data = vals
+        self._nnz_row = np.repeat(np.arange(len(ids)), np.diff(self._indptr))
+        self._l2 = np.sqrt(np.bincount(self._nnz_row, weights=vals ** 2, minlength=len(ids)))
+        self._l1 = np.bincount(self._nnz_row, weights=np.abs(vals), minlength=len(ids))
+        self._stale = np.zeros(len(ids), dtype=bool)
+
+    def _ensure_built(self):
+        if not self._built:
+            self._load()
+
+    def _vector(self, flavors, grow):
+        """Sparse (cols, vals) for (name, pct) pairs; unknown names get new columns when grow is set."""
+        merged = {}
+        extra = {}
+        for name, pct in flavors:
+            key = name.casefold()
+            col = self._vocab.get(key)
+            if col is None:
+                if not grow:
+                    extra[key] = extra.get(key, 0.0) + float(pct)
+                    continue
+                col = self._vocab[key] = len(self._vocab)
+            merged[col] = merged.get(col, 0.0) + float(pct)
+        cols = np.fromiter(merged.keys(), dtype=np.int64, count=len(merged))
+        vals = np.fromiter(merged.values(), dtype=np.float64, count=len(merged))
+        return cols, vals, np.fromiter(extra.values(), dtype=np.float64, count=len(extra))
+
+    def _compact(self):
+        keep = np.flatnonzero(~self._stale)
+        lengths = np.diff(self._indptr)[keep]
+        take = np.repeat(self._indptr[keep], lengths) + (np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+        ids = [np.repeat(self._ids[keep], lengths)]
+        cols, vals = [self._indices[take]], [self._data[take]]
+        for r_id, (o_cols, o_vals) in self._overrides.items():
+            if o_cols is not None and len(o_cols):
+                order = np.argsort(o_cols)
+                ids.append(np.full(len(o_cols), r_id, dtype=np.int64))
+                cols.append(o_cols[order])
+                vals.append(o_vals[order])
+        ids, cols, vals = np.concatenate(ids), np.concatenate(cols), np.concatenate(vals)
+        order = np.argsort(ids, kind='stable')
+        self._set_base(ids[order], cols[order], vals[order])
+        self._overrides = {}
+
+    # -- incremental updates --
+    def upsert(self, recipe_id, flavors):
+        """Record a saved recipe's (name, pct) flavors."""
+        with self._lock:
+            if not self._built:
+                return # The first search loads everything from the database anyway
+            row = self._row_of.get(recipe_id)
+            if row is not None:
+                self._stale[row] = True
+            cols, vals, _ = self._vector(flavors, grow=True)
+            self._overrides[recipe_id] = (cols, vals)
+            self._maybe_compact()
+
+    def remove(self, recipe_id):
+        with self._lock:
+            if not self._built:
+                return
+            row = self._row_of.get(recipe_id)
+            if row is not None:
+                self._stale[row] = True
+            self._overrides[recipe_id] = (None, None)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if len(self._overrides) > max(self.min_compact, self.compact_ratio * len(self._ids)):
+            self._compact()
+
+    def invalidate(self):
+        with self._lock:
+            self._built = False
+
+    # -- queries --
+    def _scores(self, q_cols, q_vals, q_extra, metric):
+        q = np.zeros(len(self._vocab), dtype=np.float64)
+        q[q_cols] = q_vals
+        qv = q[self._indices]
+        n = len(self._ids)
+        if metric == "Cosine":
+            q_norm = np.sqrt(np.sum(q_vals ** 2) + np.sum(q_extra ** 2))
+            dots = np.bincount(self._nnz_row, weights=self._data * qv, minlength=n)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scores = np.where(self._l2 > 0, dots / (self._l2 * q_norm), 0.0) if q_norm else np.zeros(n)
+            def score_row(cols, vals):
+                norm = np.sqrt(np.sum(vals ** 2))
+                return float(np.dot(vals, q[cols]) / (norm * q_norm)) if norm and q_norm else 0.0
+        else:
+            q_l1 = np.sum(np.abs(q_vals)) + np.sum(np.abs(q_extra))
+            overlap = np.bincount(self._nnz_row, weights=self._data + qv - np.abs(self._data - qv), minlength=n)
+            # Recipes with no flavor in common score 0, as under Cosine
+            scores = np.where(overlap > 0, 1.0 / (1.0 + self._l1 + q_l1 - overlap), 0.0)
+            def score_row(cols, vals):
+                qc = q[cols]
+                shared = np.sum(vals + qc - np.abs(vals - qc))
+                return float(1.0 / (1.0 + np.sum(np.abs(vals)) + q_l1 - shared)) if shared > 0 else 0.0
+        return scores, score_row
+
+    def nearest(self, flavors, k=5, metric="Cosine", exclude_id=None):
+        """Top-k (recipe_id, similarity) for a list of (name, pct) flavors, best first.
+
+        Only recipes sharing at least one flavor with the query are candidates.
+        """
+        with self._lock:
+            self._ensure_built()
+            q_cols, q_vals, q_extra = self._vector(flavors, grow=False)
+            scores, score_row = self._scores(q_cols, q_vals, q_extra, metric)
+            scores[self._stale] = -np.inf
+            if exclude_id is not None and exclude_id in self._row_of:
+                scores[self._row_of[exclude_id]] = -np.inf
+            extra = [(r_id, score_row(cols, vals)) for r_id, (cols, vals) in self._overrides.items()
+                     if cols is not None and len(cols) and r_id != exclude_id]
+            ids = self._ids
+
+        extra = [(r_id, score) for r_id, score in extra if score > 0]
+        top = np.flatnonzero(np.isfinite(scores) & (scores > 0))
+        if len(top) > k:
+            top = top[np.argpartition(-scores[top], k - 1)[:k]]
+        candidates = [(int(ids[i]), float(scores[i])) for i in top] + extra
+        return sorted(candidates, key=lambda c: (-c[1], c[0]))[:k]
+
+    def nearest_to_recipe(self, recipe_id, k=5, metric="Cosine"):
+        flavors = run_query("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=? AND flavor_name IS NOT NULL", (recipe_id,), fetch="all")
+        return self.nearest(flavors, k=k, metric=metric, exclude_id=recipe_id)
+
+@shared
+def get_similarity_index():
+    return RecipeSimilarityIndex()
+
+def similar_recipes_frame(results, names_by_id):
+    import pandas as pd
+
+    return pd.DataFrame(
+        [(names_by_id.get(r_id, f"#{r_id}"), score) for r_id, score in results],
+        columns=['Recipe', 'Similarity']
+    )
+
+def sync_similarity_index(recipe_id):
+    """Push one recipe's current flavors (or its deletion) into the similarity index."""
+    flavors = run_query("SELECT flavor_name, percentage FROM recipe_flavors WHERE recipe_id=? AND flavor_name IS NOT NULL", (recipe_id,), fetch="all")
+    exists = run_query("SELECT 1 FROM recipes WHERE id=?", (recipe_id,), fetch="one")
+    if exists:
+        get_similarity_index().upsert(recipe_id, flavors)
+    else:
+        get_similarity_index().remove(recipe_id)
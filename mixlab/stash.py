@@ -0,0 +1,100 @@
+"""Flavor stash edits as change sets: diffed, validated and written in one transaction."""
+import json
+
+from mixlab.db import StaleWriteError
+
+STASH_COLUMNS = ['Name', 'Brand', 'Category']
+
+def _clean_name(name):
+    return name.strip() if isinstance(name, str) else ''
+
+def _db_values(df):
+    # NaN -> None so SQLite stores NULL
+    return df.astype(object).where(df.notna(), None)
+
+def compute_stash_changes(stash_df, edited_df):
+    """Diff the stash as loaded against the edited table.
+
+    Returns (inserts, updates, deletes): new rows, changed rows indexed by id,
+    and the ids of removed rows.
+    """
+    edited = edited_df.copy()
+    edited['Name'] = edited['Name'].map(_clean_name, na_action='ignore')
+    has_id = edited['id'].notna()
+    inserts = edited.loc[~has_id, STASH_COLUMNS].reset_index(drop=True)
+    kept = edited.loc[has_id].astype({'id': 'int64'}).set_index('id')[STASH_COLUMNS]
+    before = stash_df.astype({'id': 'int64'}).set_index('id')[STASH_COLUMNS]
+    deletes = before.index.difference(kept.index).tolist()
+    common = kept.index.intersection(before.index)
+    after, prior = kept.loc[common], before.loc[common]
+    changed = ((after != prior) & ~(after.isna() & prior.isna())).any(axis=1)
+    return inserts, after[changed], deletes
+
+def validate_stash_changes(stash_df, inserts, updates, deletes):
+    """Per-row problems that would make the change set fail, as a list of dicts."""
+    import pandas as pd
+
+    final = stash_df.astype({'id': 'int64'}).set_index('id')['Name'].drop(deletes)
+    final.loc[updates.index] = updates['Name']
+    rows = pd.DataFrame({
+        'Row': [f"#{i}" for i in final.index] + [f"New row {i + 1}" for i in range(len(inserts))],
+        'Name': final.tolist() + inserts['Name'].tolist(),
+        'touched': final.index.isin(updates.index).tolist() + [True] * len(inserts),
+    })
+    names = rows['Name'].map(_clean_name)
+    blank = names == ''
+    duplicate = names.map(str.casefold).duplicated(keep=False) & ~blank
+    errors = []
+    for row in rows[rows['touched'] & blank].itertuples():
+        errors.append({'Row': row.Row, 'Name': row.Name, 'Problem': "Flavor name is required."})
+    for row in rows[rows['touched'] & duplicate].itertuples():
+        errors.append({'Row': row.Row, 'Name': row.Name, 'Problem': "Another flavor already has this name."})
+    return errors
+
+def _check_versions(conn, versions, ids):
+    """Raise StaleWriteError if any of these rows moved past the version the editor loaded."""
+    ids = [int(i) for i in ids]
+    current = {row[0]: row[1:] for row in conn.execute(
+        "SELECT id, version, name FROM flavor_stash WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(ids),)
+    )}
+    stale = []
+    for i in ids:
+        if i not in current:
+            stale.append(f"#{i} (removed)")
+        elif current[i][0] != versions[i]:
+            stale.append(current[i][1])
+    if stale:
+        shown = ", ".join(stale[:5]) + (f" and {len(stale) - 5} more" if len(stale) > 5 else "")
+        raise StaleWriteError(f"Someone else changed {shown} since you loaded the stash, so nothing was saved. "
+                              "Reload the stash and make your edits again.")
+
+def apply_stash_changes(writer, inserts, updates, deletes, versions=None):
+    """Write a change set as one transaction on the serialized writer.
+
+    ``versions`` maps id -> version as the stash was loaded; when given, the
+    whole change set is rejected with StaleWriteError if any updated or deleted
+    row changed since.
+    """
+    updates = _db_values(updates)
+    def apply(conn):
+        if versions is not None:
+            _check_versions(conn, versions, list(deletes) + updates.index.tolist())
+        conn.executemany("DELETE FROM flavor_stash WHERE id=?", [(int(i),) for i in deletes])
+        ids = [int(i) for i in updates.index]
+        current = dict(conn.execute("SELECT id, name FROM flavor_stash WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(ids),)))
+        rows = [(name, brand, category, i) for i, (name, brand, category) in zip(ids, updates.itertuples(index=False))]
+        renamed = [row for row in rows if row[0] != current.get(row[3])]
+        # Only renames touch name, so only they fire the rename triggers that rewrite recipes
+        conn.executemany("UPDATE flavor_stash SET brand=?, category=?, version=version + 1 WHERE id=?",
+                         [row[1:] for row in rows if row[0] == current.get(row[3])])
+        # Park renamed rows on a unique placeholder first so swapped names don't trip UNIQUE(name).
+        # Parking leaves version alone, so recipes using the flavor are bumped once, by the real rename.
+        conn.executemany("UPDATE flavor_stash SET name=? WHERE id=?", [(f"\0rename:{row[3]}", row[3]) for row in renamed])
+        # A plain UPDATE, not an upsert: an upsert's conflict handling would override the
+        # OR IGNORE in the search triggers that the rename cascades into
+        conn.executemany("UPDATE flavor_stash SET name=?, brand=?, category=?, version=version + 1 WHERE id=?", renamed)
+        conn.executemany(
+            "INSERT INTO flavor_stash (name, brand, category) VALUES (?, ?, ?)",
+            list(_db_values(inserts).itertuples(index=False, name=None))
+        )
+    writer.write(apply)
@@ -0,0 +1,55 @@
+"""Steep tracking: marking finished recipes Ready and paging through the steep list."""
+import datetime
+import threading
+import time
+
+from mixlab.db import get_writer, run_query, shared
+
+STEEP_FILTERS = ["Steeping", "Ready soon", "Ready", "All"]
+READY_SOON_WINDOW = datetime.timedelta(days=2)
+STEEP_PAGE_SIZES = [10, 25, 50, 100]
+
+class SteepSweeper:
+    """Marks every finished recipe Ready with one set-based UPDATE, at most once per interval."""
+
+    def __init__(self, interval=60.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_sweep = None
+
+    def sweep(self, force=False):
+        """Returns the number of recipes marked Ready, or None if the sweep was skipped."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._last_sweep is not None and now - self._last_sweep < self.interval:
+                return None
+            self._last_sweep = now
+        now_iso = datetime.datetime.now().isoformat()
+        return get_writer().write(lambda conn: conn.execute(
+            "UPDATE recipes SET status='Ready' WHERE steep_end_date <= ? AND status != 'Ready'", (now_iso,)
+        ).rowcount)
+
+@shared
+def get_steep_sweeper():
+    return SteepSweeper()
+
+def steep_filter_clause(steep_filter, now):
+    soon = (now + READY_SOON_WINDOW).isoformat()
+    return {
+        "Steeping": ("status != 'Ready' AND (steep_end_date IS NULL OR steep_end_date > ?)", (soon,)),
+        "Ready soon": ("status != 'Ready' AND steep_end_date <= ?", (soon,)),
+        "Ready": ("status = 'Ready'", ()),
+        "All": ("1=1", ()),
+    }[steep_filter]
+
+def fetch_steep_page(steep_filter, page, page_size, now=None):
+    """One page of steeping recipes for the filter, plus the total number of matches."""
+    clause, params = steep_filter_clause(steep_filter, now or datetime.datetime.now())
+    where = f"WHERE steep_days > 0 AND {clause}"
+    total = run_query(f"SELECT COUNT(*) FROM recipes {where}", params, fetch="one", cache=False)[0]
+    rows = run_query(
+        f"SELECT id, name, steep_days, steep_end_date, status FROM recipes {where} "
+        "ORDER BY steep_end_date, id LIMIT ? OFFSET ?",
+        params + (page_size, page * page_size), fetch="all", cache=False
+    )
+    return rows, total
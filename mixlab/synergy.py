@@ -0,0 +1,98 @@
+"""Flavor pairing scores: the category synergy rules and their vectorized forms."""
+import numpy as np
+
+from mixlab.catalog import CATEGORIES
+
+# Mock synergy logic
+def get_synergy(cat1, cat2):
+    if cat1 == cat2: return 0.3 # e.g., two fruits
+    if (cat1 in ['Fruit'] and cat2 in ['Cream', 'Custard']) or \
+       (cat2 in ['Fruit'] and cat1 in ['Cream', 'Custard']): return 0.9
+    if (cat1 in ['Bakery'] and cat2 in ['Fruit', 'Cream', 'Custard']) or \
+       (cat2 in ['Bakery'] and cat1 in ['Fruit', 'Cream', 'Custard']): return 0.8
+    if (cat1 in ['Tobacco'] and cat2 in ['Cream', 'Custard', 'Bakery']) or \
+       (cat2 in ['Tobacco'] and cat1 in ['Cream', 'Custard', 'Bakery']): return 0.7
+    if (cat1 in ['Menthol'] and cat2 in ['Fruit']) or \
+       (cat2 in ['Menthol'] and cat1 in ['Fruit']): return 0.6
+    if (cat1 in ['Sweetener']) or (cat2 in ['Sweetener']): return 0.5
+    return 0.1 # Low but not zero synergy
+
+def encode_categories(flavor_categories):
+    """Map each flavor's category to an integer code; returns (codes, categories)."""
+    index = {}
+    codes = np.fromiter((index.setdefault(c, len(index)) for c in flavor_categories), dtype=np.intp, count=len(flavor_categories))
+    return codes, list(index)
+
+def synergy_table(categories):
+    """Category x category score table built from get_synergy."""
+    table = np.empty((len(categories), len(categories)), dtype=np.float32)
+    for i, cat1 in enumerate(categories):
+        for j, cat2 in enumerate(categories):
+            table[i, j] = get_synergy(cat1, cat2)
+    return table
+
+def synergy_matrix(flavor_categories):
+    """Flavor x flavor synergy scores, with 1.0 on the diagonal."""
+    codes, categories = encode_categories(flavor_categories)
+    matrix = synergy_table(categories)[codes[:, None], codes[None, :]]
+    np.fill_diagonal(matrix, 1.0)
+    return matrix
+
+def _top_k_in_order(scores, flat, k):
+    # Keep the k best scores; ties go to the earliest pairs so results match a row-major scan.
+    if k is None or len(scores) <= k:
+        return scores, flat
+    cutoff = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > cutoff)
+    ties = np.flatnonzero(scores == cutoff)[:k - len(above)]
+    keep = np.sort(np.concatenate([above, ties]))
+    return scores[keep], flat[keep]
+
+def top_synergy_pairs(flavor_categories, k=10, threshold=0.75, block_cells=4_000_000, progress=None):
+    """Best (i, j, score) flavor pairs with i < j and score > threshold, highest first.
+
+    Works through the upper triangle a block of rows at a time straight from the
+    category table, so the full N x N matrix is never materialized. ``progress``
+    is called with the fraction of rows done after each block.
+    """
+    codes, categories = encode_categories(flavor_categories)
+    table = synergy_table(categories)
+    n = len(codes)
+    block = max(1, block_cells // max(n, 1))
+    best_scores = np.empty(0, dtype=np.float32)
+    best_flat = np.empty(0, dtype=np.int64)
+    for start in range(0, n, block):
+        stop = min(n, start + block)
+        chunk = table[codes[start:stop, None], codes[None, :]]
+        mask = np.triu(chunk > threshold, k=start + 1)
+        rows, cols = np.nonzero(mask)
+        scores = chunk[rows, cols]
+        flat = (rows + start).astype(np.int64) * n + cols
+        scores, flat = _top_k_in_order(scores, flat, k)
+        best_scores, best_flat = _top_k_in_order(np.concatenate([best_scores, scores]), np.concatenate([best_flat, flat]), k)
+        if progress:
+            progress(stop / n)
+    order = np.argsort(-best_scores, kind='stable')
+    return [(int(best_flat[i] // n), int(best_flat[i] % n), float(best_scores[i])) for i in order]
+
+def synergy_block(codes, table, rows, cols):
+    """Scores for the given row/column flavor positions, as tenths in a uint8 grid."""
+    block = table[codes[rows][:, None], codes[cols][None, :]]
+    block[rows[:, None] == cols[None, :]] = 1.0
+    return np.rint(block * 10).astype(np.uint8)
+
+def category_synergy(flavor_categories):
+    """Mean synergy between every pair of categories, with flavor counts per category."""
+    codes, categories = encode_categories(flavor_categories)
+    counts = np.bincount(codes, minlength=len(categories)).astype(np.float64)
+    agg = synergy_table(categories).astype(np.float64)
+    # Same-category cells include each flavor paired with itself, which scores 1.0
+    same = np.diag(agg).copy()
+    agg[np.diag_indices_from(agg)] = (counts + counts * (counts - 1) * same) / counts ** 2
+    return categories, counts.astype(int), agg
+
+def cluster_by_category(stash):
+    """Split (name, category) rows into names and categories, reordered so each category forms one contiguous block."""
+    rank = {c: i for i, c in enumerate(CATEGORIES)}
+    order = sorted(range(len(stash)), key=lambda i: rank.get(stash[i][1], len(rank)))
+    return [stash[i][0] for i in order], [stash[i][1] for i in order]
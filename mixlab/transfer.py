@@ -0,0 +1,473 @@
+"""Streaming CSV / JSON / JSON Lines import and export of stashes and recipe libraries.
+
+Rows are read and written a chunk at a time, so files of any size go through in
+bounded memory: exports page through a cursor with fetchmany, and imports hand
+each chunk to the serialized writer as one executemany write.
+
+    python -m mixlab.transfer export recipes recipes.csv
+    python -m mixlab.transfer export library library.jsonl
+    python -m mixlab.transfer import stash flavors.csv --update
+    python -m mixlab.transfer import recipes recipes.csv --flavors recipe_flavors.csv
+
+Tables are ``flavor_stash``, ``recipes`` and ``recipe_flavors``. ``library`` is
+recipes with their flavors nested under a ``flavors`` key (JSON formats only),
+and it can be imported in the same form.
+"""
+import argparse
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+import re
+import sys
+
+from mixlab.catalog import CATEGORIES
+from mixlab.db import configure, get_pool, get_writer
+
+FORMATS = ['csv', 'jsonl', 'json']
+EXPORTS = {
+    'flavor_stash': (['name', 'brand', 'category'], "SELECT name, brand, category FROM flavor_stash ORDER BY id"),
+    'recipes': (['id', 'name', 'notes', 'steep_days', 'created_at', 'steep_end_date', 'status'],
+                "SELECT id, name, notes, steep_days, created_at, steep_end_date, status FROM recipes ORDER BY id"),
+    'recipe_flavors': (['recipe_id', 'flavor_name', 'percentage'],
+                       "SELECT recipe_id, flavor_name, percentage FROM recipe_flavors ORDER BY recipe_id, id"),
+}
+LIBRARY_QUERY = """
+    SELECT r.id, r.name, r.notes, r.steep_days, r.created_at, r.steep_end_date, r.status, rf.flavor_name, rf.percentage
+    FROM recipes r LEFT JOIN recipe_flavors rf ON rf.recipe_id = r.id
+    ORDER BY r.id, rf.id
+"""
+STATUSES = ['Steeping', 'Ready']
+CHUNK_SIZE = 2000
+_SEPARATORS = re.compile(r"[ \t\r\n,]*")
+
+def format_for(filename):
+    """Guess the format from a file name's extension."""
+    ext = os.path.splitext(filename)[1].lower().lstrip('.')
+    if ext == 'ndjson':
+        return 'jsonl'
+    if ext not in FORMATS:
+        raise ValueError(f"Unsupported file type '.{ext}'; use one of: {', '.join('.' + f for f in FORMATS)}")
+    return ext
+
+
+# --- Export ---
+class _Writer:
+    """Writes dict rows to a text stream as CSV, JSON Lines or one JSON array."""
+
+    def __init__(self, out, fmt, columns):
+        self.out = out
+        self.fmt = fmt
+        self.first = True
+        if fmt == 'csv':
+            self.csv = csv.DictWriter(out, fieldnames=columns, extrasaction='ignore')
+            self.csv.writeheader()
+        elif fmt == 'json':
+            out.write("[")
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            self.csv.writerow(record)
+        elif self.fmt == 'jsonl':
+            self.out.write(json.dumps(record) + "\n")
+        else:
+            self.out.write(("\n" if self.first else ",\n") + json.dumps(record))
+        self.first = False
+
+    def close(self):
+        if self.fmt == 'json':
+            self.out.write("\n]\n" if not self.first else "]\n")
+
+def export_table(table, out, fmt, chunk_size=CHUNK_SIZE, progress=None):
+    """Stream one table (or ``library``) to a text stream; returns the number of records written."""
+    if table == 'library':
+        return export_library(out, fmt, chunk_size, progress)
+    columns, query = EXPORTS[table]
+    writer = _Writer(out, fmt, columns)
+    written = 0
+    with get_pool().snapshot() as conn:
+        cursor = conn.execute(query)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                writer.write(dict(zip(columns, row)))
+            written += len(rows)
+            if progress:
+                progress(written)
+    writer.close()
+    return written
+
+def export_library(out, fmt, chunk_size=CHUNK_SIZE, progress=None):
+    """Stream every recipe with its flavors nested under ``flavors``."""
+    if fmt == 'csv':
+        raise ValueError("The library export nests flavors, so it needs JSON or JSON Lines; export recipes and recipe_flavors as CSV instead.")
+    columns = EXPORTS['recipes'][0]
+    writer = _Writer(out, fmt, columns)
+    written = 0
+    with get_pool().snapshot() as conn:
+        cursor = conn.execute(LIBRARY_QUERY)
+        rows = iter(lambda: cursor.fetchmany(chunk_size), [])
+        for _, group in itertools.groupby(itertools.chain.from_iterable(rows), key=lambda row: row[0]):
+            group = list(group)
+            record = dict(zip(columns, group[0][:7]))
+            record['flavors'] = [{'name': name, 'percentage': pct} for *_, name, pct in group if name is not None]
+            writer.write(record)
+            written += 1
+            if progress and written % chunk_size == 0:
+                progress(written)
+    writer.close()
+    if progress:
+        progress(written)
+    return written
+
+
+# --- Import ---
+class RowReader:
+    """Streams dict rows from a binary CSV, JSON (array of objects) or JSON Lines file.
+
+    ``bytes_read`` tracks the position in the underlying file for progress bars.
+    """
+
+    def __init__(self, f, fmt, chunk_size=1 << 16):
+        self.f = f
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+
+    @property
+    def bytes_read(self):
+        return self.f.tell()
+
+    def __iter__(self):
+        text = io.TextIOWrapper(self.f, encoding='utf-8-sig', newline='')
+        try:
+            if self.fmt == 'csv':
+                yield from csv.DictReader(text)
+            elif self.fmt == 'jsonl':
+                for line in text:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield from self._json_array(text)
+        finally:
+            text.detach() # Leave the caller's file open
+
+    def _json_array(self, text):
+        decoder = json.JSONDecoder()
+        buf, eof = "", False
+        while not eof and not buf.strip():
+            chunk = text.read(self.chunk_size)
+            eof, buf = not chunk, buf + chunk
+        buf = buf.lstrip()
+        if not buf.startswith("["):
+            raise ValueError("Expected a JSON array of objects.")
+        # Decode from an offset and only drop consumed text on refill, so each
+        # record costs its own length rather than a copy of the rest of the buffer
+        pos = 1
+        while True:
+            pos = _SEPARATORS.match(buf, pos).end()
+            if buf.startswith("]", pos):
+                return
+            try:
+                if pos == len(buf):
+                    raise json.JSONDecodeError("need more data", buf, pos)
+                record, pos_end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError("The JSON array is cut off or malformed.")
+                chunk = text.read(self.chunk_size)
+                eof, buf, pos = not chunk, buf[pos:] + chunk, 0
+                continue
+            yield record
+            pos = pos_end
+
+class ImportReport:
+    """What an import did: records read, rows written per table, rows skipped and the first problems."""
+    MAX_ERRORS = 100
+
+    def __init__(self):
+        self.rows_read = 0
+        self.written = {}
+        self.updated = 0
+        self.skipped = 0
+        self.errors = []
+        self.error_count = 0
+
+    def error(self, row, name, problem):
+        self.error_count += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append({'Row': f"#{row}", 'Name': name, 'Problem': problem})
+
+    def wrote(self, table, count):
+        self.written[table] = self.written.get(table, 0) + count
+
+    def to_dict(self):
+        return {'rows_read': self.rows_read, 'written': self.written, 'updated': self.updated,
+                'skipped': self.skipped, 'error_count': self.error_count, 'errors': self.errors}
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+_CATEGORY_BY_KEY = {c.casefold(): c for c in CATEGORIES}
+
+def import_stash(rows, on_duplicate="skip", chunk_size=CHUNK_SIZE, progress=None):
+    """Add stash flavors from dict rows with name, brand and category.
+
+    Names are matched case-insensitively against the stash and earlier rows of
+    the same file; a repeat is skipped, or with ``on_duplicate="update"`` its
+    brand and category overwrite the stored flavor. A missing category becomes
+    Other.
+    """
+    report = ImportReport()
+    writer = get_writer()
+    with get_pool().connection() as conn:
+        existing = {name.casefold(): f_id for f_id, name in conn.execute("SELECT id, name FROM flavor_stash")}
+    seen = set()
+    for chunk in _chunks(enumerate(rows, 1), chunk_size):
+        inserts, updates = [], []
+        for row_no, row in chunk:
+            report.rows_read += 1
+            if not isinstance(row, dict):
+                report.error(row_no, None, "Expected an object with name, brand and category.")
+                continue
+            name, brand = _text(row.get('name')), _text(row.get('brand'))
+            category = _CATEGORY_BY_KEY.get((_text(row.get('category')) or 'Other').casefold())
+            if name is None:
+                report.error(row_no, None, "Flavor name is required.")
+            elif category is None:
+                report.error(row_no, name, f"Unknown category '{row.get('category')}'; use one of {', '.join(CATEGORIES)}.")
+            elif name.casefold() in seen:
+                report.skipped += 1 # Listed earlier in the same file
+            elif name.casefold() in existing:
+                seen.add(name.casefold())
+                if on_duplicate == "update":
+                    updates.append((brand, category, existing[name.casefold()]))
+                else:
+                    report.skipped += 1
+            else:
+                seen.add(name.casefold())
+                inserts.append((name, brand, category))
+        def write(conn, inserts=inserts, updates=updates):
+            # Flavors added since ``existing`` was read count as duplicates too
+            taken = {name.casefold(): f_id for f_id, name in conn.execute(
+                "SELECT id, name FROM flavor_stash WHERE name COLLATE NOCASE IN (SELECT value FROM json_each(?))",
+                (json.dumps([name for name, _, _ in inserts]),)
+            )}
+            if on_duplicate == "update":
+                updates = updates + [(brand, category, taken[name.casefold()]) for name, brand, category in inserts if name.casefold() in taken]
+            added = [row for row in inserts if row[0].casefold() not in taken]
+            conn.executemany("INSERT INTO flavor_stash (name, brand, category) VALUES (?, ?, ?)", added)
+            updated = conn.executemany("UPDATE flavor_stash SET brand=?, category=?, version=version + 1 WHERE id=?", updates).rowcount if updates else 0
+            return len(added), updated
+        added, updated = writer.write(write)
+        report.wrote('flavor_stash', added)
+        report.updated += updated
+        report.skipped += len(inserts) + len(updates) - added - updated
+        if progress:
+            progress(report)
+    return report
+
+def _parse_time(value, row_no, name, field, report):
+    value = _text(value)
+    if value is None:
+        return None, True
+    try:
+        return datetime.datetime.fromisoformat(value), True
+    except ValueError:
+        report.error(row_no, name, f"{field} '{value}' is not an ISO date.")
+        return None, False
+
+def _clean_recipe(row_no, row, report, now):
+    """Validated (name, notes, steep_days, created_at, steep_end_date, status), or None."""
+    if not isinstance(row, dict):
+        report.error(row_no, None, "Expected a recipe object.")
+        return None
+    name = _text(row.get('name'))
+    if name is None:
+        report.error(row_no, None, "Recipe name is required.")
+        return None
+    try:
+        steep_days = int(float(_text(row.get('steep_days')) or 7))
+    except (ValueError, OverflowError):
+        report.error(row_no, name, f"Steep days '{row.get('steep_days')}' is not a number.")
+        return None
+    if steep_days < 0:
+        report.error(row_no, name, "Steep days cannot be negative.")
+        return None
+    status = _text(row.get('status')) or 'Steeping'
+    if status not in STATUSES:
+        report.error(row_no, name, f"Unknown status '{status}'; use {' or '.join(STATUSES)}.")
+        return None
+    created, ok = _parse_time(row.get('created_at'), row_no, name, "Created date", report)
+    end, ok_end = _parse_time(row.get('steep_end_date'), row_no, name, "Steep end date", report)
+    if not (ok and ok_end):
+        return None
+    created = created or now
+    try:
+        end = end or created + datetime.timedelta(days=steep_days)
+    except OverflowError:
+        report.error(row_no, name, f"Steep days '{row.get('steep_days')}' is too large.")
+        return None
+    return name, _text(row.get('notes')), steep_days, created.isoformat(sep=' ', timespec='seconds'), end.isoformat(), status
+
+def _clean_flavor(row_no, recipe_name, flavor, report):
+    """Validated (flavor_name, percentage), or None."""
+    if not isinstance(flavor, dict):
+        report.error(row_no, recipe_name, "Expected a flavor object with flavor_name and percentage.")
+        return None
+    name = _text(flavor.get('flavor_name', flavor.get('name')))
+    if name is None:
+        report.error(row_no, recipe_name, "Flavor name is required.")
+        return None
+    try:
+        pct = float(_text(flavor.get('percentage')) or 'nan')
+    except ValueError:
+        pct = float('nan')
+    if not 0 <= pct <= 100:
+        report.error(row_no, recipe_name, f"Percentage for {name} must be a number from 0 to 100.")
+        return None
+    return name, pct
+
+# Skips a flavor already on the recipe, so re-running an import does not double it up
+_INSERT_FLAVOR = """
+    INSERT INTO recipe_flavors (recipe_id, flavor_name, percentage)
+    SELECT ?1, ?2, ?3 WHERE NOT EXISTS (
+        SELECT 1 FROM recipe_flavors WHERE recipe_id = ?1 AND flavor_name = ?2 COLLATE NOCASE
+    )
+"""
+
+def _next_recipe_id(conn):
+    # recipes is AUTOINCREMENT, so never hand out an id below the sequence
+    return 1 + conn.execute(
+        "SELECT max(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'recipes'), 0), COALESCE((SELECT MAX(id) FROM recipes), 0))"
+    ).fetchone()[0]
+
+def import_recipes(recipe_rows, flavor_rows=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Add recipes from dict rows, with flavors nested under ``flavors`` and/or in ``flavor_rows``.
+
+    Imported recipes always get new ids. ``flavor_rows`` (recipe_id,
+    flavor_name, percentage) refer to the ``id`` column of the recipe rows,
+    which is only used for that mapping. A flavor already on its recipe is
+    skipped, which also covers a repeat within one recipe.
+    """
+    report = ImportReport()
+    writer = get_writer()
+    now = datetime.datetime.now()
+    id_map = {}
+    for chunk in _chunks(enumerate(recipe_rows, 1), chunk_size):
+        recipes, sources, flavors = [], [], []
+        for row_no, row in chunk:
+            report.rows_read += 1
+            recipe = _clean_recipe(row_no, row, report, now)
+            if recipe is None:
+                continue
+            nested = row.get('flavors') or []
+            if not isinstance(nested, list):
+                report.error(row_no, recipe[0], "Flavors must be a list of flavor objects.")
+                nested = []
+            for flavor in nested:
+                cleaned = _clean_flavor(row_no, recipe[0], flavor, report)
+                if cleaned is not None:
+                    flavors.append((len(recipes), *cleaned))
+            sources.append(_text(row.get('id')))
+            recipes.append(recipe)
+        def write(conn, recipes=recipes, flavors=flavors):
+            # Ids are handed out inside the write, so concurrent saves can't take them first
+            next_id = _next_recipe_id(conn)
+            conn.executemany(
+                "INSERT INTO recipes (id, name, notes, steep_days, created_at, steep_end_date, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(next_id + i, *recipe) for i, recipe in enumerate(recipes)]
+            )
+            added = conn.executemany(_INSERT_FLAVOR, [(next_id + i, *f) for i, *f in flavors]).rowcount if flavors else 0
+            return next_id, added
+        next_id, added = writer.write(write)
+        id_map.update((source_id, next_id + i) for i, source_id in enumerate(sources) if source_id is not None)
+        report.wrote('recipes', len(recipes))
+        report.wrote('recipe_flavors', added)
+        report.skipped += len(flavors) - added
+        if progress:
+            progress(report)
+
+    for chunk in _chunks(enumerate(flavor_rows or (), 1), chunk_size):
+        flavors = []
+        for row_no, row in chunk:
+            report.rows_read += 1
+            if not isinstance(row, dict):
+                report.error(row_no, None, "Expected an object with recipe_id, flavor_name and percentage.")
+                continue
+            recipe_id = id_map.get(_text(row.get('recipe_id')))
+            if recipe_id is None:
+                report.error(row_no, None, f"Flavor row points at recipe '{row.get('recipe_id')}', which is not in the recipe file.")
+                continue
+            cleaned = _clean_flavor(row_no, None, row, report)
+            if cleaned is not None:
+                flavors.append((recipe_id, *cleaned))
+        added = writer.write(lambda conn, flavors=flavors: conn.executemany(_INSERT_FLAVOR, flavors).rowcount if flavors else 0)
+        report.wrote('recipe_flavors', added)
+        report.skipped += len(flavors) - added
+        if progress:
+            progress(report)
+    return report
+
+
+# --- Command Line ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mixlab.transfer", description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="database file (default: $MIXLAB_DB or mixlab.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export")
+    export.add_argument("table", choices=[*EXPORTS, 'library'])
+    export.add_argument("path", help="output file; '-' for stdout (then pass --format)")
+    export.add_argument("--format", choices=FORMATS)
+    imp = commands.add_parser("import")
+    imp.add_argument("kind", choices=['stash', 'recipes'])
+    imp.add_argument("path")
+    imp.add_argument("--flavors", help="recipe_flavors file to import alongside a recipes file")
+    imp.add_argument("--update", action="store_true", help="update brand/category of stash flavors that already exist")
+    args = parser.parse_args(argv)
+
+    configure(args.db)
+    if args.command == "export":
+        fmt = args.format or format_for(args.path)
+        out = sys.stdout if args.path == "-" else open(args.path, "w", newline='', encoding='utf-8')
+        try:
+            count = export_table(args.table, out, fmt, progress=lambda n: print(f"\r{n} records", end="", file=sys.stderr))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"\r{count} records written", file=sys.stderr)
+        return
+
+    def show(report):
+        print(f"\r{report.rows_read} rows read", end="", file=sys.stderr)
+
+    with open(args.path, "rb") as f:
+        rows = RowReader(f, format_for(args.path))
+        if args.kind == "stash":
+            report = import_stash(rows, "update" if args.update else "skip", progress=show)
+        elif args.flavors:
+            with open(args.flavors, "rb") as ff:
+                report = import_recipes(rows, RowReader(ff, format_for(args.flavors)), progress=show)
+        else:
+            report = import_recipes(rows, progress=show)
+    print(file=sys.stderr)
+    print(json.dumps(report.to_dict(), indent=2))
+    if report.error_count:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
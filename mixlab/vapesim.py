@@ -0,0 +1,275 @@
+"""VapeSim: the mock flavor-profile analysis, vectorized over whole recipe libraries.
+
+pandas is imported inside the functions that build frames, so importing this
+module stays cheap for callers that only need the constants or the cache.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from mixlab.catalog import CATEGORIES, FLAVOR_PROPERTIES, get_flavor_catalog
+from mixlab.db import get_writer, run_query, shared
+
+NOTES = ['Top', 'Mid', 'Base', 'Accent']
+STEEP_DAYS = [1, 7, 14, 30]
+NOTE_BY_CATEGORY = {category: props['note'] for category, props in FLAVOR_PROPERTIES.items()}
+
+SUMMARY_CREAM = "This is a very cream-heavy profile, suggesting a thick, dense vape."
+SUMMARY_FRUIT = "The profile is fruit-dominant, likely bright and sharp."
+SUMMARY_BALANCED = "A balanced mix with potential for complexity."
+WARNING_CREAM = "High total cream percentage may require a longer steep."
+WARNING_CLASH = "Potential clash: Menthol and Cream can sometimes curdle or separate perceptions."
+WARNING_HIGH = "High concentration of {name} ({pct}%) may lead to oversaturation or muting."
+HIGH_PCT = 8 # A single flavor above this gets a warning
+CREAM_HEAVY_PCT = 10
+CREAM_CATEGORIES = ('Cream', 'Custard')
+
+def load_vapesim_frame(recipe_ids=None):
+    """Every recipe's flavor rows joined to their stash categories, in one query.
+
+    Recipes without flavors appear as a single row with NULL flavor and percentage.
+    """
+    import pandas as pd
+
+    query = """
+        SELECT r.id AS recipe_id, r.name AS recipe_name, rf.flavor_name, rf.percentage, fs.category
+        FROM recipes r
+        LEFT JOIN recipe_flavors rf ON rf.recipe_id = r.id
+        LEFT JOIN flavor_stash fs ON fs.id = rf.flavor_id
+    """
+    params = ()
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        query += f" WHERE r.id IN ({', '.join('?' * len(recipe_ids))})"
+        params = tuple(recipe_ids)
+    query += " ORDER BY r.id, rf.id"
+    rows = run_query(query, params, fetch="all")
+    return pd.DataFrame(rows, columns=['recipe_id', 'recipe_name', 'flavor_name', 'percentage', 'category'])
+
+# --- Shared Formulas ---
+# Used by the single-recipe path, vapesim_batch and vapesim_scores alike, on
+# plain floats, numpy arrays or pandas Series.
+def _profile(total_pct, cream_pct, fruit_pct, sweetener_pct):
+    """Density, sweetness and steep-curve points from a recipe's category totals."""
+    import numpy as np
+
+    return {
+        'density': np.minimum(cream_pct * 5 + total_pct * 2, 100),
+        'sweetness': np.minimum(sweetener_pct * 5 + fruit_pct, 100), # Sweeteners are potent
+        'steep_day_1': 30 + fruit_pct,
+        'steep_day_7': 50 + total_pct * 1.5,
+        'steep_day_14': 75 + cream_pct,
+        'steep_day_30': 95.0,
+    }
+
+def _summary(cream_heavy, fruit_dominant):
+    if cream_heavy and fruit_dominant:
+        return f"{SUMMARY_CREAM} {SUMMARY_FRUIT}"
+    return SUMMARY_CREAM if cream_heavy else SUMMARY_FRUIT if fruit_dominant else SUMMARY_BALANCED
+
+def _warnings(high, cream_heavy, clash):
+    return high + ([WARNING_CREAM] if cream_heavy else []) + ([WARNING_CLASH] if clash else [])
+
+def vapesim_batch(frame):
+    """Vectorized VapeSim over (recipe_id, flavor_name, percentage, category) rows.
+
+    Returns one row per recipe, in first-seen order, with balance by note,
+    sweetness, density, summary, warnings and steep-curve points.
+    """
+    import pandas as pd
+
+    pct = frame['percentage'].astype(float).fillna(0.0)
+    category = frame['category']
+    note = category.map(NOTE_BY_CATEGORY).fillna(FLAVOR_PROPERTIES['Other']['note'])
+    parts = pd.DataFrame({
+        'recipe_id': frame['recipe_id'],
+        'total_pct': pct,
+        'cream_pct': pct.where(category.isin(CREAM_CATEGORIES), 0.0),
+        'fruit_pct': pct.where(category == 'Fruit', 0.0),
+        'sweetener': pct.where(category == 'Sweetener', 0.0),
+        'has_menthol': category == 'Menthol',
+        'has_cream': category == 'Cream',
+        **{n: pct.where(note == n, 0.0) for n in NOTES},
+    })
+    grouped = parts.groupby('recipe_id', sort=False)
+    result = grouped[['total_pct', 'cream_pct', 'fruit_pct', 'sweetener', *NOTES]].sum()
+    flags = grouped[['has_menthol', 'has_cream']].any()
+
+    if 'recipe_name' in frame:
+        result.insert(0, 'recipe_name', frame.groupby('recipe_id', sort=False)['recipe_name'].first())
+
+    cream_heavy = result['cream_pct'] > CREAM_HEAVY_PCT
+    fruit_dominant = result['fruit_pct'] > result['cream_pct']
+    clash = flags['has_menthol'] & flags['has_cream']
+    result['summary'] = [_summary(heavy, fruity) for heavy, fruity in zip(cream_heavy.tolist(), fruit_dominant.tolist())]
+
+    high = frame[pct > HIGH_PCT]
+    warnings_by_recipe = {}
+    for r_id, name, value in zip(high['recipe_id'].tolist(), high['flavor_name'].tolist(), high['percentage'].tolist()):
+        warnings_by_recipe.setdefault(r_id, []).append(WARNING_HIGH.format(name=name, pct=value))
+    result['warnings'] = [
+        _warnings(warnings_by_recipe.get(r_id, []), heavy, clashes)
+        for r_id, heavy, clashes in zip(result.index.tolist(), cream_heavy.tolist(), clash.tolist())
+    ]
+    result['warning_count'] = result['warnings'].map(len)
+
+    result = result.assign(**_profile(result['total_pct'], result['cream_pct'], result['fruit_pct'], result['sweetener']))
+    return result.drop(columns='sweetener').reset_index()
+
+def vapesim_scores(pct, codes):
+    """vapesim_batch's numeric metrics for a batch of recipes with the same number of flavors.
+
+    ``pct`` and ``codes`` are (recipes, flavors) arrays of percentages and
+    indexes into CATEGORIES. Returns a dict of per-recipe arrays: total_pct,
+    cream_pct, fruit_pct, one per note, sweetness, density and warning_count.
+    """
+    import numpy as np
+
+    def share(mask):
+        return np.where(mask, pct, 0.0).sum(axis=1)
+
+    def is_in(*names):
+        return np.isin(codes, [CATEGORIES.index(n) for n in names])
+
+    note_codes = np.array([NOTES.index(NOTE_BY_CATEGORY[c]) for c in CATEGORIES])[codes]
+    scores = {'total_pct': pct.sum(axis=1), 'cream_pct': share(is_in(*CREAM_CATEGORIES)), 'fruit_pct': share(is_in('Fruit'))}
+    scores.update({n: share(note_codes == i) for i, n in enumerate(NOTES)})
+    profile = _profile(scores['total_pct'], scores['cream_pct'], scores['fruit_pct'], share(is_in('Sweetener')))
+    scores['sweetness'], scores['density'] = profile['sweetness'], profile['density']
+    scores['warning_count'] = ((pct > HIGH_PCT).sum(axis=1) + (scores['cream_pct'] > CREAM_HEAVY_PCT)
+                               + (is_in('Menthol').any(axis=1) & is_in('Cream').any(axis=1)))
+    return scores
+
+# Leaderboard orderings over vapesim_batch output: label -> (column, ascending)
+LEADERBOARD_RANKINGS = {
+    "Sweetness": ('sweetness', False), "Density": ('density', False),
+    "Fewest Warnings": ('warning_count', True), "Total %": ('total_pct', False),
+}
+LEADERBOARD_COLUMNS = ['recipe_id', 'recipe_name', 'sweetness', 'density', 'total_pct', *NOTES, 'warning_count', 'summary']
+
+def analysis_from_row(row):
+    """Convert one vapesim_batch row to the report dict used by the UI."""
+    return {
+        "summary": row['summary'],
+        "balance": {n: float(row[n]) for n in NOTES},
+        "sweetness": float(row['sweetness']),
+        "density": float(row['density']),
+        "steep_curve": [{'Day': day, 'Flavor': float(row[f'steep_day_{day}'])} for day in STEEP_DAYS],
+        "warnings": list(row['warnings']),
+    }
+
+def vapesim_analyze(recipe_flavors, categories=None):
+    """Mocks an AI analysis of a recipe.
+
+    Same results as vapesim_batch, computed with plain floats: a frame costs
+    far more than the arithmetic for one recipe.
+    """
+    if categories is None:
+        categories = get_flavor_catalog().categories([f['flavor_name'] for f in recipe_flavors])
+    other_note = FLAVOR_PROPERTIES['Other']['note']
+    total = cream = fruit = sweetener = 0.0
+    balance = dict.fromkeys(NOTES, 0.0)
+    has_menthol = has_cream = False
+    high = []
+    for f, category in zip(recipe_flavors, categories):
+        pct = f['percentage']
+        pct = 0.0 if pct is None or pct != pct else float(pct) # NULL and NaN count as 0, as in vapesim_batch
+        total += pct
+        balance[NOTE_BY_CATEGORY.get(category, other_note)] += pct
+        if category in CREAM_CATEGORIES:
+            cream += pct
+        elif category == 'Fruit':
+            fruit += pct
+        elif category == 'Sweetener':
+            sweetener += pct
+        has_menthol |= category == 'Menthol'
+        has_cream |= category == 'Cream'
+        if pct > HIGH_PCT:
+            high.append(WARNING_HIGH.format(name=f['flavor_name'], pct=pct))
+    cream_heavy = cream > CREAM_HEAVY_PCT
+    profile = _profile(total, cream, fruit, sweetener)
+    return {
+        "summary": _summary(cream_heavy, fruit > cream),
+        "balance": balance,
+        "sweetness": float(profile['sweetness']),
+        "density": float(profile['density']),
+        "steep_curve": [{'Day': day, 'Flavor': float(profile[f'steep_day_{day}'])} for day in STEEP_DAYS],
+        "warnings": _warnings(high, cream_heavy, has_menthol and has_cream),
+    }
+
+
+# --- VapeSim Result Cache ---
+VAPESIM_VERSION = 1 # Bump when the analysis logic changes so persisted results are not reused
+
+class VapeSimCache:
+    """Content-addressed VapeSim results: an in-memory LRU in front of the vapesim_cache table.
+
+    Keys hash the recipe's (flavor, percentage, category) rows, so editing a
+    recipe or re-categorizing one of its flavors simply produces a new key.
+    """
+
+    def __init__(self, max_entries=1024, max_rows=20000, prune_every=200):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @staticmethod
+    def key(recipe_flavors, categories):
+        normalized = sorted(
+            (f['flavor_name'].strip(), round(float(f['percentage']), 4), category or '')
+            for f, category in zip(recipe_flavors, categories)
+        )
+        payload = json.dumps([VAPESIM_VERSION, normalized], separators=(',', ':'))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _remember(self, key, analysis):
+        with self._lock:
+            self._entries[key] = analysis
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is not None:
+                self._entries.move_to_end(key)
+                return analysis
+        row = run_query("SELECT result FROM vapesim_cache WHERE key=?", (key,), fetch="one", cache=False)
+        if row is None:
+            return None
+        analysis = json.loads(row[0])
+        self._remember(key, analysis)
+        return analysis
+
+    def put(self, key, analysis):
+        self._remember(key, analysis)
+        self._writes += 1
+        prune = self._writes % self.prune_every == 0
+        def store(conn):
+            conn.execute("INSERT OR REPLACE INTO vapesim_cache (key, result) VALUES (?, ?)", (key, json.dumps(analysis)))
+            if prune:
+                conn.execute("DELETE FROM vapesim_cache WHERE key NOT IN (SELECT key FROM vapesim_cache ORDER BY created_at DESC LIMIT ?)", (self.max_rows,))
+        # Nobody waits on this: the result is already in memory, and queued cache rows
+        # share the writer's next commit. vapesim_cache is bookkeeping, so its writes
+        # leave the query cache alone.
+        get_writer().submit(store, track_writes=False)
+
+@shared
+def get_vapesim_cache():
+    return VapeSimCache()
+
+def vapesim_analyze_cached(recipe_flavors):
+    """vapesim_analyze, served from VapeSimCache when the same recipe contents were seen before."""
+    categories = get_flavor_catalog().categories([f['flavor_name'] for f in recipe_flavors])
+    cache = get_vapesim_cache()
+    key = cache.key(recipe_flavors, categories)
+    analysis = cache.get(key)
+    if analysis is None:
+        analysis = vapesim_analyze(recipe_flavors, categories)
+        cache.put(key, analysis)
+    return analysis
@@ -2,13 +2,23 @@
 import streamlit as st
 import pandas as pd
 
+from mixlab.catalog import get_flavor_catalog
+from mixlab.db import run_query
+from mixlab.figures import synergy_figure
+from mixlab.quickmix import suggest_recipe
+from mixlab.recipes import diff_matrix, recipe_labels
+from mixlab.jobs import latest_result
+from mixlab.steep import fetch_steep_page
+from mixlab.synergy import cluster_by_category
+from mixlab.vapesim import LEADERBOARD_COLUMNS, load_vapesim_frame
+
 st.set_page_config(page_title="MixLab Dashboard", layout="wide", initial_sidebar_state="expanded")
 
 st.markdown("# MixLab Dashboard (Dark Mode)")
 st.sidebar.title("Navigation")
 menu = st.sidebar.radio("Go to:", ["Flavor Stash Manager", "Steep Timers", "Synergy Heatmap", "Recipe Diff Tool", "VapeSim AI", "Quick Mix Assistant"])
 
-# Simulated flavor stash from user's memory
+# Simulated flavor stash from user's memory, shown until the real stash has flavors
 flavor_stash = [
     "FA Custard Premium", "INW Custard", "TFA Bavarian Cream", "NicVape Bavarian Cream",
     "NicVape Vanilla Custard", "CAP French Vanilla", "CAP Sugar Cookie", "INW Biscuit",
@@ -21,25 +31,64 @@ flavor_stash = [
 
 if menu == "Flavor Stash Manager":
     st.subheader("Your Flavor Stash")
-    df = pd.DataFrame({"Flavor Name": flavor_stash})
+    stash = get_flavor_catalog().items()
+    if stash:
+        df = pd.DataFrame(stash, columns=["Flavor Name", "Category"])
+    else:
+        st.caption("Your stash is empty; showing a sample list. Import your own from the Flavor Stash page of the main app.")
+        df = pd.DataFrame({"Flavor Name": flavor_stash})
     st.dataframe(df)
 
 elif menu == "Steep Timers":
     st.subheader("Steep Timers")
-    st.info("Coming soon: add and track steep timers for each recipe.")
+    rows, total = fetch_steep_page("All", 0, 50)
+    if not total:
+        st.info("No recipes are steeping yet.")
+    else:
+        st.caption(f"Showing {len(rows)} of {total}")
+        st.dataframe(pd.DataFrame(rows, columns=["ID", "Name", "Steep Days", "Steep End", "Status"]), hide_index=True)
 
 elif menu == "Synergy Heatmap":
     st.subheader("Flavor Synergy Heatmap")
-    st.info("Coming soon: visualize pairwise flavor synergy scores.")
+    stash = get_flavor_catalog().items()
+    if len(stash) < 2:
+        st.info("Add at least two flavors to your stash to see synergy scores.")
+    else:
+        names, categories = cluster_by_category(stash)
+        st.plotly_chart(synergy_figure(names, categories, "Category aggregate"))
 
 elif menu == "Recipe Diff Tool":
     st.subheader("Recipe Diff Tool")
-    st.info("Coming soon: compare any two eLiquid recipes side by side.")
+    names_by_id = dict(run_query("SELECT id, name FROM recipes ORDER BY name", fetch="all"))
+    if len(names_by_id) < 2:
+        st.info("Save at least two recipes to compare them side by side.")
+    else:
+        a = st.selectbox("Recipe A", list(names_by_id), format_func=names_by_id.get)
+        b = st.selectbox("Recipe B", list(names_by_id), index=1, format_func=names_by_id.get)
+        if a != b:
+            matrix, deltas = diff_matrix(load_vapesim_frame([a, b]), [a, b], a)
+            labels = recipe_labels([a, b], names_by_id)
+            st.dataframe(matrix.rename(columns=labels).assign(Change=deltas[b]))
 
 elif menu == "VapeSim AI":
     st.subheader("VapeSim AI")
-    st.info("Coming soon: Predictive analysis of recipe performance, balance, and steep curve.")
+    # Library-wide scoring only runs as a background job; show its latest result
+    latest = latest_result('vapesim_library')
+    if latest is None:
+        st.info("Score your library from the VapeSim AI page of the main app to see the leaderboard here.")
+    else:
+        finished_at, result = latest
+        st.caption(f"Sweetest of {result['recipes']:,} recipes, scored {finished_at}.")
+        st.dataframe(pd.DataFrame(result['rankings']['Sweetness'], columns=LEADERBOARD_COLUMNS).drop(columns='recipe_id'), hide_index=True)
 
 elif menu == "Quick Mix Assistant":
     st.subheader("Quick Mix Assistant")
-    st.info("Coming soon: Enter a flavor or profile and get instant recipe suggestions.")
+    profile = st.text_input("Flavor or profile", placeholder="e.g., Creamy strawberry shortcake")
+    if profile:
+        flavors, steep_days = suggest_recipe(profile)
+        if not flavors:
+            st.info("No stash flavors match that profile yet.")
+        for flav in flavors:
+            st.write(f"- **{flav['name']}**: {flav['pct']}%")
+        if steep_days:
+            st.write(f"Suggested steep time: {steep_days} days")
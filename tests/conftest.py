@@ -0,0 +1,15 @@
+import pytest
+
+from mixlab.db import configure, get_writer
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """A freshly migrated database in a temp directory, configured as the process-wide one."""
+    pool = configure(str(tmp_path / "mixlab.db"))
+    yield pool
+    pool.close_all()
+
+@pytest.fixture
+def writer(pool):
+    return get_writer()
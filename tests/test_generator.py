@@ -0,0 +1,37 @@
+import pytest
+
+from benchmarks.generate import seed_database
+from mixlab import generator
+
+PROFILE = "strawberry cream with sweetener"
+
+
+@pytest.fixture
+def stash(pool):
+    seed_database(pool, 200, 0)
+
+def _picks(recipes):
+    return [([(f['name'], f['pct']) for f in r['flavors']], r['score']) for r in recipes]
+
+def test_same_seed_same_recipes(stash):
+    first, stats = generator.generate_recipes(PROFILE, n_candidates=4_000, seed=7, budget=30)
+    second, _ = generator.generate_recipes(PROFILE, n_candidates=4_000, seed=7, budget=30)
+    other, _ = generator.generate_recipes(PROFILE, n_candidates=4_000, seed=8, budget=30)
+
+    assert first and not stats['timed_out']
+    assert stats['drawn'] == 4_000
+    assert _picks(first) == _picks(second)
+    assert _picks(first) != _picks(other)
+
+def test_worker_count_does_not_change_results(stash, monkeypatch):
+    in_process, _ = generator.generate_recipes(PROFILE, n_candidates=4_000, seed=7, budget=30)
+
+    monkeypatch.setattr(generator, "SEARCH_WORKERS", 2)
+    monkeypatch.setattr(generator, "PARALLEL_MIN_CANDIDATES", 0)
+    try:
+        parallel, stats = generator.generate_recipes(PROFILE, n_candidates=4_000, seed=7, budget=60)
+    finally:
+        generator.get_search_executor().shutdown()
+
+    assert stats['workers'] == 2 and not stats['timed_out']
+    assert _picks(parallel) == _picks(in_process)
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from mixlab.db import MIGRATIONS, ConnectionPool, WriteQueue, init_db
+from mixlab.stash import apply_stash_changes
+
+
+def _schema(pool):
+    with pool.connection() as conn:
+        return conn.execute("SELECT type, name, sql FROM sqlite_master WHERE name != 'sqlite_sequence' ORDER BY name").fetchall()
+
+def _pool_at(path, version):
+    """A database migrated by hand up to ``version``, the way an older release left it."""
+    pool = ConnectionPool(str(path))
+    with pool.transaction() as c:
+        for target, migrate in enumerate(MIGRATIONS[:version], start=1):
+            migrate(c)
+            c.execute(f"PRAGMA user_version = {target}")
+    return pool
+
+def _add_library(pool):
+    # Only base-schema columns, so this works at every version
+    with pool.transaction() as c:
+        c.execute("INSERT INTO flavor_stash (name, brand, category) VALUES ('Strawberry', 'TFA', 'Fruit')")
+        recipe_id = c.execute("INSERT INTO recipes (name, notes) VALUES ('Berry Cream', 'test')").lastrowid
+        c.execute("INSERT INTO recipe_flavors (recipe_id, flavor_name, percentage) VALUES (?, 'strawberry', 5.0)", (recipe_id,))
+    return recipe_id
+
+@pytest.mark.parametrize("version", range(len(MIGRATIONS)))
+def test_upgrade_from_each_version(tmp_path, version):
+    fresh = ConnectionPool(str(tmp_path / "fresh.db"))
+    init_db(fresh)
+    pool = _pool_at(tmp_path / "old.db", version)
+    recipe_id = _add_library(pool) if version else None
+    init_db(pool)
+    if recipe_id is None:
+        recipe_id = _add_library(pool)
+
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    assert _schema(pool) == _schema(fresh)
+
+    # The upgraded triggers behave like fresh ones: a brand edit leaves recipes alone,
+    # a rename reaches them and bumps each one once
+    writer = WriteQueue(pool)
+    with pool.connection() as conn:
+        flavor_id, = conn.execute("SELECT flavor_id FROM recipe_flavors WHERE recipe_id=?", (recipe_id,)).fetchone()
+    assert flavor_id is not None
+    apply_stash_changes(writer, pd.DataFrame(columns=['Name', 'Brand', 'Category']),
+                        pd.DataFrame({'Name': ['Strawberry'], 'Brand': ['CAP'], 'Category': ['Fruit']}, index=[flavor_id]), [])
+    apply_stash_changes(writer, pd.DataFrame(columns=['Name', 'Brand', 'Category']),
+                        pd.DataFrame({'Name': ['Ripe Strawberry'], 'Brand': ['CAP'], 'Category': ['Fruit']}, index=[flavor_id]), [])
+    with pool.connection() as conn:
+        assert conn.execute("SELECT flavor_name FROM recipe_flavors WHERE recipe_id=?", (recipe_id,)).fetchone()[0] == 'Ripe Strawberry'
+        assert conn.execute("SELECT version FROM recipes WHERE id=?", (recipe_id,)).fetchone()[0] == 2
+    pool.close_all()
+    fresh.close_all()
+
+def test_init_db_is_idempotent(pool):
+    before = _schema(pool)
+    init_db(pool)
+    assert _schema(pool) == before
@@ -0,0 +1,38 @@
+import pytest
+
+from mixlab.db import StaleWriteError
+from mixlab.recipes import RecipeRepository, recipe_history
+
+FLAVORS = [{'name': 'Strawberry', 'percentage': 5.0}, {'name': 'Sweet Cream', 'percentage': 3.0}]
+
+
+def test_update_at_loaded_version(pool, writer):
+    repo = RecipeRepository(writer)
+    recipe_id = repo.create("Berry Cream", None, 7, None, FLAVORS)
+
+    repo.update(recipe_id, "Berry Cream", "smoother", 14, None, FLAVORS[:1], version=1)
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT notes, version FROM recipes WHERE id=?", (recipe_id,)).fetchone() == ('smoother', 2)
+        assert conn.execute("SELECT COUNT(*) FROM recipe_flavors WHERE recipe_id=?", (recipe_id,)).fetchone()[0] == 1
+
+def test_stale_update_is_rejected(pool, writer):
+    repo = RecipeRepository(writer)
+    recipe_id = repo.create("Berry Cream", None, 7, None, FLAVORS)
+    repo.update(recipe_id, "Berry Cream", "theirs", 7, None, FLAVORS, version=1)
+
+    with pytest.raises(StaleWriteError, match="changed by someone else"):
+        repo.update(recipe_id, "Berry Cream", "mine", 7, None, FLAVORS[:1], version=1)
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT notes, version FROM recipes WHERE id=?", (recipe_id,)).fetchone() == ('theirs', 2)
+        assert conn.execute("SELECT COUNT(*) FROM recipe_flavors WHERE recipe_id=?", (recipe_id,)).fetchone()[0] == 2
+    assert len(recipe_history(recipe_id)) == 2
+
+def test_update_of_deleted_recipe(pool, writer):
+    repo = RecipeRepository(writer)
+    recipe_id = repo.create("Berry Cream", None, 7, None, FLAVORS)
+    repo.delete(recipe_id)
+
+    with pytest.raises(StaleWriteError, match="deleted"):
+        repo.update(recipe_id, "Berry Cream", "mine", 7, None, FLAVORS, version=1)
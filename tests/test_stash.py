@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from mixlab.db import StaleWriteError
+from mixlab.recipes import RecipeRepository
+from mixlab.stash import STASH_COLUMNS, apply_stash_changes
+
+NO_ROWS = pd.DataFrame(columns=STASH_COLUMNS)
+
+
+def _add_flavors(pool, *rows):
+    with pool.transaction() as c:
+        return [c.execute("INSERT INTO flavor_stash (name, brand, category) VALUES (?, ?, ?)", row).lastrowid for row in rows]
+
+def _edits(rows):
+    """Stash updates indexed by id, as compute_stash_changes returns them."""
+    return pd.DataFrame([row[1:] for row in rows], columns=STASH_COLUMNS, index=[row[0] for row in rows])
+
+def _recipe_rows(pool, recipe_id):
+    with pool.connection() as conn:
+        version = conn.execute("SELECT version FROM recipes WHERE id=?", (recipe_id,)).fetchone()[0]
+        names = [row[0] for row in conn.execute("SELECT flavor_name FROM recipe_flavors WHERE recipe_id=? ORDER BY id", (recipe_id,))]
+    return version, names
+
+def test_rename_reaches_recipes(pool, writer):
+    straw, = _add_flavors(pool, ('Strawberry', 'TFA', 'Fruit'))
+    recipe_id = RecipeRepository(writer).create("Berry", None, 7, None, [{'name': 'strawberry', 'percentage': 5.0}])
+
+    apply_stash_changes(writer, NO_ROWS, _edits([(straw, 'Ripe Strawberry', 'TFA', 'Fruit')]), [], versions={straw: 1})
+
+    assert _recipe_rows(pool, recipe_id) == (2, ['Ripe Strawberry'])
+
+def test_brand_edit_leaves_recipes_alone(pool, writer):
+    straw, = _add_flavors(pool, ('Strawberry', 'TFA', 'Fruit'))
+    recipe_id = RecipeRepository(writer).create("Berry", None, 7, None, [{'name': 'strawberry', 'percentage': 5.0}])
+
+    apply_stash_changes(writer, NO_ROWS, _edits([(straw, 'Strawberry', 'CAP', 'Fruit')]), [], versions={straw: 1})
+
+    assert _recipe_rows(pool, recipe_id) == (1, ['strawberry'])
+    with pool.connection() as conn:
+        assert conn.execute("SELECT brand, version FROM flavor_stash WHERE id=?", (straw,)).fetchone() == ('CAP', 2)
+
+def test_swapped_names(pool, writer):
+    a, b = _add_flavors(pool, ('Lemon', 'TFA', 'Fruit'), ('Lime', 'TFA', 'Fruit'))
+    repo = RecipeRepository(writer)
+    lemon = repo.create("Lemon Only", None, 7, None, [{'name': 'Lemon', 'percentage': 4.0}])
+    both = repo.create("Citrus", None, 7, None, [{'name': 'Lemon', 'percentage': 4.0}, {'name': 'Lime', 'percentage': 2.0}])
+
+    apply_stash_changes(writer, NO_ROWS, _edits([(a, 'Lime', 'TFA', 'Fruit'), (b, 'Lemon', 'TFA', 'Fruit')]), [])
+
+    assert _recipe_rows(pool, lemon) == (2, ['Lime'])
+    # One bump per renamed flavor the recipe uses
+    assert _recipe_rows(pool, both) == (3, ['Lime', 'Lemon'])
+
+def test_stale_change_set_is_rejected_whole(pool, writer):
+    straw, mango = _add_flavors(pool, ('Strawberry', 'TFA', 'Fruit'), ('Mango', 'TFA', 'Fruit'))
+    # Someone else saves first
+    apply_stash_changes(writer, NO_ROWS, _edits([(straw, 'Strawberry', 'CAP', 'Fruit')]), [], versions={straw: 1})
+
+    with pytest.raises(StaleWriteError, match="Strawberry"):
+        apply_stash_changes(writer, pd.DataFrame([['Kiwi', 'FA', 'Fruit']], columns=STASH_COLUMNS),
+                            _edits([(straw, 'Strawberry', 'FW', 'Fruit')]), [mango], versions={straw: 1, mango: 1})
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT name, brand FROM flavor_stash ORDER BY id").fetchall() == [('Strawberry', 'CAP'), ('Mango', 'TFA')]
+
+def test_deleted_row_is_stale(pool, writer):
+    straw, = _add_flavors(pool, ('Strawberry', 'TFA', 'Fruit'))
+    apply_stash_changes(writer, NO_ROWS, NO_ROWS, [straw])
+
+    with pytest.raises(StaleWriteError, match="removed"):
+        apply_stash_changes(writer, NO_ROWS, _edits([(straw, 'Strawberry', 'CAP', 'Fruit')]), [], versions={straw: 1})
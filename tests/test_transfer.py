@@ -0,0 +1,85 @@
+import io
+import json
+
+import pytest
+
+from mixlab.transfer import RowReader, import_recipes, import_stash
+
+
+def _problems(report):
+    return [(e['Row'], e['Problem']) for e in report.errors]
+
+def test_stash_error_rows(pool):
+    rows = [
+        ["Strawberry", "TFA", "Fruit"],
+        {'name': '  ', 'category': 'Fruit'},
+        {'name': 'Mango', 'category': 'Candy'},
+        {'name': 'Lemon', 'brand': 'TFA', 'category': 'fruit'},
+        {'name': 'LEMON', 'category': 'Fruit'},
+    ]
+    report = import_stash(rows)
+
+    assert report.rows_read == 5
+    assert report.written == {'flavor_stash': 1}
+    assert report.skipped == 1
+    assert [row for row, _ in _problems(report)] == ['#1', '#2', '#3']
+    assert "Expected an object" in _problems(report)[0][1]
+    with pool.connection() as conn:
+        assert conn.execute("SELECT name, brand, category FROM flavor_stash").fetchall() == [('Lemon', 'TFA', 'Fruit')]
+
+def test_stash_duplicates_update(pool):
+    import_stash([{'name': 'Lemon', 'brand': 'TFA', 'category': 'Fruit'}])
+    report = import_stash([{'name': 'lemon', 'brand': 'CAP', 'category': 'Fruit'}], on_duplicate="update")
+
+    assert report.updated == 1
+    with pool.connection() as conn:
+        assert conn.execute("SELECT name, brand, version FROM flavor_stash").fetchall() == [('Lemon', 'CAP', 2)]
+
+def test_recipe_error_rows(pool):
+    rows = [
+        "Berry Cream",
+        {'name': 'Forever', 'steep_days': 'inf'},
+        {'name': 'Eternity', 'steep_days': '1e300'},
+        {'name': 'Backwards', 'steep_days': '-1'},
+        {'name': 'Loose', 'flavors': 'Strawberry 5%'},
+        {'name': 'Mixed', 'flavors': [3, {'flavor_name': 'Mango', 'percentage': '200'}, {'flavor_name': 'Kiwi', 'percentage': '2.5'}]},
+    ]
+    report = import_recipes(rows)
+
+    assert report.rows_read == 6
+    assert report.written == {'recipes': 2, 'recipe_flavors': 1}
+    problems = _problems(report)
+    assert [row for row, _ in problems] == ['#1', '#2', '#3', '#4', '#5', '#6', '#6']
+    assert "not a number" in problems[1][1]
+    assert "too large" in problems[2][1]
+    assert "must be a list" in problems[4][1]
+    assert "Expected a flavor object" in problems[5][1]
+    with pool.connection() as conn:
+        assert conn.execute("SELECT r.name, f.flavor_name FROM recipes r LEFT JOIN recipe_flavors f ON f.recipe_id = r.id ORDER BY r.id").fetchall() \
+            == [('Loose', None), ('Mixed', 'Kiwi')]
+
+def test_flavor_row_errors(pool):
+    recipes = [{'id': 'a', 'name': 'Berry'}]
+    flavors = [
+        {'recipe_id': 'a', 'flavor_name': 'Strawberry', 'percentage': 5},
+        ['a', 'Mango', 3],
+        {'recipe_id': 'zzz', 'flavor_name': 'Kiwi', 'percentage': 1},
+        {'recipe_id': 'a', 'flavor_name': 'strawberry', 'percentage': 4},
+    ]
+    report = import_recipes(recipes, flavors)
+
+    assert report.written == {'recipes': 1, 'recipe_flavors': 1}
+    assert report.skipped == 1
+    assert [row for row, _ in _problems(report)] == ['#2', '#3']
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_json_array_across_chunks(chunk_size):
+    records = [{'name': f"Flavor {i}", 'notes': "[x], {y}"} for i in range(50)]
+    data = json.dumps(records, indent=1).encode()
+    assert list(RowReader(io.BytesIO(data), 'json', chunk_size=chunk_size)) == records
+
+def test_json_array_malformed():
+    with pytest.raises(ValueError, match="cut off"):
+        list(RowReader(io.BytesIO(b'[{"name": "a"}, {"name": '), 'json', chunk_size=4))
+    with pytest.raises(ValueError, match="Expected a JSON array"):
+        list(RowReader(io.BytesIO(b'{"name": "a"}'), 'json'))